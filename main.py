@@ -3,26 +3,62 @@ Email Assistant Application
 Continuously monitors emails and responds only to whitelisted senders.
 """
 
+import argparse
+import asyncio
+import functools
+import heapq
 import time
 import logging
 import json
 from src.core.email_handler import EmailConfig, EmailHandler
 from src.core.email_monitor import EmailMonitor
+from src.core.pipeline import EmailPipeline, RoundRobinPipeline
+from src.core.work_queue import FETCHED, GENERATED, RECEIVED, WorkQueue
+from src.core.worker_pool import WorkerPool
+from src.core.metrics import EMAILS_QUEUED, REGISTRY, pipeline_collector, start_metrics_server
+from src.core.scheduler import AdaptivePollScheduler
+from src.core.whitelist import SenderWhitelist
 from src.ai.content_processor import ContentProcessor
-import re
 import os
 
 class EmailAssistant:
-    def __init__(self, config_path: str = "email_config.json"):
-        """Initialize the email assistant application."""
+    def __init__(self, config_path: str = "email_config.json", worker_processes: int = 0,
+                 whitelist_path: str = "whitelist_config.json", llm_config_path: str = None,
+                 business_config_path: str = None, config_defaults: dict = None):
+        """
+        Initialize the email assistant application.
+        
+        Args:
+            config_path: Path to the email configuration
+            worker_processes: Answer emails in this many worker processes; with 0 the
+                              pipeline threads run inside this process
+            whitelist_path: Path to the whitelist configuration
+            llm_config_path: LLM configuration (default: config/llm_config.json)
+            business_config_path: Business configuration (default: config/business_config.json)
+            config_defaults: Values for email configuration keys the file does not set
+        """
         try:
-            self.config = EmailConfig(config_path)
+            self.config = EmailConfig(config_path, defaults=config_defaults)
             self.monitor = EmailMonitor(self.config)
-            self.processor = ContentProcessor(self.config)
+            self.processor = ContentProcessor(self.config, llm_config_path, business_config_path)
             self.handler = EmailHandler(self.config)
+            self.work_queue = WorkQueue.from_config(self.config)
+            self.pipeline = EmailPipeline(
+                self.processor,
+                self.handler,
+                self.work_queue,
+                generation_workers=self.config.generation_workers,
+                send_workers=self.config.send_workers,
+                processed_store=self.monitor.processed
+            )
+            # This process only fetches; the workers share the queue and the processed store
+            self.worker_pool = WorkerPool(config_path, worker_processes) if worker_processes > 0 else None
+            # Chooses the time between checks when IMAP IDLE is unavailable
+            self.scheduler = AdaptivePollScheduler.from_config(self.config)
+            self.metrics_server = None
+            self._register_metrics()
             
             # Load whitelist configuration
-            whitelist_path = 'whitelist_config.json'
             if not os.path.exists(whitelist_path):
                 logging.warning(f"Whitelist configuration file not found at {whitelist_path}")
                 logging.info("Creating default whitelist configuration...")
@@ -31,82 +67,466 @@ class EmailAssistant:
                 }
                 with open(whitelist_path, 'w') as f:
                     json.dump(default_whitelist, f, indent=4)
-                self.allowed_senders = default_whitelist["allowed_senders"]
-            else:
-                with open(whitelist_path, 'r') as f:
-                    whitelist_config = json.load(f)
-                self.allowed_senders = whitelist_config.get('allowed_senders', [])
+            # Edits to the file are picked up while running
+            self.whitelist = SenderWhitelist(whitelist_path)
             
             logging.info("Email Assistant initialized successfully")
         except Exception as e:
             logging.error(f"Failed to initialize Email Assistant: {str(e)}")
             raise
 
-    def extract_email_address(self, from_field: str) -> str:
-        """Extract email address from the From field."""
-        # Try to match email pattern
-        match = re.search(r'[\w\.-]+@[\w\.-]+', from_field)
-        if match:
-            return match.group(0)
-        return from_field
+    def _register_metrics(self):
+        """Report queue sizes, polling, rate limits and cache use of this mailbox at every scrape."""
+        REGISTRY.add_collector(
+            f"assistant:{self.config.email_address}",
+            pipeline_collector(self.config.email_address, self.work_queue, self.handler, self.scheduler)
+        )
+        self.processor.register_metrics()
 
     def is_sender_allowed(self, from_field: str) -> bool:
         """Check if the sender is in the whitelist."""
-        email_address = self.extract_email_address(from_field)
-        return email_address in self.allowed_senders
+        return self.whitelist.is_allowed(from_field)
 
-    def process_emails(self):
-        """Process new emails and respond to allowed senders."""
+    def queue_new_emails(self) -> int:
+        """
+        Fetch new emails and queue a reply job for each allowed sender.
+        
+        Jobs are prioritized by the email's intent, so an emergency is answered
+        before routine questions fetched earlier. The sync checkpoint only moves
+        past the fetched emails once their jobs are safely on disk; if queueing
+        fails part way, the next check fetches the same emails again and the
+        queue ignores those it already holds.
+        
+        With worker processes, emails are queued unparsed and the workers parse
+        and classify them, leaving this process to IMAP alone.
+        
+        Returns:
+            Number of queued emails
+        """
+        defer_parsing = self.worker_pool is not None
+        new_emails = self.monitor.check_new_emails(commit=False, parse=not defer_parsing)
+        queued = 0
+        
+        for email_data in new_emails:
+            sender = email_data['from']
+            
+            if not self.is_sender_allowed(sender):
+                logging.info(f"Skipping email from non-whitelisted sender: {sender}")
+            elif defer_parsing:
+                logging.info(f"Queueing email from whitelisted sender: {sender}")
+                if self.pipeline.submit(email_data, state=RECEIVED):
+                    queued += 1
+            else:
+                # Recorded with the job, so generation does not classify the email again
+                intent = self.processor.primary_intent(email_data)
+                priority = self.config.intent_priority(intent)
+                logging.info(f"Processing {intent} email from whitelisted sender: {sender} (priority {priority})")
+                if self.pipeline.submit(email_data, priority=priority, intent=intent):
+                    EMAILS_QUEUED.inc(mailbox=self.config.email_address, intent=intent)
+                    queued += 1
+        
+        # Unparseable emails become failed jobs instead of disappearing behind the checkpoint
+        for email_data in self.monitor.failed_emails:
+            if not email_data['from'] or self.is_sender_allowed(email_data['from']):
+                self.work_queue.record_failed(email_data, email_data['error'])
+        
+        self.monitor.commit_checkpoint()
+        return queued
+
+    def process_emails(self) -> int:
+        """
+        Process new emails and queue responses to allowed senders.
+        
+        Returns:
+            Number of queued emails
+        """
         try:
-            new_emails = self.monitor.check_new_emails()
+            # Generation and sending run in the pipeline's worker pools
+            if self.worker_pool is not None:
+                self.worker_pool.start()
+            else:
+                self.pipeline.start()
+            return self.queue_new_emails()
             
-            for email_data in new_emails:
-                sender = email_data['from']
-                
-                if self.is_sender_allowed(sender):
-                    logging.info(f"Processing email from whitelisted sender: {sender}")
-                    
-                    # Generate response
-                    response = self.processor.generate_response(email_data)
-                    
-                    # Send response
-                    self.handler.send_response(
-                        to_address=sender,
-                        subject=f"Re: {email_data['subject']}",
-                        body=response
-                    )
-                    logging.info(f"Response sent to {sender}")
-                else:
-                    logging.info(f"Skipping email from non-whitelisted sender: {sender}")
-                    
         except Exception as e:
             logging.error(f"Error processing emails: {str(e)}")
+            raise
 
-    def run(self, check_interval: int = 60):
+    def run(self, check_interval: int = None):
         """
         Run the email assistant with specified check interval.
         
+        When the IMAP server advertises IDLE, new mail is pushed over a single
+        long-lived connection. Otherwise the mailbox is polled, more often while
+        mail is arriving and less often while it is idle. Failed checks are
+        retried with exponential backoff.
+        
         Args:
-            check_interval: Time in seconds between email checks (default: 60)
+            check_interval: Initial time in seconds between email checks (default: config.check_interval)
         """
-        logging.info(f"Starting Email Assistant (checking every {check_interval} seconds)")
-        logging.info(f"Whitelisted senders: {', '.join(self.allowed_senders)}")
+        if check_interval is not None:
+            self.scheduler = AdaptivePollScheduler.from_config(self.config, check_interval)
+            self._register_metrics()
+        self.metrics_server = start_metrics_server(self.config.metrics_host, self.config.metrics_port)
+        logging.info(f"Starting Email Assistant (checking every {self.scheduler.interval:.0f} seconds "
+                     f"when IDLE is unavailable)")
+        logging.info(f"Whitelisted senders: {self.whitelist.describe()}")
         
         while True:
             try:
-                self.process_emails()
-                time.sleep(check_interval)
+                queued = self.process_emails()
+                
+                # Wait for the server to push new mail, or poll if IDLE is unavailable
+                if self.monitor.supports_idle():
+                    self.scheduler.record_push()
+                    self.monitor.wait_for_new_mail()
+                else:
+                    delay = self.scheduler.record_check(queued)
+                    logging.info(f"Next email check in {delay:.0f}s ({self.scheduler.reason})")
+                    time.sleep(delay)
                 
             except KeyboardInterrupt:
                 logging.info("Shutting down Email Assistant...")
+                self.close()
                 break
                 
             except Exception as e:
                 logging.error(f"Error in main loop: {str(e)}")
-                logging.info("Waiting 60 seconds before retrying...")
-                time.sleep(60)
+                delay = self.scheduler.record_error(e)
+                logging.info(f"Waiting {delay:.0f} seconds before retrying...")
+                time.sleep(delay)
+
+    def close(self):
+        """Stop the workers and close all connections and stores."""
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        REGISTRY.remove_collector(f"assistant:{self.config.email_address}")
+        self.monitor.close()
+        self.pipeline.stop()
+        if self.worker_pool is not None:
+            self.worker_pool.stop()
+        self.handler.close()
+        self.monitor.processed.close()
+        self.work_queue.close()
+
+class AsyncEmailAssistant:
+    """
+    Asyncio runtime for the email assistant.
+    
+    LLM requests are coroutines on a single event loop, so hundreds can be in
+    flight without a thread each. IMAP and SMTP reuse the sync EmailMonitor and
+    EmailHandler through the loop's executor, one call at a time per mailbox.
+    
+    It serves the single mailbox of its email configuration; for several
+    mailboxes use MultiMailboxAssistant, which runs on worker threads.
+    """
+
+    def __init__(self, config_path: str = "email_config.json", max_in_flight: int = None,
+                 poll_interval: float = 1.0):
+        """
+        Initialize the async assistant.
+        
+        Args:
+            config_path: Path to the email configuration
+            max_in_flight: Maximum concurrent LLM requests (default: config.async_max_in_flight)
+            poll_interval: Seconds between looks at the work queue for jobs due for a retry
+        """
+        self.assistant = EmailAssistant(config_path)
+        self.max_in_flight = max_in_flight or self.assistant.config.async_max_in_flight
+        self.poll_interval = poll_interval
+        self._tasks = set()
+        self._generation_slots = None
+        self._work_available = None
+
+    def _ensure_loop_state(self):
+        """Create the semaphore and event on the running loop."""
+        if self._generation_slots is None:
+            self._generation_slots = asyncio.Semaphore(self.max_in_flight)
+            self._work_available = asyncio.Event()
+
+    async def _reply(self, job: dict):
+        """Generate (unless already done) and send the reply of one queued job."""
+        loop = asyncio.get_running_loop()
+        work_queue = self.assistant.work_queue
+        processed = self.assistant.monitor.processed
+        email_data = job['email']
+        sender = email_data['from']
+        holds_slot = True
+        try:
+            # Left unparsed by a run with worker processes
+            if job['state'] == RECEIVED:
+                if not await loop.run_in_executor(None, self.assistant.pipeline.parse, job, False):
+                    return
+                email_data = job['email']
+                sender = email_data['from']
+            if job['state'] == FETCHED:
+                try:
+                    # Give up before the lease expires, or another task would generate the reply again
+                    response = await asyncio.wait_for(
+                        self.assistant.processor.generate_response_async(email_data, job['intent']),
+                        work_queue.visibility_timeout * 0.9
+                    )
+                except asyncio.TimeoutError:
+                    raise TimeoutError("Generation did not finish within the job lease")
+                finally:
+                    self._generation_slots.release()
+                    holds_slot = False
+                # Keep the lease, this task sends the reply itself
+                if not await loop.run_in_executor(None, work_queue.save_response, job, response, False):
+                    # The lease expired and the job may have been claimed again; it is theirs now
+                    return
+            else:
+                self._generation_slots.release()
+                holds_slot = False
+            
+            if not await loop.run_in_executor(None, processed.is_processed, email_data):
+                await loop.run_in_executor(None, functools.partial(
+                    self.assistant.handler.send_response,
+                    to_address=sender,
+                    subject=f"Re: {email_data['subject']}",
+                    body=job['response']
+                ))
+                await loop.run_in_executor(None, processed.mark_processed, email_data)
+                logging.info(f"Response sent to {sender}")
+            await loop.run_in_executor(None, work_queue.mark_sent, job)
+        except Exception as e:
+            logging.error(f"Error replying to {sender}: {str(e)}")
+            await loop.run_in_executor(None, work_queue.fail, job, str(e))
+        finally:
+            if holds_slot:
+                self._generation_slots.release()
+
+    async def _dispatch(self):
+        """Start reply tasks for queued jobs while generation slots are free."""
+        loop = asyncio.get_running_loop()
+        self._ensure_loop_state()
+        assistant = self.assistant
+        while True:
+            await self._generation_slots.acquire()
+            # A claimed job is leased; while the rate limiters are backed up by more
+            # than half the lease, jobs stay in the queue instead of expiring in a task
+            backlog = max(assistant.processor.rate_limit_backlog(), assistant.handler.rate_limit_backlog())
+            if backlog > assistant.work_queue.visibility_timeout / 2:
+                logging.debug(f"Rate limiters backed up by {backlog:.0f}s, not claiming more jobs")
+                self._generation_slots.release()
+                return
+            job = await loop.run_in_executor(None, self.assistant.work_queue.claim,
+                                             (RECEIVED, FETCHED, GENERATED))
+            if job is None:
+                self._generation_slots.release()
+                return
+            task = asyncio.create_task(self._reply(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch_loop(self):
+        """Dispatch new jobs when emails are queued, and retries once they are due."""
+        self._ensure_loop_state()
+        while True:
+            try:
+                await self._dispatch()
+            except Exception as e:
+                logging.error(f"Error dispatching queued emails: {str(e)}")
+            try:
+                await asyncio.wait_for(self._work_available.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._work_available.clear()
+
+    async def process_emails(self) -> int:
+        """
+        Fetch new emails and queue a reply job for each allowed sender.
+        
+        Returns:
+            Number of queued emails
+        """
+        loop = asyncio.get_running_loop()
+        self._ensure_loop_state()
+        try:
+            queued = await loop.run_in_executor(None, self.assistant.queue_new_emails)
+            self._work_available.set()
+            return queued
+        except Exception as e:
+            logging.error(f"Error processing emails: {str(e)}")
+            raise
+
+    async def run(self, check_interval: int = None):
+        """
+        Run the assistant on the current event loop.
+        
+        Args:
+            check_interval: Initial time in seconds between email checks when IDLE is unavailable
+        """
+        loop = asyncio.get_running_loop()
+        monitor = self.assistant.monitor
+        if check_interval is not None:
+            self.assistant.scheduler = AdaptivePollScheduler.from_config(self.assistant.config, check_interval)
+            self.assistant._register_metrics()
+        scheduler = self.assistant.scheduler
+        config = self.assistant.config
+        metrics_server = start_metrics_server(config.metrics_host, config.metrics_port)
+        logging.info(f"Starting async Email Assistant (up to {self.max_in_flight} LLM requests in flight)")
+        # Also resumes jobs left in the queue by a previous run
+        dispatcher = asyncio.create_task(self._dispatch_loop())
+        
+        try:
+            while True:
+                try:
+                    queued = await self.process_emails()
+                    
+                    if await loop.run_in_executor(None, monitor.supports_idle):
+                        scheduler.record_push()
+                        await loop.run_in_executor(None, monitor.wait_for_new_mail)
+                    else:
+                        delay = scheduler.record_check(queued)
+                        logging.info(f"Next email check in {delay:.0f}s ({scheduler.reason})")
+                        await asyncio.sleep(delay)
+                        
+                except Exception as e:
+                    logging.error(f"Error in main loop: {str(e)}")
+                    delay = scheduler.record_error(e)
+                    logging.info(f"Waiting {delay:.0f} seconds before retrying...")
+                    await asyncio.sleep(delay)
+        finally:
+            dispatcher.cancel()
+            if metrics_server is not None:
+                metrics_server.stop()
+            if self._tasks:
+                logging.info(f"Waiting for {len(self._tasks)} pending replies...")
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            monitor.close()
+            self.assistant.handler.close()
+            monitor.processed.close()
+            self.assistant.work_queue.close()
+
+class MultiMailboxAssistant:
+    """
+    Serves several mailboxes from one process.
+    
+    Every mailbox has its own email, whitelist, business and LLM configuration
+    and its own job queue. One set of pipeline threads works through the queues
+    in turn, and LLM clients, the response cache and knowledge indexes are
+    shared by all mailboxes with the same settings.
+    """
+
+    def __init__(self, config_path: str = "mailboxes_config.json"):
+        """
+        Initialize the assistants of all configured mailboxes.
+        
+        Args:
+            config_path: Path to the mailbox list
+        """
+        try:
+            with open(config_path, 'r') as f:
+                settings = json.load(f)
+            mailboxes = settings.get("mailboxes", [])
+            if not mailboxes:
+                raise ValueError(f"No mailboxes configured in {config_path}")
+            
+            self.assistants = {}
+            for mailbox in mailboxes:
+                name = mailbox["name"]
+                if name in self.assistants:
+                    raise ValueError(f"Duplicate mailbox name: {name}")
+                # Checkpoints, queues and answered messages must never mix between mailboxes
+                state_dir = mailbox.get("state_dir", os.path.join("config", "mailboxes", name))
+                self.assistants[name] = EmailAssistant(
+                    mailbox["email_config"],
+                    whitelist_path=mailbox.get("whitelist_config", "whitelist_config.json"),
+                    llm_config_path=mailbox.get("llm_config"),
+                    business_config_path=mailbox.get("business_config"),
+                    config_defaults={
+                        # Polling settings of the list apply unless the mailbox sets its own
+                        **{key: value for key, value in settings.items() if key.startswith(("check_", "poll_"))},
+                        "sync_checkpoint_path": os.path.join(state_dir, "sync_checkpoint.json"),
+                        "processed_store_path": os.path.join(state_dir, "processed_messages.db"),
+                        "work_queue_path": os.path.join(state_dir, "work_queue.db")
+                    }
+                )
+            
+            self.pipeline = RoundRobinPipeline(
+                [assistant.pipeline for assistant in self.assistants.values()],
+                generation_workers=settings.get("generation_workers", 4),
+                send_workers=settings.get("send_workers", 2)
+            )
+            # One endpoint for all mailboxes; their metrics are told apart by the mailbox label
+            self.metrics_host = settings.get("metrics_host", "127.0.0.1")
+            self.metrics_port = settings.get("metrics_port", 9108)
+            self.metrics_server = None
+            logging.info(f"Multi-mailbox assistant initialized with {len(self.assistants)} mailboxes")
+        except Exception as e:
+            logging.error(f"Failed to initialize mailboxes: {str(e)}")
+            raise
+
+    def poll_mailbox(self, name: str) -> float:
+        """
+        Fetch and queue new emails of one mailbox.
+        
+        Returns:
+            Seconds until the mailbox should be checked again, chosen by its scheduler
+        """
+        assistant = self.assistants[name]
+        try:
+            queued = assistant.queue_new_emails()
+        except Exception as e:
+            logging.error(f"Error checking mailbox {name}: {str(e)}")
+            delay = assistant.scheduler.record_error(e)
+        else:
+            if queued:
+                self.pipeline.notify()
+                logging.info(f"Queued {queued} emails for {name}")
+            delay = assistant.scheduler.record_check(queued)
+        logging.info(f"{name}: next check in {delay:.0f}s ({assistant.scheduler.reason})")
+        return delay
+
+    def run(self):
+        """Poll the mailboxes in turn and answer their emails until interrupted."""
+        logging.info(f"Starting Email Assistant for {len(self.assistants)} mailboxes")
+        for name, assistant in self.assistants.items():
+            logging.info(f"{name}: whitelisted senders: {assistant.whitelist.describe()}")
+        self.metrics_server = start_metrics_server(self.metrics_host, self.metrics_port)
+        # Also resumes jobs left in the queues by a previous run
+        self.pipeline.start()
+        
+        # Mailboxes are polled in order of due time, so a slow server delays
+        # the others by at most one poll; each mailbox adapts its own interval
+        schedule = [(0.0, index, name) for index, name in enumerate(self.assistants)]
+        while True:
+            try:
+                due_at, index, name = schedule[0]
+                wait = due_at - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                    continue
+                
+                delay = self.poll_mailbox(name)
+                heapq.heapreplace(schedule, (time.monotonic() + delay, index, name))
+                
+            except KeyboardInterrupt:
+                logging.info("Shutting down Email Assistant...")
+                self.close()
+                break
+
+    def close(self):
+        """Stop the shared workers, then close every mailbox."""
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        self.pipeline.stop()
+        for assistant in self.assistants.values():
+            assistant.close()
 
 def main():
+    parser = argparse.ArgumentParser(description="Email Assistant")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="Use the asyncio runtime instead of worker threads (single mailbox)")
+    parser.add_argument('--workers', type=int, default=0, metavar='N',
+                        help="Answer emails in N worker processes fed by this fetcher process")
+    parser.add_argument('--mailboxes', metavar='PATH',
+                        help="Serve all mailboxes listed in this file from one process")
+    args = parser.parse_args()
+    if sum([args.use_async, args.workers > 0, args.mailboxes is not None]) > 1:
+        parser.error("--async, --workers and --mailboxes cannot be combined")
+    
     # Configure logging
     logging.basicConfig(
         level=logging.INFO,
@@ -118,8 +538,15 @@ def main():
     )
     
     try:
-        assistant = EmailAssistant()
-        assistant.run()
+        if args.use_async:
+            asyncio.run(AsyncEmailAssistant().run())
+        elif args.mailboxes:
+            MultiMailboxAssistant(args.mailboxes).run()
+        else:
+            assistant = EmailAssistant(worker_processes=args.workers)
+            assistant.run()
+    except KeyboardInterrupt:
+        logging.info("Shutting down Email Assistant...")
     except Exception as e:
         logging.critical(f"Application failed to start: {str(e)}")
         exit(1)
@@ -3,42 +3,260 @@ Enhanced content processor module with business knowledge base integration.
 """
 
 from src.core.email_handler import EmailConfig
+from src.core.email_parser import EmailParser
+from src.core.metrics import (INTENT_SECONDS, LLM_REQUEST_SECONDS, LLM_TOKENS, PROMPT_TOKENS, REGISTRY,
+                              llm_rate_limit_collector, response_cache_collector)
+from src.core.rate_limit import LLMRateLimiter
+from src.ai.llm_client import LLMHttpClient, StreamBudget, iter_sse_content
+from src.ai.response_cache import ResponseCache
+from src.ai.intent_classifier import IntentClassifier
+from src.ai.knowledge_index import KnowledgeIndex, chunk_business_config
 import openai
+import asyncio
 import logging
-from typing import Dict, List, Union
+from typing import Dict, List, Optional, Tuple, Union
 import json
-import requests
+import hashlib
 import os
+import threading
+import time
+import weakref
+
+# Conventional signature delimiter; everything after it is dropped when streaming
+DEFAULT_STOP_MARKERS = ["\n-- \n"]
+# Stop reasons of a streamed reply that was cut off, which is never cached
+BUDGET_CUTOFFS = ('max_tokens', 'max_seconds')
 
 class ContentProcessor:
-    def __init__(self, config: EmailConfig):
-        """Initialize the content processor."""
+    llm_config_path = 'config/llm_config.json'
+    business_config_path = 'config/business_config.json'
+
+    # Backend clients, created on first use and kept for connection reuse
+    _http_client = None
+    _openai_client = None
+    _async_client = None
+    _rate_limiter = None
+
+    # Prompt caches, rebuilt when a config file changes on disk
+    _config_signature = None
+    _system_prompt_cache = None
+    _intent_context_cache = None
+    _prompt_version_cache = None
+    _response_cache = None
+    _intent_classifier = None
+    _knowledge_index = None
+    # Per-thread statistics of the last streamed generation
+    _generation_stats = threading.local()
+    _cache_lock = threading.RLock()
+    # Clients, caches and indexes shared by all processors with the same settings,
+    # e.g. the mailboxes of a multi-mailbox runtime; entries go away with their last user
+    _shared_resources = weakref.WeakValueDictionary()
+
+    def __init__(self, config: EmailConfig, llm_config_path: Optional[str] = None,
+                 business_config_path: Optional[str] = None, rate_limit_share: float = 1.0):
+        """
+        Initialize the content processor.
+        
+        Args:
+            config: Email configuration of the mailbox
+            llm_config_path: LLM configuration to use instead of config/llm_config.json
+            business_config_path: Business configuration to use instead of config/business_config.json
+            rate_limit_share: Fraction of the "rate_limit" this process may use, e.g. 1/N
+                              for each of N worker processes sending to the same backend
+        """
         self.config = config
+        self.rate_limit_share = rate_limit_share
+        if llm_config_path:
+            self.llm_config_path = llm_config_path
+        if business_config_path:
+            self.business_config_path = business_config_path
         openai.api_key = config.openai_api_key
         
-        business_config_path = 'config/business_config.json'
-        
-        # Load LLM configuration
+        self._config_signature = self._get_config_signature()
+        self.llm_config = self._load_llm_config()
+        self.business_info = self._load_business_config()
+
+    def _load_llm_config(self) -> Dict:
+        """Load LLM configuration."""
         try:
-            with open('config/llm_config.json', 'r') as f:
-                self.llm_config = json.load(f)
+            with open(self.llm_config_path, 'r') as f:
+                return json.load(f)
         except Exception as e:
             logging.error(f"Error loading LLM configuration: {str(e)}")
             raise
 
-        # Load business configuration
+    def _load_business_config(self) -> Dict:
+        """Load business configuration."""
         try:
-            if not os.path.exists(business_config_path):
-                logging.error(f"Business configuration file not found: {business_config_path}")
-                raise FileNotFoundError(f"Business configuration file not found: {business_config_path}")
+            if not os.path.exists(self.business_config_path):
+                logging.error(f"Business configuration file not found: {self.business_config_path}")
+                raise FileNotFoundError(f"Business configuration file not found: {self.business_config_path}")
                 
-            with open(business_config_path, 'r') as f:
-                self.business_info = json.load(f)
+            with open(self.business_config_path, 'r') as f:
+                business_info = json.load(f)
             logging.info("Business configuration loaded successfully")
+            return business_info
         except Exception as e:
             logging.error(f"Error loading business configuration: {str(e)}")
             raise
 
+    def _get_config_signature(self) -> tuple:
+        """Return (mtime, size) of both config files, used to detect edits."""
+        signature = []
+        for path in (self.llm_config_path, self.business_config_path):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _refresh_if_changed(self):
+        """Reload the configs and drop cached prompts when a config file changed."""
+        signature = self._get_config_signature()
+        with self._cache_lock:
+            if self._config_signature is None:
+                # Configs were loaded without recording a signature, trust them
+                self._config_signature = signature
+                return
+            if signature == self._config_signature:
+                return
+
+            try:
+                llm_config = self._load_llm_config()
+                business_info = self._load_business_config()
+            except Exception:
+                # Keep serving the previous configuration, e.g. while a file is half-written
+                logging.warning("Config files changed but could not be reloaded, keeping cached prompts")
+                return
+
+            self.llm_config = llm_config
+            self.business_info = business_info
+            self._config_signature = signature
+            self._system_prompt_cache = None
+            self._intent_context_cache = None
+            self._intent_classifier = None
+            self._knowledge_index = None
+            # Cached responses are keyed on this version, so they stop matching
+            self._prompt_version_cache = None
+            # Timeouts, retries or endpoints may have changed; in-flight requests
+            # keep the old clients until they finish
+            self._http_client = None
+            self._openai_client = None
+            self._async_client = None
+            self._rate_limiter = None
+            logging.info("Configuration changed on disk, prompt cache invalidated")
+
+    @classmethod
+    def _shared(cls, kind: str, settings, factory):
+        """
+        Return the shared resource of this kind for these settings, creating it on first use.
+        
+        Args:
+            kind: Resource type, e.g. "http_client"
+            settings: JSON-serializable values the resource is built from
+            factory: Builds the resource when no processor holds one yet
+        """
+        key = (kind, json.dumps(settings, sort_keys=True, default=str))
+        with cls._cache_lock:
+            resource = cls._shared_resources.get(key)
+            if resource is None:
+                resource = factory()
+                cls._shared_resources[key] = resource
+        return resource
+
+    def _get_system_prompt(self) -> str:
+        """Return the system prompt with business knowledge, built once per config version."""
+        prompt = self._system_prompt_cache
+        if prompt is None:
+            # Built under the lock so a reload cannot be overwritten with a prompt of the old config
+            with self._cache_lock:
+                prompt = self._system_prompt_cache
+                if prompt is None:
+                    base_prompt = self.llm_config.get("system_prompt", "")
+                    if self._get_retrieval_settings():
+                        prompt = self._compact_system_prompt(base_prompt)
+                    else:
+                        prompt = self._enhance_system_prompt(base_prompt)
+                    self._system_prompt_cache = prompt
+        return prompt
+
+    def _get_retrieval_settings(self) -> Optional[Dict]:
+        """Return the "retrieval" section of llm_config.json if retrieval is enabled."""
+        settings = self.llm_config.get("retrieval", {})
+        return settings if settings.get("enabled", False) else None
+
+    def _always_included_keys(self) -> List[str]:
+        settings = self._get_retrieval_settings() or {}
+        return settings.get("always_include", ["name", "contact", "specializations"])
+
+    def _compact_system_prompt(self, base_prompt: str) -> str:
+        """System prompt with only the always-included business facts; the rest is retrieved per email."""
+        facts = []
+        for key in self._always_included_keys():
+            value = self.business_info.get(key)
+            if isinstance(value, dict):
+                value = ', '.join(f"{name}: {item}" for name, item in value.items())
+            elif isinstance(value, list):
+                value = ', '.join(str(item) for item in value)
+            if value:
+                facts.append(f"{key.replace('_', ' ').title()}: {value}")
+        
+        business_context = "\n".join(facts)
+        business_context += ("\n\nEach email comes with the business information relevant to it. "
+                             "Please use it to provide accurate responses about our services and policies.")
+        return base_prompt + "\n" + business_context
+
+    def _get_knowledge_index(self) -> KnowledgeIndex:
+        """Return the BM25 index over the business config, built once per config version."""
+        index = self._knowledge_index
+        if index is None:
+            with self._cache_lock:
+                index = self._knowledge_index
+                if index is None:
+                    settings = self._get_retrieval_settings() or {}
+                    exclude = self._always_included_keys()
+
+                    def build():
+                        chunks = chunk_business_config(
+                            self.business_info,
+                            exclude=exclude,
+                            max_words=settings.get("max_chunk_words", 120)
+                        )
+                        return KnowledgeIndex(chunks, k1=settings.get("k1", 1.5), b=settings.get("b", 0.75))
+
+                    index = self._shared("knowledge_index", [self.business_info, settings, exclude], build)
+                    self._knowledge_index = index
+        return index
+
+    def _retrieve_context(self, email_content: Dict) -> str:
+        """Return the knowledge chunks most relevant to the email, within the token budget."""
+        settings = self._get_retrieval_settings()
+        chunks = self._get_knowledge_index().search(
+            f"{email_content['subject']}\n{email_content['body']}",
+            top_k=settings.get("top_k", 5),
+            max_tokens=settings.get("max_tokens", 400)
+        )
+        logging.info(f"Retrieved {len(chunks)} knowledge chunks for '{email_content['subject']}'")
+        if not chunks:
+            return ""
+        return "Relevant business information:\n" + "\n".join(f"- {chunk['text']}" for chunk in chunks)
+
+    def _get_intent_context(self, intent: str) -> str:
+        """Return the context block for an intent, built once per config version."""
+        cache = self._intent_context_cache
+        context = cache.get(intent) if cache is not None else None
+        if context is None:
+            with self._cache_lock:
+                if self._intent_context_cache is None:
+                    self._intent_context_cache = {}
+                cache = self._intent_context_cache
+                context = cache.get(intent)
+                if context is None:
+                    context = self._create_context_for_intent(intent)
+                    cache[intent] = context
+        return context
+
     def _enhance_system_prompt(self, base_prompt: str) -> str:
         """Enhance the system prompt with business knowledge."""
         # First check if services exist and have the expected structure
@@ -103,24 +321,34 @@ class ContentProcessor:
         return '\n'.join([f"- {key.replace('_', ' ').title()}: {value}" 
                          for key, value in policies.items()])
 
+    def _get_intent_classifier(self) -> IntentClassifier:
+        """Return the classifier for the "intent_classifier" section of llm_config.json."""
+        classifier = self._intent_classifier
+        if classifier is None:
+            with self._cache_lock:
+                classifier = self._intent_classifier
+                if classifier is None:
+                    settings = self.llm_config.get("intent_classifier", {})
+                    classifier = self._shared("intent_classifier", settings, lambda: IntentClassifier(
+                        keywords=settings.get("keywords"),
+                        subject_weight=settings.get("subject_weight", 2.0)
+                    ))
+                    self._intent_classifier = classifier
+        return classifier
+
+    def classify_intents(self, email_content: Dict) -> List[Tuple[str, float]]:
+        """Return all matching intents with their scores, highest first."""
+        return self._get_intent_classifier().classify(email_content['subject'], email_content['body'])
+
+    def primary_intent(self, email_content: Dict) -> str:
+        """Return the email's main intent, 'general' if none matches."""
+        self._refresh_if_changed()
+        return self._categorize_email_intent(email_content)
+
     def _categorize_email_intent(self, email_content: Dict) -> str:
         """Categorize the main intent of the email for targeted response."""
-        subject = email_content['subject'].lower()
-        body = email_content['body'].lower()
-        
-        keywords = {
-            'appointment': ['appointment', 'booking', 'schedule', 'visit', 'termin'],
-            'services': ['treatment', 'service', 'procedure', 'therapy', 'behandlung'],
-            'costs': ['cost', 'price', 'fee', 'insurance', 'payment', 'kosten'],
-            'information': ['information', 'details', 'question', 'inquiry', 'info'],
-            'emergency': ['emergency', 'urgent', 'immediate', 'notfall']
-        }
-        
-        for intent, words in keywords.items():
-            if any(word in subject or word in body for word in words):
-                return intent
-                
-        return 'general'
+        with INTENT_SECONDS.time():
+            return self._get_intent_classifier().primary_intent(email_content['subject'], email_content['body'])
 
     def _create_context_for_intent(self, intent: str) -> str:
         """Create relevant context based on email intent."""
@@ -157,18 +385,23 @@ class ContentProcessor:
         }
         return contexts.get(intent, "")
 
-    def generate_response_local(self, email_content: Dict) -> str:
-        """Generate response using local LLama model with business knowledge."""
-        try:
-            # Enhance system prompt with business knowledge
-            system_prompt = self._enhance_system_prompt(self.llm_config.get("system_prompt", ""))
-            
-            # Determine email intent and add relevant context
-            intent = self._categorize_email_intent(email_content)
-            additional_context = self._create_context_for_intent(intent)
-            
-            # Create user prompt with context
-            user_prompt = f"""
+    def _build_messages(self, email_content: Dict, intent: Optional[str] = None) -> List[Dict]:
+        """Build the chat messages (system prompt plus email with intent or retrieved context)."""
+        self._refresh_if_changed()
+        
+        # Enhance system prompt with business knowledge
+        system_prompt = self._get_system_prompt()
+        
+        # Add the retrieved knowledge, or the context for the email's intent
+        if self._get_retrieval_settings():
+            additional_context = self._retrieve_context(email_content)
+        else:
+            if intent is None:
+                intent = self._categorize_email_intent(email_content)
+            additional_context = self._get_intent_context(intent)
+        
+        # Create user prompt with context
+        user_prompt = f"""
             Please respond to this email with the following context:
             {additional_context}
             
@@ -178,76 +411,415 @@ class ContentProcessor:
             Content:
             {email_content['body']}
             """
-            
+        
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    def _get_max_tokens(self) -> int:
+        """Completion length cap applied to every backend."""
+        return self.llm_config.get("max_tokens", 500)
+
+    def _get_streaming_settings(self) -> Optional[Dict]:
+        """Return the "streaming" section of llm_config.json if streaming is enabled."""
+        settings = self.llm_config.get("streaming", {})
+        return settings if settings.get("enabled", False) else None
+
+    def _new_stream_budget(self, settings: Dict) -> StreamBudget:
+        """Create the token/time budget for one streamed generation."""
+        return StreamBudget(
+            max_tokens=settings.get("max_tokens", self._get_max_tokens()),
+            max_seconds=settings.get("max_seconds", 60),
+            stop_markers=settings.get("stop_markers", DEFAULT_STOP_MARKERS)
+        )
+
+    def _finish_stream(self, budget: StreamBudget) -> str:
+        """Record and log the statistics of a streamed generation."""
+        stats = budget.stats()
+        self._generation_stats.last = stats
+        LLM_TOKENS.inc(stats['tokens'], kind='completion')
+        ttft = stats['time_to_first_token']
+        logging.info(f"Streamed {stats['tokens']} tokens in {stats['duration']:.1f}s "
+                     f"(time to first token {ttft if ttft is None else round(ttft, 2)}s, "
+                     f"stopped by {stats['stop_reason']})")
+        return budget.text
+
+    def _get_rate_limiter(self) -> Optional[LLMRateLimiter]:
+        """Return the limiter for the "rate_limit" section of llm_config.json, or None if unlimited."""
+        limiter = self._rate_limiter
+        if limiter is None:
+            settings = self.llm_config.get("rate_limit", {})
+            if not (settings.get("requests_per_minute") or settings.get("tokens_per_minute")):
+                return None
+            if self.rate_limit_share != 1:
+                settings = {key: settings.get(key, 0) * self.rate_limit_share
+                            for key in ("requests_per_minute", "tokens_per_minute")}
+            # Limits apply per account or server, so every processor using the same backend shares them
+            if self.llm_config.get("model_type", "local") == "local":
+                backend = self.llm_config['local_model']['base_url']
+            else:
+                backend = self.config.openai_api_key
+            limiter = self._shared("llm_rate_limiter", [settings, backend],
+                                   lambda: LLMRateLimiter.from_settings(settings))
+            self._rate_limiter = limiter
+        return limiter
+
+    def _estimate_prompt_tokens(self, messages: List[Dict]) -> int:
+        """Estimate the prompt size in tokens, recording it in the metrics."""
+        tokens = sum(EmailParser.estimate_tokens(message['content']) for message in messages)
+        PROMPT_TOKENS.observe(tokens)
+        return tokens
+
+    def _wait_for_rate_limit(self, messages: List[Dict]) -> float:
+        """
+        Block until the request may be sent without exceeding the configured limits.
+        
+        A request counts its prompt plus the largest possible completion.
+        
+        Returns:
+            perf_counter() time the request starts at, for its latency metric
+        """
+        tokens = self._estimate_prompt_tokens(messages) + self._get_max_tokens()
+        limiter = self._get_rate_limiter()
+        if limiter:
+            limiter.acquire(tokens)
+        return time.perf_counter()
+
+    async def _wait_for_rate_limit_async(self, messages: List[Dict]) -> float:
+        """Wait, without blocking the event loop, until the request may be sent."""
+        tokens = self._estimate_prompt_tokens(messages) + self._get_max_tokens()
+        limiter = self._get_rate_limiter()
+        if limiter:
+            await limiter.acquire_async(tokens)
+        return time.perf_counter()
+
+    def _record_llm_request(self, started: Optional[float], outcome: str, usage=None):
+        """Record the latency of a request and the tokens the backend reported for it."""
+        if started is None:
+            # Failed before the request was sent
+            return
+        LLM_REQUEST_SECONDS.observe(time.perf_counter() - started,
+                                    backend=self.llm_config.get("model_type", "local"), outcome=outcome)
+        if usage:
+            # A dict from the HTTP client, an object from the OpenAI SDK
+            get = usage.get if isinstance(usage, dict) else lambda key: getattr(usage, key, None)
+            for kind in ('prompt', 'completion'):
+                if get(f'{kind}_tokens'):
+                    LLM_TOKENS.inc(get(f'{kind}_tokens'), kind=kind)
+
+    def rate_limit_backlog(self) -> float:
+        """Seconds a new LLM request would wait for the rate limiter."""
+        limiter = self._get_rate_limiter()
+        return limiter.backlog() if limiter else 0.0
+
+    def rate_limit_stats(self) -> Optional[Dict]:
+        """State of the LLM rate limiter, or None when no limits are configured."""
+        limiter = self._get_rate_limiter()
+        return limiter.snapshot() if limiter else None
+
+    def register_metrics(self):
+        """
+        Report the LLM rate limiter and the response cache at every scrape.
+        
+        Both may be shared by several mailboxes, so the collectors are keyed by
+        backend and cache file; registering them again from another mailbox
+        replaces them instead of counting the same values twice.
+        """
+        if self.llm_config.get("model_type", "local") == "local":
+            backend = self.llm_config['local_model']['base_url']
+        else:
+            backend = "openai"
+        REGISTRY.add_collector(f"llm_rate_limit:{backend}",
+                               llm_rate_limit_collector(self.rate_limit_stats, backend))
+        cache = self._get_response_cache()
+        if cache is not None:
+            REGISTRY.add_collector(f"response_cache:{cache.path}",
+                                   response_cache_collector(self.cache_stats, cache.path))
+
+    def last_generation_stats(self) -> Optional[Dict]:
+        """Statistics of the last streamed generation on the calling thread."""
+        return getattr(self._generation_stats, 'last', None)
+
+    def generate_response_local(self, email_content: Dict, intent: Optional[str] = None) -> str:
+        """Generate response using local LLama model with business knowledge."""
+        started = None
+        try:
             # Prepare the request
             url = f"{self.llm_config['local_model']['base_url']}/chat/completions"
             headers = {"Content-Type": "application/json"}
+            messages = self._build_messages(email_content, intent)
+            started = self._wait_for_rate_limit(messages)
             data = {
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
+                "messages": messages,
                 "temperature": 0.7,
-                "model": self.llm_config['local_model']['model']
+                "model": self.llm_config['local_model']['model'],
+                "max_tokens": self._get_max_tokens()
             }
             
-            # Make the request
-            response = requests.post(url, headers=headers, json=data)
-            response.raise_for_status()
+            streaming = self._get_streaming_settings()
+            if streaming:
+                # Read the SSE stream incrementally and stop once the budget is spent
+                data["stream"] = True
+                budget = self._new_stream_budget(streaming)
+                response = self._get_http_client().post(url, data, headers=headers, stream=True)
+                try:
+                    for delta in iter_sse_content(response):
+                        if budget.feed(delta):
+                            break
+                finally:
+                    # Closing the connection early makes the server stop generating
+                    response.close()
+                generated_text = self._finish_stream(budget)
+                self._record_llm_request(started, 'ok')
+                return generated_text
+            
+            # Make the request over the pooled session, with timeouts and retries
+            result = self._get_http_client().post_json(url, data, headers=headers)
             
             # Extract and format the response
-            result = response.json()
             generated_text = result['choices'][0]['message']['content'].strip()
+            self._record_llm_request(started, 'ok', result.get('usage'))
             
             return generated_text
             
         except Exception as e:
+            self._record_llm_request(started, 'error')
             logging.error(f"Error generating response from local model: {str(e)}")
             raise
 
-    def generate_response_openai(self, email_content: Dict) -> str:
+    def generate_response_openai(self, email_content: Dict, intent: Optional[str] = None) -> str:
         """Generate response using OpenAI's GPT with business knowledge."""
+        started = None
         try:
-            # Enhance system prompt with business knowledge
-            system_prompt = self._enhance_system_prompt(self.llm_config.get("system_prompt", ""))
-            
-            # Determine email intent and add relevant context
-            intent = self._categorize_email_intent(email_content)
-            additional_context = self._create_context_for_intent(intent)
-            
-            # Create user prompt with context
-            user_prompt = f"""
-            Please respond to this email with the following context:
-            {additional_context}
-            
-            From: {email_content['from']}
-            Subject: {email_content['subject']}
-            
-            Content:
-            {email_content['body']}
-            """
-            
             # Generate response using OpenAI
-            client = openai.OpenAI(api_key=self.config.openai_api_key)
+            client = self._get_openai_client()
+            streaming = self._get_streaming_settings()
+            messages = self._build_messages(email_content, intent)
+            started = self._wait_for_rate_limit(messages)
+            # The time budget includes waiting for the first chunk
+            budget = self._new_stream_budget(streaming) if streaming else None
             response = client.chat.completions.create(
                 model="gpt-4",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
+                messages=messages,
                 temperature=0.7,
-                max_tokens=500
+                max_tokens=self._get_max_tokens(),
+                stream=bool(streaming)
             )
             
-            return response.choices[0].message.content.strip()
+            if streaming:
+                try:
+                    for chunk in response:
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if delta and budget.feed(delta):
+                            break
+                finally:
+                    response.close()
+                generated_text = self._finish_stream(budget)
+                self._record_llm_request(started, 'ok')
+                return generated_text
+            
+            generated_text = response.choices[0].message.content.strip()
+            self._record_llm_request(started, 'ok', response.usage)
+            return generated_text
             
         except Exception as e:
+            self._record_llm_request(started, 'error')
             logging.error(f"Error generating AI response: {str(e)}")
             raise
 
-    def generate_response(self, email_content: Dict) -> str:
-        """Generate response using configured model."""
+    def generate_response(self, email_content: Dict, intent: Optional[str] = None) -> str:
+        """
+        Generate response using configured model, or return a cached one.
+        
+        Args:
+            email_content: Parsed email
+            intent: Intent the email was queued with; classified here when None
+        """
+        self._refresh_if_changed()
+        if intent is None:
+            intent = self._categorize_email_intent(email_content)
+        
+        cache_key, cached = self._lookup_cached_response(email_content, intent)
+        if cached is not None:
+            return cached
+        
+        self._generation_stats.last = None
         if self.llm_config.get("model_type", "local") == "local":
-            return self.generate_response_local(email_content)
+            response = self.generate_response_local(email_content, intent)
         else:
-            return self.generate_response_openai(email_content)
\ No newline at end of file
+            response = self.generate_response_openai(email_content, intent)
+        
+        # A reply cut off by the token or time budget is sent once but never reused
+        stats = self.last_generation_stats()
+        if cache_key and not (stats and stats['stop_reason'] in BUDGET_CUTOFFS):
+            self._response_cache.put(cache_key, response)
+        return response
+
+    def _get_prompt_version(self) -> str:
+        """Hash of the system prompt and both configs; changes whenever a prompt would."""
+        version = self._prompt_version_cache
+        if version is None:
+            with self._cache_lock:
+                version = self._prompt_version_cache
+                if version is None:
+                    digest = hashlib.sha256()
+                    digest.update(self._get_system_prompt().encode('utf-8'))
+                    digest.update(json.dumps(self.llm_config, sort_keys=True).encode('utf-8'))
+                    digest.update(json.dumps(self.business_info, sort_keys=True).encode('utf-8'))
+                    version = digest.hexdigest()
+                    self._prompt_version_cache = version
+        return version
+
+    def _get_response_cache(self) -> Optional[ResponseCache]:
+        """Open the response cache configured in llm_config.json, if enabled."""
+        settings = self.llm_config.get("response_cache", {})
+        if not settings.get("enabled", False):
+            return None
+        with self._cache_lock:
+            if self._response_cache is None:
+                # Entries are keyed on the prompt version, so mailboxes with different
+                # business configs can share one cache without mixing up replies
+                path = os.path.abspath(settings.get("path", "config/response_cache.db"))
+                self._response_cache = self._shared("response_cache", [path, settings], lambda: ResponseCache(
+                    path,
+                    ttl_seconds=settings.get("ttl_seconds", 7 * 24 * 3600),
+                    max_entries=settings.get("max_entries", 1000),
+                    max_bytes=settings.get("max_bytes", 10 * 1024 * 1024),
+                    per_sender=settings.get("per_sender", True)
+                ))
+        return self._response_cache
+
+    def _lookup_cached_response(self, email_content: Dict, intent: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Look the email up in the response cache.
+        
+        Returns:
+            (cache key, cached response); the key is None when caching is disabled
+        """
+        cache = self._get_response_cache()
+        if cache is None:
+            return None, None
+        key = cache.make_key(email_content, intent, self._get_prompt_version())
+        cached = cache.get(key)
+        if cached is not None:
+            stats = cache.stats()
+            logging.info(f"Response cache hit for '{email_content['subject']}' "
+                         f"(hit rate {stats['hit_rate']:.0%})")
+        return key, cached
+
+    def cache_stats(self) -> Optional[Dict]:
+        """Response cache statistics, or None when caching is disabled."""
+        cache = self._get_response_cache()
+        return cache.stats() if cache else None
+
+    def _get_http_client(self) -> LLMHttpClient:
+        """Return the long-lived HTTP client used for the local backend."""
+        client = self._http_client
+        if client is None:
+            with self._cache_lock:
+                client = self._http_client
+                if client is None:
+                    settings = self.llm_config.get("http")
+                    client = self._shared("http_client", settings, lambda: LLMHttpClient(settings))
+                    self._http_client = client
+        return client
+
+    def _openai_client_options(self) -> Dict:
+        """Timeout and retry options shared by the sync and async OpenAI clients."""
+        http = self._get_http_client()
+        return {
+            "timeout": openai.Timeout(http.read_timeout, connect=http.connect_timeout),
+            # The OpenAI SDK retries 429/5xx itself with jittered exponential backoff
+            "max_retries": http.max_retries
+        }
+
+    def _get_openai_client(self) -> openai.OpenAI:
+        """Return the long-lived OpenAI client."""
+        client = self._openai_client
+        if client is None:
+            with self._cache_lock:
+                client = self._openai_client
+                if client is None:
+                    client = self._shared(
+                        "openai_client", [self.config.openai_api_key, self.llm_config.get("http")],
+                        lambda: openai.OpenAI(api_key=self.config.openai_api_key, **self._openai_client_options())
+                    )
+                    self._openai_client = client
+        return client
+
+    def _get_async_client(self) -> openai.AsyncOpenAI:
+        """Return the shared async client for the configured backend."""
+        client = self._async_client
+        if client is None:
+            if self.llm_config.get("model_type", "local") == "local":
+                # LM Studio and similar servers expose the OpenAI chat completions API
+                options = {
+                    "base_url": self.llm_config['local_model']['base_url'],
+                    "api_key": self.llm_config['local_model'].get('api_key', 'not-needed')
+                }
+            else:
+                options = {"api_key": self.config.openai_api_key}
+            client = self._shared(
+                "async_client", [options, self.llm_config.get("http")],
+                lambda: openai.AsyncOpenAI(**options, **self._openai_client_options())
+            )
+            self._async_client = client
+        return client
+
+    async def generate_response_async(self, email_content: Dict, intent: Optional[str] = None) -> str:
+        """Generate response without blocking the event loop; see generate_response()."""
+        loop = asyncio.get_running_loop()
+        self._refresh_if_changed()
+        if intent is None:
+            intent = self._categorize_email_intent(email_content)
+        
+        # The response cache is SQLite; its reads and writes run in the default executor
+        cache_key, cached = await loop.run_in_executor(
+            None, self._lookup_cached_response, email_content, intent
+        )
+        if cached is not None:
+            return cached
+        
+        started = None
+        try:
+            client = self._get_async_client()
+            if self.llm_config.get("model_type", "local") == "local":
+                model = self.llm_config['local_model']['model']
+            else:
+                model = "gpt-4"
+            streaming = self._get_streaming_settings()
+            messages = self._build_messages(email_content, intent)
+            started = await self._wait_for_rate_limit_async(messages)
+            # The time budget includes waiting for the first chunk
+            budget = self._new_stream_budget(streaming) if streaming else None
+            response = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=self._get_max_tokens(),
+                stream=bool(streaming)
+            )
+            
+            if streaming:
+                try:
+                    async for chunk in response:
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if delta and budget.feed(delta):
+                            break
+                finally:
+                    await response.close()
+                generated_text = self._finish_stream(budget)
+                self._record_llm_request(started, 'ok')
+            else:
+                generated_text = response.choices[0].message.content.strip()
+                self._record_llm_request(started, 'ok', response.usage)
+            
+            if cache_key and not (budget and budget.stop_reason in BUDGET_CUTOFFS):
+                await loop.run_in_executor(None, self._response_cache.put, cache_key, generated_text)
+            return generated_text
+            
+        except Exception as e:
+            self._record_llm_request(started, 'error')
+            logging.error(f"Error generating response asynchronously: {str(e)}")
+            raise
@@ -0,0 +1,109 @@
+"""
+Keyword-based email intent classifier that looks up each distinct word once.
+"""
+
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+_WORD = re.compile(r'\w+')
+
+# Distinct tokens remembered with their intents before the cache starts over
+TOKEN_CACHE_SIZE = 50000
+
+# Keywords are single words; those ending in '*' match any word starting with the stem
+DEFAULT_INTENT_KEYWORDS = {
+    'appointment': ['appointment*', 'booking*', 'schedul*', 'visit*', 'termin*'],
+    'services': ['treatment*', 'service*', 'procedure*', 'therap*', 'behandlung*'],
+    'costs': ['cost*', 'price*', 'fee', 'fees', 'insurance', 'payment*', 'kosten*'],
+    'information': ['information', 'details', 'question*', 'inquir*', 'info'],
+    'emergency': ['emergenc*', 'urgent*', 'immediate*', 'notfall*']
+}
+
+
+class IntentClassifier:
+    def __init__(self, keywords: Optional[Dict[str, List[str]]] = None, subject_weight: float = 2.0):
+        """
+        Index all keywords for a single scan over the words of an email.
+
+        Args:
+            keywords: Keyword lists per intent; the order of the intents breaks score ties
+            subject_weight: Score of a keyword hit in the subject (a body hit scores 1)
+        """
+        self.keywords = keywords or DEFAULT_INTENT_KEYWORDS
+        self.subject_weight = subject_weight
+        self._order = {intent: index for index, intent in enumerate(self.keywords)}
+        # Whole words and stems map to every intent that lists them
+        self._words: Dict[str, List[str]] = {}
+        self._stems: Dict[str, List[str]] = {}
+        for intent, words in self.keywords.items():
+            for word in words:
+                word = word.strip().lower()
+                is_stem = word.endswith('*')
+                word = word.rstrip('*')
+                if word:
+                    (self._stems if is_stem else self._words).setdefault(word, []).append(intent)
+        # A word can only match a stem as long as one of these prefixes, and only
+        # if it starts like one of the stems
+        self._stem_lengths = sorted({len(stem) for stem in self._stems})
+        self._gate_length = self._stem_lengths[0] if self._stems else 0
+        self._stem_gate = {stem[:self._gate_length] for stem in self._stems}
+        # Intents per token; mail reuses most of its vocabulary, so lookups are mostly hits
+        self._token_intents: Dict[str, Tuple[str, ...]] = {}
+
+    def _intents_for(self, word: str) -> List[str]:
+        """Map a word to the intents whose keyword (or stem) it is, each intent once."""
+        intents = list(self._words.get(word, ()))
+        if word[:self._gate_length] in self._stem_gate:
+            for length in self._stem_lengths:
+                if length > len(word):
+                    break
+                intents.extend(self._stems.get(word[:length], ()))
+        return list(dict.fromkeys(intents))
+
+    def _token_intents_for(self, token: str) -> Tuple[str, ...]:
+        """Intents of all words in a whitespace-separated token, cached."""
+        intents = self._token_intents.get(token)
+        if intents is None:
+            words = (token,) if token.isalnum() else _WORD.findall(token)
+            intents = tuple(intent for word in words for intent in self._intents_for(word))
+            if len(self._token_intents) >= TOKEN_CACHE_SIZE:
+                self._token_intents.clear()
+            self._token_intents[token] = intents
+        return intents
+
+    def _add_scores(self, scores: Dict[str, float], text: str, weight: float):
+        if not text:
+            return
+        # Splitting runs in C and each distinct token is looked up once; only
+        # tokens with punctuation need the word regex
+        tokens = text.lower().split()
+        hits = {}
+        for token in set(tokens):
+            intents = self._token_intents_for(token)
+            if intents:
+                hits[token] = intents
+        if not hits:
+            return
+        # Counting every token costs more than a few scans for the ones that hit
+        counts = Counter(tokens) if len(hits) > 8 else {token: tokens.count(token) for token in hits}
+        for token, intents in hits.items():
+            for intent in intents:
+                scores[intent] = scores.get(intent, 0.0) + weight * counts[token]
+
+    def classify(self, subject: str, body: str) -> List[Tuple[str, float]]:
+        """
+        Score every intent with at least one keyword hit.
+
+        Returns:
+            (intent, score) pairs, highest score first
+        """
+        scores: Dict[str, float] = {}
+        self._add_scores(scores, subject, self.subject_weight)
+        self._add_scores(scores, body, 1.0)
+        return sorted(scores.items(), key=lambda item: (-item[1], self._order[item[0]]))
+
+    def primary_intent(self, subject: str, body: str) -> str:
+        """Return the highest scoring intent, or 'general' when nothing matched."""
+        intents = self.classify(subject, body)
+        return intents[0][0] if intents else 'general'
@@ -0,0 +1,165 @@
+"""
+In-memory BM25 index over chunks of the business knowledge base.
+"""
+
+import logging
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.core.email_parser import EmailParser
+
+_TOKEN_RE = re.compile(r'\w+')
+# Frequent English and German words that carry no meaning for retrieval
+_STOP_WORDS = frozenset("""
+a an and are as at be but by can could do for from have how i if in is it me my of on or our
+please should so that the their there this to we what when where which who will with would you your
+aber am auch bei bin bitte das dass den der des die ein eine einen einer es für haben ich ihr ihre
+im in ist kann können mein mit nicht noch oder sie sind und von was wie wir zu
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stop words."""
+    return [token for token in _TOKEN_RE.findall(text.lower()) if token not in _STOP_WORDS]
+
+
+def _title(key: str) -> str:
+    return str(key).replace('_', ' ').title()
+
+
+def _split_words(text: str, max_words: int) -> List[str]:
+    """Split long text on line breaks into pieces of at most max_words words."""
+    pieces, current, count = [], [], 0
+    for line in text.splitlines():
+        words = len(line.split())
+        if current and count + words > max_words:
+            pieces.append('\n'.join(current))
+            current, count = [], 0
+        current.append(line)
+        count += words
+    if current:
+        pieces.append('\n'.join(current))
+    return [piece.strip() for piece in pieces if piece.strip()]
+
+
+def chunk_business_config(business_info: Dict, exclude: Optional[List[str]] = None,
+                          max_words: int = 120) -> List[Dict]:
+    """
+    Split the business config into self-contained text chunks.
+
+    Every string leaf, list of strings or list entry that is an object becomes a
+    chunk titled with its path (e.g. "Services > Specialized > Hair Loss").
+
+    Args:
+        business_info: Parsed business_config.json
+        exclude: Top-level keys left out (e.g. those always put into the prompt)
+        max_words: Longer texts are split on line breaks
+
+    Returns:
+        Chunks with 'title' and 'text'
+    """
+    chunks: List[Dict] = []
+
+    def add(path: List[str], text: str):
+        title = ' > '.join(_title(part) for part in path)
+        for piece in _split_words(text, max_words):
+            chunks.append({'title': title, 'text': f"{title}: {piece}"})
+
+    def describe(value) -> str:
+        if isinstance(value, dict):
+            return '; '.join(f"{_title(key)}: {describe(item)}" for key, item in value.items())
+        if isinstance(value, list):
+            return ', '.join(describe(item) for item in value)
+        return str(value)
+
+    def walk(path: List[str], value):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                walk(path + [key], item)
+        elif isinstance(value, list) and any(isinstance(item, dict) for item in value):
+            # e.g. staff members or FAQ entries: one chunk per entry
+            for item in value:
+                add(path, describe(item))
+        elif value not in (None, '', []):
+            add(path, describe(value))
+
+    for key, value in business_info.items():
+        if key not in (exclude or []):
+            walk([key], value)
+    return chunks
+
+
+class KnowledgeIndex:
+    def __init__(self, chunks: List[Dict], k1: float = 1.5, b: float = 0.75):
+        """
+        Build the BM25 index.
+
+        Each term keeps the chunk ids it occurs in and its precomputed BM25 weight
+        in each of them, so a query is a handful of vectorized array additions.
+
+        Args:
+            chunks: Chunks with 'text' (see chunk_business_config)
+            k1: Term frequency saturation
+            b: Document length normalization
+        """
+        self.chunks = chunks
+        self.tokens = np.array([EmailParser.estimate_tokens(chunk['text']) for chunk in chunks], dtype=np.int64)
+
+        documents = [tokenize(chunk['text']) for chunk in chunks]
+        lengths = np.array([len(doc) for doc in documents], dtype=np.float64)
+        average_length = lengths.mean() if len(documents) and lengths.mean() > 0 else 1.0
+
+        postings: Dict[str, Dict[int, int]] = {}
+        for doc_id, doc in enumerate(documents):
+            for term in doc:
+                counts = postings.setdefault(term, {})
+                counts[doc_id] = counts.get(doc_id, 0) + 1
+
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        n_docs = len(documents)
+        for term, counts in postings.items():
+            doc_ids = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+            frequencies = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+            idf = np.log(1 + (n_docs - len(counts) + 0.5) / (len(counts) + 0.5))
+            norm = k1 * (1 - b + b * lengths[doc_ids] / average_length)
+            self._postings[term] = (doc_ids, idf * frequencies * (k1 + 1) / (frequencies + norm))
+        logging.info(f"Knowledge index built: {n_docs} chunks, {len(self._postings)} terms")
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every chunk for the query."""
+        scores = np.zeros(len(self.chunks), dtype=np.float64)
+        for term in set(tokenize(query)):
+            posting = self._postings.get(term)
+            if posting is not None:
+                doc_ids, weights = posting
+                scores[doc_ids] += weights
+        return scores
+
+    def search(self, query: str, top_k: int = 5, max_tokens: Optional[int] = None) -> List[Dict]:
+        """
+        Return the best matching chunks, best first.
+
+        Args:
+            query: Email subject and body
+            top_k: Maximum number of chunks
+            max_tokens: Estimated token budget for all returned chunks; chunks
+                        that no longer fit are skipped
+        """
+        scores = self.scores(query)
+        candidates = np.flatnonzero(scores > 0)
+        if not len(candidates):
+            return []
+        # Best first; ties keep config order
+        order = candidates[np.lexsort((candidates, -scores[candidates]))]
+
+        selected, used = [], 0
+        for doc_id in order:
+            if len(selected) >= top_k:
+                break
+            if max_tokens is not None and used + self.tokens[doc_id] > max_tokens:
+                continue
+            selected.append(self.chunks[doc_id])
+            used += int(self.tokens[doc_id])
+        return selected
@@ -0,0 +1,185 @@
+"""
+Long-lived HTTP client for LLM backends with timeouts and retries.
+"""
+
+import json
+import logging
+import random
+import time
+from typing import Dict, Iterator, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+DEFAULT_HTTP_CONFIG = {
+    "connect_timeout": 5,
+    "read_timeout": 120,
+    "max_retries": 3,
+    "backoff_base": 0.5,
+    "backoff_max": 20,
+    "pool_maxsize": 10
+}
+
+
+class LLMHttpClient:
+    def __init__(self, http_config: Optional[Dict] = None):
+        """
+        Initialize the client from the "http" section of llm_config.json.
+
+        Args:
+            http_config: Overrides for DEFAULT_HTTP_CONFIG
+        """
+        settings = dict(DEFAULT_HTTP_CONFIG)
+        settings.update(http_config or {})
+        self.connect_timeout = settings["connect_timeout"]
+        self.read_timeout = settings["read_timeout"]
+        # Retries after the first attempt; a negative value would skip the request entirely
+        self.max_retries = max(0, int(settings["max_retries"]))
+        self.backoff_base = settings["backoff_base"]
+        self.backoff_max = settings["backoff_max"]
+
+        # Keep-alive connections are reused across requests to the same host
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings["pool_maxsize"])
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @property
+    def timeout(self) -> tuple:
+        """(connect, read) timeout passed to requests."""
+        return (self.connect_timeout, self.read_timeout)
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Exponential backoff with full jitter, never shorter than a Retry-After header."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after:
+            try:
+                delay = max(delay, min(float(retry_after), self.backoff_max))
+            except ValueError:
+                pass
+        return delay
+
+    def post(self, url: str, payload: Dict, headers: Optional[Dict] = None,
+             stream: bool = False) -> requests.Response:
+        """
+        POST JSON, retrying connection errors, timeouts, 429 and 5xx responses.
+
+        Returns:
+            The successful response; raises after the last failed attempt.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(url, json=payload, headers=headers,
+                                             timeout=self.timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff_delay(attempt)
+                logging.warning(f"LLM request failed ({str(e)}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                delay = self.backoff_delay(attempt, response.headers.get('Retry-After'))
+                logging.warning(f"LLM backend returned {response.status_code}, retrying in {delay:.1f}s")
+                response.close()
+                time.sleep(delay)
+                continue
+
+            response.raise_for_status()
+            return response
+
+    def post_json(self, url: str, payload: Dict, headers: Optional[Dict] = None) -> Dict:
+        """POST JSON and decode the JSON response."""
+        return self.post(url, payload, headers=headers).json()
+
+    def close(self):
+        """Close pooled connections."""
+        self.session.close()
+
+
+def iter_sse_content(response: requests.Response) -> Iterator[str]:
+    """Yield content deltas from a streamed chat completions (SSE) response."""
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith('data:'):
+            continue
+        data = line[len('data:'):].strip()
+        if data == '[DONE]':
+            return
+        try:
+            chunk = json.loads(data)
+        except ValueError:
+            logging.warning(f"Skipping malformed stream chunk: {data[:100]}")
+            continue
+        choices = chunk.get('choices') or []
+        if choices:
+            content = (choices[0].get('delta') or {}).get('content')
+            if content:
+                yield content
+
+
+class StreamBudget:
+    """Tracks a streamed generation and decides when to stop it early."""
+
+    def __init__(self, max_tokens: int, max_seconds: float, stop_markers: Optional[List[str]] = None):
+        """
+        Args:
+            max_tokens: Stop after this many streamed chunks (about one token each)
+            max_seconds: Stop once generation has run this long
+            stop_markers: Stop when one of these appears; the text is cut before it
+        """
+        self.max_tokens = max_tokens
+        self.max_seconds = max_seconds
+        self.stop_markers = [marker for marker in (stop_markers or []) if marker]
+        self.started = time.monotonic()
+        self.first_token_at = None
+        self.tokens = 0
+        self.stop_reason = 'complete'
+        self._parts: List[str] = []
+        self._length = 0
+        # End of the text seen so far, long enough to catch markers split across deltas
+        self._tail = ''
+        self._tail_size = max((len(marker) for marker in self.stop_markers), default=1) - 1
+
+    def feed(self, delta: str) -> bool:
+        """Add a streamed delta. Returns True when generation should stop."""
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+        self.tokens += 1
+        self._parts.append(delta)
+        self._length += len(delta)
+
+        if self.stop_markers:
+            window = self._tail + delta
+            for marker in self.stop_markers:
+                position = window.find(marker)
+                if position != -1:
+                    cut = self._length - len(window) + position
+                    self._parts = [''.join(self._parts)[:cut]]
+                    self.stop_reason = 'stop_marker'
+                    return True
+            self._tail = window[-self._tail_size:] if self._tail_size else ''
+
+        if self.tokens >= self.max_tokens:
+            self.stop_reason = 'max_tokens'
+            return True
+        if time.monotonic() - self.started >= self.max_seconds:
+            self.stop_reason = 'max_seconds'
+            return True
+        return False
+
+    @property
+    def text(self) -> str:
+        return ''.join(self._parts).strip()
+
+    def stats(self) -> Dict:
+        """Time to first token, duration, token count and why generation ended."""
+        return {
+            'time_to_first_token': (self.first_token_at - self.started) if self.first_token_at else None,
+            'duration': time.monotonic() - self.started,
+            'tokens': self.tokens,
+            'stop_reason': self.stop_reason
+        }
@@ -0,0 +1,154 @@
+"""
+Persistent cache of generated responses, keyed on normalized email content.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+# Reply/forward prefixes in English and German subjects
+_SUBJECT_PREFIX_RE = re.compile(r'^\s*((re|fw|fwd|aw|wg|antw)\s*(\[\d+\])?\s*:\s*)+', re.IGNORECASE)
+_QUOTE_MARKER_RE = re.compile(r'^[ \t]*>+', re.MULTILINE)
+_WHITESPACE_RE = re.compile(r'\s+')
+_ADDRESS_RE = re.compile(r'[\w\.\+-]+@[\w\.-]+')
+
+
+class ResponseCache:
+    def __init__(self, path: str, ttl_seconds: float = 7 * 24 * 3600, max_entries: int = 1000,
+                 max_bytes: int = 10 * 1024 * 1024, per_sender: bool = True):
+        """
+        Open (or create) the cache database.
+
+        Args:
+            path: SQLite file holding the cached responses
+            ttl_seconds: Entries older than this are never returned
+            max_entries: Least recently used entries beyond this count are evicted
+            max_bytes: Least recently used entries beyond this total size are evicted
+            per_sender: Include the sender address in the key so a reply that greets
+                        one person is never sent to another
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.per_sender = per_sender
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                size INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def normalize_subject(subject: str) -> str:
+        """Strip Re:/Fwd:/AW:/WG: prefixes, case and extra whitespace."""
+        subject = _SUBJECT_PREFIX_RE.sub('', subject or '')
+        return _WHITESPACE_RE.sub(' ', subject).strip().lower()
+
+    @staticmethod
+    def normalize_body(body: str) -> str:
+        """Drop quote markers, case and whitespace differences."""
+        body = _QUOTE_MARKER_RE.sub('', body or '')
+        return _WHITESPACE_RE.sub(' ', body).strip().lower()
+
+    def make_key(self, email_content: Dict, intent: str, prompt_version: str) -> str:
+        """Hash the normalized email together with its intent and the prompt/config version."""
+        parts = [
+            self.normalize_body(email_content.get('body', '')),
+            self.normalize_subject(email_content.get('subject', '')),
+            intent,
+            prompt_version
+        ]
+        if self.per_sender:
+            match = _ADDRESS_RE.search(email_content.get('from', '') or '')
+            parts.append(match.group(0).lower() if match else '')
+        return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return a cached response, or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str):
+        """Store a response and evict expired or least recently used entries."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created_at, last_access, size) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, response, now, now, len(response.encode('utf-8')))
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        """Enforce TTL, entry count and total size limits."""
+        self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+
+        # Walk from least to most recently used until both limits are met
+        evict = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            evict.append((key,))
+            count -= 1
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", evict)
+        logging.info(f"Response cache evicted {len(evict)} entries")
+
+    def stats(self) -> Dict:
+        """Hit/miss counters, hit rate and current size."""
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': count,
+            'bytes': total
+        }
+
+    def close(self):
+        """Close the database."""
+        with self._lock:
+            self._conn.close()
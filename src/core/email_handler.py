@@ -11,14 +11,26 @@ import smtplib
 from typing import List, Dict
 import json
 import logging
+import time
 from datetime import datetime
 import os
+from src.core.metrics import SMTP_SEND_SECONDS
+from src.core.rate_limit import TokenBucket
+from src.core.smtp_pool import SMTPConnectionPool
+
 class EmailConfig:
-    def __init__(self, config_path: str = "config/email_config.json"):
-        """Initialize email configuration from JSON file."""
+    def __init__(self, config_path: str = "config/email_config.json", defaults: Dict = None):
+        """
+        Initialize email configuration from JSON file.
+        
+        Args:
+            config_path: Path to the JSON file
+            defaults: Values used for keys the file does not set, e.g. per-mailbox state paths
+        """
         try:
             with open(config_path, 'r') as f:
-                config = json.load(f)
+                config = dict(defaults or {})
+                config.update(json.load(f))
             
             # Required fields
             required_fields = [
@@ -40,26 +52,102 @@ class EmailConfig:
             self.smtp_server = config["smtp_server"]
             self.smtp_port = config["smtp_port"]
             self.smtp_use_ssl = config.get("smtp_use_ssl", self.smtp_port == 465)
+            self.smtp_timeout = config.get("smtp_timeout", 30)
+            self.smtp_pool_size = config.get("smtp_pool_size", 2)
+            # NOOP idle sessions this often to keep them open, close those idle past smtp_max_idle
+            self.smtp_keepalive_interval = config.get("smtp_keepalive_interval", 60)
+            self.smtp_max_idle = config.get("smtp_max_idle", 240)
+            # Provider sending limit; replies wait for their turn instead of failing (0 = unlimited)
+            self.smtp_messages_per_minute = config.get("smtp_messages_per_minute", 0)
+            # Messages that may go out back to back; a full minute's worth on top of the
+            # steady rate would exceed the provider limit in a 60 second window
+            self.smtp_burst = config.get("smtp_burst", 1)
+            # Local metrics endpoint (0 = disabled); worker processes use the following ports
+            self.metrics_host = config.get("metrics_host", "127.0.0.1")
+            self.metrics_port = config.get("metrics_port", 9108)
             
             # IMAP settings
             self.imap_server = config["imap_server"]
             self.imap_port = config["imap_port"]
             self.imap_use_ssl = config.get("imap_use_ssl", True)
-            
+            self.imap_idle = config.get("imap_idle", True)
+            # Re-issue IDLE before the server's 30 minute inactivity timeout
+            self.imap_idle_timeout = config.get("imap_idle_timeout", 25 * 60)
+            # Number of messages requested per FETCH/STORE round trip
+            self.fetch_batch_size = config.get("fetch_batch_size", 50)
+            # "structure" downloads only the text part we use, "full" the whole RFC822 message
+            self.fetch_mode = config.get("fetch_mode", "structure")
+            self.max_body_bytes = config.get("max_body_bytes", 256 * 1024)
+            self.strip_quoted_text = config.get("strip_quoted_text", True)
+            # Adaptive polling when IDLE is unavailable: the interval shrinks towards
+            # poll_min_interval while mail arrives and grows to poll_max_interval when idle
+            self.check_interval = config.get("check_interval", 60)
+            self.poll_min_interval = config.get("poll_min_interval", 15)
+            self.poll_max_interval = config.get("poll_max_interval", 300)
+            self.poll_idle_growth = config.get("poll_idle_growth", 1.5)
+            # Delay after a failed check, doubled per consecutive failure up to the maximum
+            self.poll_error_backoff = config.get("poll_error_backoff", 5)
+            self.poll_error_backoff_max = config.get("poll_error_backoff_max", 600)
+            # UIDVALIDITY and last processed UID, kept across restarts
+            self.sync_checkpoint_path = config.get("sync_checkpoint_path", "config/sync_checkpoint.json")
+            # Answered Message-IDs, so no email is replied to twice
+            self.processed_store_path = config.get("processed_store_path", "config/processed_messages.db")
+            self.processed_retention_days = config.get("processed_retention_days", 90)
+
             # OpenAI and response settings
             self.openai_api_key = config["openai_api_key"]
             self.response_rules = config.get("response_rules", [])
             
+            # Pipeline settings: concurrent LLM generations and SMTP sends
+            self.generation_workers = config.get("generation_workers", 4)
+            self.send_workers = config.get("send_workers", 2)
+            # Durable job queue between fetching, generation and sending
+            self.work_queue_path = config.get("work_queue_path", "config/work_queue.db")
+            # Seconds before a job claimed by a crashed worker is handed out again
+            self.job_visibility_timeout = config.get("job_visibility_timeout", 600)
+            self.job_max_attempts = config.get("job_max_attempts", 5)
+            self.job_retry_backoff = config.get("job_retry_backoff", 30)
+            self.job_retry_backoff_max = config.get("job_retry_backoff_max", 3600)
+            self.job_retention_days = config.get("job_retention_days", 7)
+            # Queue priority per email intent, 0 first; every job_priority_aging seconds
+            # of waiting count as one level, so routine mail is never starved
+            self.intent_priorities = config.get("intent_priorities", {
+                "emergency": 0,
+                "appointment": 1,
+                "costs": 2,
+                "services": 2,
+                "information": 3,
+                "general": 4
+            })
+            self.job_priority_aging = config.get("job_priority_aging", 300)
+            # Concurrent LLM requests in the asyncio runtime (main.py --async)
+            self.async_max_in_flight = config.get("async_max_in_flight", 100)
+            
             logging.info("Email configuration loaded successfully")
             
         except Exception as e:
             logging.error(f"Error loading configuration: {str(e)}")
             raise
 
+    def intent_priority(self, intent: str) -> int:
+        """Queue priority of an intent; unknown intents are treated as general mail."""
+        return self.intent_priorities.get(intent, self.intent_priorities.get('general', 0))
+
 class EmailHandler:
     def __init__(self, config: EmailConfig):
         """Initialize the email handler with configuration."""
         self.config = config
+        # Replies share authenticated sessions instead of logging in for every message
+        self.pool = SMTPConnectionPool(
+            config,
+            max_size=config.smtp_pool_size,
+            keepalive_interval=config.smtp_keepalive_interval,
+            max_idle=config.smtp_max_idle
+        )
+        self.rate_limiter = None
+        if config.smtp_messages_per_minute:
+            self.rate_limiter = TokenBucket(config.smtp_messages_per_minute, capacity=config.smtp_burst,
+                                            name="SMTP messages")
     
     def send_response(self, to_address: str, subject: str, body: str):
         """Send email response."""
@@ -72,20 +160,38 @@ class EmailHandler:
             
             msg.attach(MIMEText(body, 'plain'))
             
-            if self.config.smtp_use_ssl:
-                # Use SSL for port 465
-                smtp = smtplib.SMTP_SSL(self.config.smtp_server, self.config.smtp_port)
-            else:
-                # Use STARTTLS for port 587
-                smtp = smtplib.SMTP(self.config.smtp_server, self.config.smtp_port)
-                smtp.starttls()
-            
-            smtp.login(self.config.email_address, self.config.email_password)
-            smtp.send_message(msg)
-            smtp.quit()
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            started = time.perf_counter()
+            outcome = 'error'
+            try:
+                try:
+                    with self.pool.connection() as smtp:
+                        smtp.send_message(msg)
+                except smtplib.SMTPServerDisconnected:
+                    # The server dropped a pooled session, retry once on a fresh one
+                    logging.warning("SMTP session was disconnected, reconnecting...")
+                    with self.pool.connection() as smtp:
+                        smtp.send_message(msg)
+                outcome = 'ok'
+            finally:
+                SMTP_SEND_SECONDS.observe(time.perf_counter() - started,
+                                          mailbox=self.config.email_address, outcome=outcome)
             
             logging.info(f"Email sent successfully to {to_address}")
             
         except Exception as e:
             logging.error(f"Error sending email: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+
+    def rate_limit_backlog(self) -> float:
+        """Seconds a new reply would wait for the SMTP rate limiter."""
+        return self.rate_limiter.backlog() if self.rate_limiter else 0.0
+
+    def rate_limit_stats(self):
+        """State of the SMTP rate limiter, or None when sending is unlimited."""
+        return self.rate_limiter.snapshot() if self.rate_limiter else None
+
+    def close(self):
+        """Close pooled SMTP sessions."""
+        self.pool.close()
@@ -2,104 +2,490 @@
 Email monitoring module to handle incoming emails.
 """
 
+import base64
 import imaplib
 import email
-from typing import Dict, List
+from email.message import Message
+import select
+import socket
+import ssl
+import re
+import time
+from typing import Dict, List, Optional, Tuple
 import logging
 from src.core.email_handler import EmailConfig
+from src.core.email_parser import EmailParser
+from src.core.imap_utils import (chunked, compress_uid_set, find_text_parts, parse_date_header,
+                                 parse_fetch_response, parse_internaldate)
+from src.core.metrics import (IMAP_CONNECT_SECONDS, IMAP_FETCH_BYTES, IMAP_FETCH_SECONDS,
+                              IMAP_FETCHED_MESSAGES, IMAP_SEARCH_SECONDS, PARSE_SECONDS)
+from src.core.sync_checkpoint import SyncCheckpoint
+from src.core.processed_store import ProcessedMessageStore
+
+
+def parse_received_email(email_data: Dict, config: EmailConfig) -> Dict:
+    """
+    Parse an email fetched with check_new_emails(parse=False).
+
+    Returns:
+        The email as check_new_emails() would have returned it, without the raw message
+    """
+    msg = email.message_from_bytes(base64.b64decode(email_data['raw']))
+    parsed = EmailParser.parse_email_message(
+        msg,
+        strip_quotes=config.strip_quoted_text,
+        max_part_bytes=config.max_body_bytes
+    )
+    for key in ('uid', 'received_at', 'uidvalidity', 'mailbox'):
+        parsed[key] = email_data.get(key)
+    return parsed
 
 
 class EmailMonitor:
     def __init__(self, config: EmailConfig):
         """Initialize email monitor with configuration."""
         self.config = config
-        self._processed_ids = set()  # Keep track of processed email IDs
+        self.mailbox = 'INBOX'
+        self._imap = None  # Long-lived connection, reused across checks
+        self._idling = False
+        self._uidvalidity = None
+        # Highest UID handed out per UIDVALIDITY, survives restarts
+        self.checkpoint = SyncCheckpoint(
+            config.sync_checkpoint_path,
+            f"{config.email_address}/{self.mailbox}"
+        )
+        # Position reached by the last check, applied by commit_checkpoint()
+        self._pending_uid: Optional[int] = None
+        # UIDs handed out (and marked \Seen) but not committed yet, fetched again
+        # by the next check; an UNSEEN search would no longer find them
+        self._uncommitted_uids = set()
+        self._last_check_uids = set()
+        # Emails of the last check that could not be parsed, with their headers (as far
+        # as readable) and 'error'; the checkpoint moves past them, so callers record them
+        self.failed_emails: List[Dict] = []
+        # Emails already answered, e.g. before a crash that lost the checkpoint
+        self.processed = ProcessedMessageStore.from_config(config)
 
     def _connect_imap(self) -> imaplib.IMAP4_SSL:
         """Establish IMAP connection."""
         try:
-            imap = imaplib.IMAP4_SSL(self.config.imap_server)
-            imap.login(self.config.email_address, self.config.email_password)
+            with IMAP_CONNECT_SECONDS.time(mailbox=self.config.email_address):
+                if self.config.imap_use_ssl:
+                    imap = imaplib.IMAP4_SSL(self.config.imap_server, self.config.imap_port)
+                else:
+                    imap = imaplib.IMAP4(self.config.imap_server, self.config.imap_port)
+                imap.login(self.config.email_address, self.config.email_password)
+            # Capabilities may change after authentication, refresh them
+            _, data = imap.capability()
+            if data and data[-1]:
+                imap.capabilities = tuple(data[-1].decode().upper().split())
             return imap
         except Exception as e:
             logging.error(f"Failed to connect to IMAP server: {str(e)}")
             raise
 
+    def _get_connection(self) -> imaplib.IMAP4_SSL:
+        """Return the cached IMAP connection with INBOX selected, connecting if needed."""
+        if self._imap is None:
+            imap = self._connect_imap()
+            imap.select(self.mailbox)
+            # The size reported by SELECT is not new mail; the first check fetches it anyway
+            for name in ('EXISTS', 'RECENT'):
+                imap.untagged_responses.pop(name, None)
+            _, data = imap.response('UIDVALIDITY')
+            if not data or data[0] is None:
+                _, data = imap.status(self.mailbox, '(UIDVALIDITY)')
+                data = re.findall(rb'UIDVALIDITY (\d+)', data[0] or b'')
+            uidvalidity = int(data[0])
+            if uidvalidity != self._uidvalidity:
+                self._uncommitted_uids.clear()
+            self._uidvalidity = uidvalidity
+            self._imap = imap
+            logging.info("IMAP connection established")
+        return self._imap
+
+    def close(self):
+        """Log out and drop the cached IMAP connection."""
+        if self._imap is None:
+            return
+        if self._idling:
+            # Another thread is blocked in IDLE; shutting the socket down wakes it
+            # and it drops the connection itself
+            try:
+                self._imap.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            return
+        try:
+            self._imap.logout()
+        except Exception:
+            pass
+        self._imap = None
+
+    def _drop_connection(self):
+        """Discard the connection without LOGOUT when its protocol state is unknown."""
+        if self._imap is None:
+            return
+        try:
+            self._imap.shutdown()
+        except Exception:
+            pass
+        self._imap = None
+
+    def supports_idle(self) -> bool:
+        """Check whether IDLE push mode is enabled and advertised by the server."""
+        if not self.config.imap_idle:
+            return False
+        imap = self._get_connection()
+        return 'IDLE' in imap.capabilities
+
     def _parse_email(self, msg) -> Dict:
         """Parse email message into a structured format."""
-        email_data = {
-            'subject': msg['subject'] or '',
-            'from': msg['from'] or '',
-            'to': msg['to'] or '',
-            'date': msg['date'] or '',
-            'body': '',
-            'message_id': msg['message-id'] or ''
-        }
-
-        # Get email body
-        if msg.is_multipart():
-            for part in msg.walk():
-                if part.get_content_type() == "text/plain":
-                    try:
-                        email_data['body'] = part.get_payload(decode=True).decode()
-                        break
-                    except:
-                        continue
-        else:
-            try:
-                email_data['body'] = msg.get_payload(decode=True).decode()
-            except:
-                email_data['body'] = msg.get_payload()
+        return EmailParser.parse_email_message(
+            msg,
+            strip_quotes=self.config.strip_quoted_text,
+            max_part_bytes=self.config.max_body_bytes
+        )
 
+    def _failed_email(self, msg, uid: int, error: Exception) -> Dict:
+        """Describe an email that could not be parsed, so it can be recorded instead of lost."""
+        try:
+            email_data = EmailParser.parse_headers(msg)
+        except Exception:
+            email_data = {'subject': '', 'from': '', 'to': '', 'date': '', 'body': '', 'message_id': ''}
+        email_data.update(uid=uid, uidvalidity=self._uidvalidity, mailbox=self.checkpoint.mailbox_key,
+                          error=str(error))
         return email_data
 
-    def check_new_emails(self) -> List[Dict]:
-        """Check for new unread emails."""
+    def _search_new_uids(self, imap) -> Tuple[List[int], Optional[int]]:
+        """
+        Find UIDs that arrived after the checkpoint, or unread mail without one.
+
+        Returns:
+            The UIDs to fetch and, when bootstrapping, the UID to anchor the checkpoint at
+        """
+        if self.checkpoint.is_valid_for(self._uidvalidity):
+            last_uid = self.checkpoint.last_uid
+            _, data = imap.uid('SEARCH', None, f'UID {last_uid + 1}:*')
+            uids = [int(uid) for uid in data[0].split()] if data and data[0] else []
+            # "n:*" always matches the newest message, even when its UID is below n
+            return [uid for uid in uids if uid > last_uid], None
+
+        if self.checkpoint.last_uid is not None:
+            logging.warning(f"UIDVALIDITY of {self.mailbox} changed, resynchronizing from unread messages")
+        else:
+            logging.info(f"No sync checkpoint for {self.mailbox}, starting from unread messages")
+
+        _, data = imap.uid('SEARCH', None, 'UNSEEN')
+        uids = [int(uid) for uid in data[0].split()] if data and data[0] else []
+
+        # Anchor the checkpoint at the newest message so later polls are incremental
+        _, data = imap.uid('SEARCH', None, 'UID *')
+        newest = [int(uid) for uid in data[0].split()] if data and data[0] else []
+        return uids, max(newest + uids + [0])
+
+    def _fetch_full_messages(self, imap, batch: List[int]) -> List[Tuple[int, Message, Optional[float]]]:
+        """Download complete RFC822 messages and their arrival times for a batch of UIDs."""
+        typ, msg_data = imap.uid('FETCH', compress_uid_set(batch), '(INTERNALDATE RFC822)')
+        if typ != 'OK':
+            raise imaplib.IMAP4.error(f"FETCH failed: {msg_data}")
+
+        fetched = parse_fetch_response(msg_data)
+        IMAP_FETCH_BYTES.inc(sum(len(attributes['RFC822']) for attributes in fetched),
+                             mailbox=self.config.email_address)
+        return [(attributes['UID'], email.message_from_bytes(attributes['RFC822']),
+                 parse_internaldate(attributes.get('INTERNALDATE')))
+                for attributes in fetched]
+
+    def _fetch_text_messages(self, imap, batch: List[int]) -> List[Tuple[int, Message, Optional[float]]]:
+        """
+        Download headers and structure first, then only the text parts we use.
+
+        Attachments are never transferred; each inline text section is capped at
+        config.max_body_bytes.
+        """
+        typ, msg_data = imap.uid(
+            'FETCH', compress_uid_set(batch), '(UID RFC822.SIZE INTERNALDATE BODYSTRUCTURE BODY.PEEK[HEADER])'
+        )
+        if typ != 'OK':
+            raise imaplib.IMAP4.error(f"FETCH failed: {msg_data}")
+
+        headers = {}
+        received = {}
+        text_parts = {}
+        uids_by_sections = {}
+        for attributes in parse_fetch_response(msg_data):
+            uid = attributes['UID']
+            headers[uid] = attributes.get('BODY[HEADER]') or b''
+            received[uid] = parse_internaldate(attributes.get('INTERNALDATE'))
+            parts = find_text_parts(attributes.get('BODYSTRUCTURE') or [])
+            if parts:
+                text_parts[uid] = parts
+                uids_by_sections.setdefault(tuple(part['section'] for part in parts), []).append(uid)
+
+        # One FETCH per distinct set of sections, usually just "1" or "1.1"
+        bodies = {}
+        cap = self.config.max_body_bytes
+        for sections, uids in uids_by_sections.items():
+            items = ' '.join(f'BODY.PEEK[{section}]<0.{cap}>' for section in sections)
+            typ, msg_data = imap.uid('FETCH', compress_uid_set(uids), f'({items})')
+            if typ != 'OK':
+                raise imaplib.IMAP4.error(f"FETCH failed: {msg_data}")
+            for attributes in parse_fetch_response(msg_data):
+                for name, value in attributes.items():
+                    if name.startswith('BODY[') and isinstance(value, bytes):
+                        section = name[len('BODY['):name.index(']')]
+                        bodies.setdefault(attributes['UID'], {})[section] = value
+
+        IMAP_FETCH_BYTES.inc(sum(len(header) for header in headers.values()) +
+                             sum(len(body) for sections in bodies.values() for body in sections.values()),
+                             mailbox=self.config.email_address)
+        messages = []
+        for uid, header in headers.items():
+            msg = email.message_from_bytes(header)
+            del msg['Content-Type']
+            del msg['Content-Transfer-Encoding']
+            sections = []
+            for text_part in text_parts.get(uid, []):
+                body = bodies.get(uid, {}).get(text_part['section'], b'')
+                if len(body) >= cap:
+                    # Drop the partial last line so truncated base64/QP still decodes
+                    body = body[:body.rfind(b'\n') + 1] or body
+                    logging.info(f"Email UID {uid} section {text_part['section']} truncated to {len(body)} bytes")
+                section = Message()
+                section['Content-Type'] = f'text/{text_part["subtype"]}; charset="{text_part["charset"]}"'
+                section['Content-Transfer-Encoding'] = text_part['encoding']
+                section.set_payload(body.decode('ascii', 'surrogateescape'))
+                sections.append(section)
+
+            # Rebuild the message from just the chosen text sections
+            if len(sections) == 1:
+                msg['Content-Type'] = sections[0]['Content-Type']
+                msg['Content-Transfer-Encoding'] = sections[0]['Content-Transfer-Encoding']
+                msg.set_payload(sections[0].get_payload())
+            elif sections:
+                msg['Content-Type'] = 'multipart/mixed'
+                msg.set_payload(sections)
+            else:
+                msg.set_payload('')
+            messages.append((uid, msg, received[uid]))
+        return messages
+
+    def _fetch_new_emails(self, imap, parse: bool = True) -> List[Dict]:
+        """
+        Fetch and mark emails newer than the sync checkpoint on an open connection.
+
+        The position reached is only recorded as pending; until commit_checkpoint()
+        applies it, the next check fetches the same emails again.
+        """
         new_emails = []
+        handed_out = set()
+        self.failed_emails = []
+        self._pending_uid = None
+        with IMAP_SEARCH_SECONDS.time(mailbox=self.config.email_address):
+            uids, anchor_uid = self._search_new_uids(imap)
+        if self._uncommitted_uids:
+            uids = sorted(set(uids) | self._uncommitted_uids)
+        fetched_uid = None
+
+        # One FETCH and one STORE per batch instead of two round trips per message
         try:
-            # Connect to IMAP server
-            imap = self._connect_imap()
-            
-            # Select inbox
-            imap.select('INBOX')
-
-            # Search for unread emails
-            _, message_numbers = imap.search(None, 'UNSEEN')
-            
-            for num in message_numbers[0].split():
+            for batch in chunked(uids, self.config.fetch_batch_size):
                 try:
-                    # Fetch email message
-                    _, msg_data = imap.fetch(num, '(RFC822)')
-                    email_body = msg_data[0][1]
-                    msg = email.message_from_bytes(email_body)
-                    
-                    # Get message ID
-                    message_id = msg['message-id']
-                    
-                    # Skip if already processed
-                    if message_id in self._processed_ids:
+                    with IMAP_FETCH_SECONDS.time(mailbox=self.config.email_address):
+                        if self.config.fetch_mode == 'full':
+                            messages = self._fetch_full_messages(imap, batch)
+                        else:
+                            messages = self._fetch_text_messages(imap, batch)
+                    IMAP_FETCHED_MESSAGES.inc(len(messages), mailbox=self.config.email_address)
+                except imaplib.IMAP4.error as e:
+                    logging.error(f"Failed to fetch batch of {len(batch)} emails: {str(e)}")
+                    break
+
+                seen_uids = []
+                for uid, msg, received_at in messages:
+                    try:
+                        if parse:
+                            with PARSE_SECONDS.time():
+                                email_data = self._parse_email(msg)
+                        else:
+                            # Headers only; the body is parsed by whoever takes the raw message
+                            email_data = EmailParser.parse_headers(msg)
+                            email_data['raw'] = base64.b64encode(msg.as_bytes()).decode('ascii')
+                        email_data['uid'] = uid
+                        # Arrival in the mailbox, for the end-to-end latency
+                        email_data['received_at'] = received_at or parse_date_header(email_data['date'])
+                        email_data['uidvalidity'] = self._uidvalidity
+                        email_data['mailbox'] = self.checkpoint.mailbox_key
+                        seen_uids.append(uid)
+
+                        if self.processed.is_processed(email_data):
+                            logging.info(f"Skipping already answered email: {email_data['subject']}")
+                            continue
+                        new_emails.append(email_data)
+                        handed_out.add(uid)
+
+                        logging.info(f"Processed new email: {email_data['subject']}")
+
+                    except Exception as e:
+                        logging.error(f"Error processing individual email UID {uid}: {str(e)}")
+                        self.failed_emails.append(self._failed_email(msg, uid, e))
+                        handed_out.add(uid)
                         continue
-                    
-                    # Parse email
-                    email_data = self._parse_email(msg)
-                    
-                    # Add to processed set
-                    self._processed_ids.add(message_id)
-                    new_emails.append(email_data)
-                    
-                    # Mark as read
-                    imap.store(num, '+FLAGS', '\\Seen')
-                    
-                    logging.info(f"Processed new email: {email_data['subject']}")
-                    
-                except Exception as e:
-                    logging.error(f"Error processing individual email: {str(e)}")
-                    continue
-            
-            imap.logout()
-            
+
+                # Mark the whole batch as read
+                if seen_uids:
+                    imap.uid('STORE', compress_uid_set(seen_uids), '+FLAGS', '(\\Seen)')
+
+                fetched_uid = max(batch)
+            else:
+                # Every batch succeeded, so a bootstrap search can jump to the newest UID
+                if anchor_uid is not None:
+                    fetched_uid = anchor_uid
+
+        except (imaplib.IMAP4.abort, OSError) as e:
+            if not new_emails:
+                raise
+            # Hand out what was already fetched, the next check reconnects
+            logging.warning(f"IMAP connection lost after {len(new_emails)} emails: {str(e)}")
+            self.close()
+
+        # A partial bootstrap leaves the checkpoint unset so unread mail is searched again
+        if fetched_uid is not None and (anchor_uid is None or fetched_uid == anchor_uid):
+            self._pending_uid = fetched_uid
+        self._uncommitted_uids |= handed_out
+        self._last_check_uids = handed_out
+
+        return new_emails
+
+    def commit_checkpoint(self):
+        """Move the sync checkpoint past the emails of the last check and persist it."""
+        if self._pending_uid is not None:
+            self.checkpoint.update(self._uidvalidity, self._pending_uid)
+            self.checkpoint.save()
+            self._pending_uid = None
+        self._uncommitted_uids -= self._last_check_uids
+        self._last_check_uids = set()
+
+    def check_new_emails(self, commit: bool = True, parse: bool = True) -> List[Dict]:
+        """
+        Check for emails that arrived since the last check.
+
+        Args:
+            commit: Persist the new sync checkpoint immediately. Callers that hand the
+                    emails to another durable stage pass False and call commit_checkpoint()
+                    once they are stored; without it the next check returns them again.
+            parse: Parse the bodies. With False only the headers are decoded and the
+                   message is kept base64-encoded in 'raw', see parse_received_email().
+        """
+        try:
+            try:
+                new_emails = self._fetch_new_emails(self._get_connection(), parse)
+            except (imaplib.IMAP4.abort, OSError) as e:
+                # The server dropped the cached connection, reconnect once
+                logging.warning(f"IMAP connection lost ({str(e)}), reconnecting...")
+                self.close()
+                new_emails = self._fetch_new_emails(self._get_connection(), parse)
+
         except Exception as e:
             logging.error(f"Error checking emails: {str(e)}")
+            self.close()
             raise
-            
-        return new_emails
\ No newline at end of file
+
+        if commit:
+            self.commit_checkpoint()
+        return new_emails
+
+    def _read_idle_line(self, imap, buffer: bytearray, deadline: float) -> Optional[bytes]:
+        """Read one response line while in IDLE, or return None once the deadline passes."""
+        while b'\r\n' not in buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            # SSL sockets may hold decrypted bytes that select() cannot see
+            pending = imap.sock.pending() if isinstance(imap.sock, ssl.SSLSocket) else 0
+            if not pending:
+                readable, _, _ = select.select([imap.sock], [], [], remaining)
+                if not readable:
+                    return None
+            try:
+                chunk = imap.sock.recv(4096)
+            except ssl.SSLWantReadError:
+                continue
+            if not chunk:
+                raise imaplib.IMAP4.abort("Connection closed by server during IDLE")
+            buffer.extend(chunk)
+
+        line, _, rest = bytes(buffer).partition(b'\r\n')
+        buffer[:] = rest
+        return line
+
+    def wait_for_new_mail(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block in IMAP IDLE until the server reports new mail or the timeout expires.
+
+        Args:
+            timeout: Maximum seconds to stay in IDLE (default: config.imap_idle_timeout).
+                     Kept below the server's 30 minute limit so IDLE is re-issued in time.
+
+        Returns:
+            True if new mail was announced, False if the timeout expired.
+        """
+        if timeout is None:
+            timeout = self.config.imap_idle_timeout
+
+        imap = self._get_connection()
+        # imaplib keeps "* n EXISTS" received during the last check's SEARCH/FETCH/STORE;
+        # the server does not announce that mail again once IDLE starts
+        announced = [imap.untagged_responses.pop(name, None) for name in ('EXISTS', 'RECENT')]
+        if any(announced):
+            logging.info("New mail arrived during the last check")
+            return True
+
+        tag = imap._new_tag()
+        buffer = bytearray()
+        new_mail = False
+        finished = False
+
+        self._idling = True
+        try:
+            imap.send(tag + b' IDLE\r\n')
+            line = self._read_idle_line(imap, buffer, time.monotonic() + 30)
+            if line is None or not line.startswith(b'+'):
+                raise imaplib.IMAP4.error(f"Server refused IDLE: {line!r}")
+
+            logging.debug("Entered IMAP IDLE")
+            deadline = time.monotonic() + timeout
+            while True:
+                line = self._read_idle_line(imap, buffer, deadline)
+                if line is None:
+                    break
+                # Untagged "* <n> EXISTS" means a message arrived in the mailbox
+                if line.startswith(b'*') and line.upper().endswith((b'EXISTS', b'RECENT')):
+                    new_mail = True
+                    break
+
+            imap.send(b'DONE\r\n')
+            while True:
+                line = self._read_idle_line(imap, buffer, time.monotonic() + 30)
+                if line is None:
+                    raise imaplib.IMAP4.abort("Timed out waiting for IDLE to finish")
+                if line.startswith(tag):
+                    if b' OK' not in line.upper():
+                        raise imaplib.IMAP4.error(f"IDLE failed: {line!r}")
+                    break
+            finished = True
+
+        except Exception as e:
+            logging.error(f"Error during IMAP IDLE: {str(e)}")
+            raise
+
+        finally:
+            self._idling = False
+            # Interrupted mid-IDLE (error, shutdown or Ctrl+C): the session is unusable
+            if not finished:
+                self._drop_connection()
+
+        if new_mail:
+            logging.info("IMAP IDLE: new mail announced by server")
+        return new_mail
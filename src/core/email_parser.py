@@ -4,12 +4,110 @@ Email parsing module for handling different email formats and content types.
 
 import email
 from email.header import decode_header
-from typing import Dict
+from typing import Dict, List, Optional, Tuple
 import logging
-from bs4 import BeautifulSoup
+from html.parser import HTMLParser
 import re
-import quopri
-import base64
+
+# Reply headers: "On Mon, 1 Jan 2024, Anna <a@b.de> wrote:" / "Am 01.01.2024 um 10:00 schrieb Anna:"
+_REPLY_HEADER_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in [
+    r'^On\s.{0,250}\swrote:\s*$',
+    r'^Am\s.{0,250}\sschrieb\s?.{0,250}:\s*$',
+]]
+# Lines after which everything is quoted history, a signature or a disclaimer
+_CUT_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in [
+    # Original / forwarded message separators
+    r'^-{2,}\s*(Original Message|Ursprüngliche Nachricht|Originalnachricht|Forwarded message|'
+    r'Weitergeleitete Nachricht)\s*-{2,}\s*$',
+    r'^(Begin forwarded message|Anfang der weitergeleiteten Nachricht|Beginn der weitergeleiteten Nachricht):?\s*$',
+    # Signature delimiter "-- "
+    r'^--\s?$',
+    # Mobile signatures
+    r'^(Sent from my|Sent from Outlook|Get Outlook for|Von meinem .{1,40} gesendet|Gesendet von meinem)',
+    # Legal disclaimers
+    r'^(CONFIDENTIALITY NOTICE|DISCLAIMER|This e-?mail (message )?(and any attachments )?(is|are|may be|contains) '
+    r'(confidential|privileged|intended))',
+    r'^(Diese E-?Mail (enthält|kann|ist)|Der Inhalt dieser E-?Mail|Vertraulichkeitshinweis|Haftungsausschluss)',
+]]
+# Outlook-style header block: "From:/Von:" followed shortly by "Sent:/Gesendet:/Date:/Datum:"
+_HEADER_FROM_RE = re.compile(r'^\*?(From|Von):\*?\s', re.IGNORECASE)
+_HEADER_SENT_RE = re.compile(r'^\*?(Sent|Gesendet|Date|Datum|To|An):\*?\s', re.IGNORECASE)
+_OUTLOOK_SEPARATOR_RE = re.compile(r'^_{10,}\s*$')
+
+class _HTMLTextExtractor(HTMLParser):
+    """
+    Single-pass HTML to text conversion without building a document tree.
+
+    Scripts, styles and the head are dropped, links become "text (href)" and
+    <br>/<p> become line breaks. Comments are ignored by the parser.
+    """
+    _SKIPPED = {'script', 'style', 'head'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._parts: List[str] = []
+        self._skip_depth = 0
+        # Text and href of the link currently being read
+        self._link_parts: Optional[List[str]] = None
+        self._link_href = ''
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._SKIPPED:
+            self._skip_depth += 1
+        elif tag == 'body':
+            # An unclosed <head> must not swallow the body
+            self._skip_depth = 0
+        elif self._skip_depth:
+            return
+        elif tag == 'a':
+            self._link_parts = []
+            self._link_href = dict(attrs).get('href') or ''
+        elif tag in ('br', 'p') and self._link_parts is None:
+            self._parts.append('\n')
+
+    def handle_startendtag(self, tag, attrs):
+        if tag == 'a':
+            # <a href="..."/> has no text and stands for its href
+            self.handle_starttag(tag, attrs)
+            self.handle_endtag(tag)
+        else:
+            self.handle_starttag(tag, attrs)
+            if tag in self._SKIPPED:
+                self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self._SKIPPED:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif self._skip_depth:
+            return
+        elif tag == 'a' and self._link_parts is not None:
+            text = ''.join(self._link_parts).strip()
+            href = self._link_href
+            # Only keep the link if it's different from the text
+            if href and text and href != text:
+                self._parts.append(f"{text} ({href})")
+            else:
+                self._parts.append(text or href)
+            self._link_parts = None
+        elif tag == 'p' and self._link_parts is None:
+            self._parts.append('\n')
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        if self._link_parts is not None:
+            self._link_parts.append(data)
+        else:
+            self._parts.append(data)
+
+    def close(self):
+        super().close()
+        if self._link_parts is not None:
+            # Unclosed link at the end of the document
+            self.handle_endtag('a')
+
+    def get_text(self) -> str:
+        return ''.join(self._parts)
 
 class EmailParser:
     @staticmethod
@@ -30,72 +128,142 @@ class EmailParser:
         return ' '.join(decoded_parts)
 
     @staticmethod
-    def decode_payload(part) -> str:
-        """Decode email payload handling various encodings."""
-        content = ""
-        if part.get('Content-Transfer-Encoding') == 'base64':
-            try:
-                payload = part.get_payload(decode=True)
-                if payload:
-                    charset = part.get_content_charset() or 'utf-8'
-                    content = payload.decode(charset, 'replace')
-            except:
-                try:
-                    content = base64.b64decode(part.get_payload()).decode('utf-8', 'replace')
-                except:
-                    content = part.get_payload()
-        elif part.get('Content-Transfer-Encoding') == 'quoted-printable':
-            try:
-                payload = part.get_payload(decode=True)
-                if payload:
-                    charset = part.get_content_charset() or 'utf-8'
-                    content = payload.decode(charset, 'replace')
-            except:
-                try:
-                    content = quopri.decodestring(part.get_payload().encode()).decode('utf-8', 'replace')
-                except:
-                    content = part.get_payload()
-        else:
+    def decode_payload(part, max_bytes: Optional[int] = None) -> str:
+        """
+        Decode a leaf MIME part to text.
+
+        The transfer encoding (base64, quoted-printable) is undone once, then the
+        bytes are decoded with the declared charset, falling back to UTF-8 and
+        Windows-1252 for mislabeled or unknown charsets.
+
+        Args:
+            part: The email.message.Message of a single part
+            max_bytes: Decode at most this many bytes, cut at the last full line
+        """
+        payload = part.get_payload(decode=True)
+        if payload is None:
+            payload = part.get_payload()
+            return payload.strip() if isinstance(payload, str) else ""
+
+        if max_bytes is not None and len(payload) > max_bytes:
+            payload = payload[:max_bytes]
+            payload = payload[:payload.rfind(b'\n') + 1] or payload
+
+        declared = part.get_content_charset()
+        for charset in (declared, 'utf-8'):
+            if not charset:
+                continue
             try:
-                payload = part.get_payload(decode=True)
-                if payload:
-                    charset = part.get_content_charset() or 'utf-8'
-                    content = payload.decode(charset, 'replace')
-            except:
-                content = part.get_payload()
-                
-        return content.strip()
+                return payload.decode(charset).strip()
+            except (LookupError, UnicodeDecodeError):
+                continue
+        return payload.decode('windows-1252', 'replace').strip()
+
+    @staticmethod
+    def _is_attachment(part) -> bool:
+        return part.get_content_disposition() == 'attachment'
+
+    @staticmethod
+    def extract_text(part, max_part_bytes: Optional[int] = None) -> List[str]:
+        """
+        Collect the readable text of a message in one walk of its MIME tree.
+
+        Each part is visited once. Within multipart/alternative only the best
+        alternative is decoded (plain text over nested multiparts over HTML);
+        other multiparts contribute the text of all their inline children.
+        Attachments and non-text parts are skipped without being decoded.
+
+        Args:
+            part: The message or part to extract
+            max_part_bytes: Cap on the decoded size of each part
+        """
+        if part.is_multipart():
+            children = [child for child in part.get_payload() if not EmailParser._is_attachment(child)]
+            if part.get_content_subtype() == 'alternative':
+                rank = {'text/plain': 0, 'text/html': 2}
+                children.sort(key=lambda child: rank.get(child.get_content_type(),
+                                                         1 if child.is_multipart() else 3))
+                for child in children:
+                    texts = EmailParser.extract_text(child, max_part_bytes)
+                    if texts:
+                        return texts
+                return []
+
+            texts = []
+            for child in children:
+                texts.extend(EmailParser.extract_text(child, max_part_bytes))
+            return texts
+
+        content_type = part.get_content_type()
+        if EmailParser._is_attachment(part) or content_type not in ('text/plain', 'text/html'):
+            return []
+        content = EmailParser.decode_payload(part, max_part_bytes)
+        if content_type == 'text/html':
+            content = EmailParser.clean_html(content)
+        return [content] if content else []
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """Rough LLM token count (about four characters per token)."""
+        return (len(text) + 3) // 4
+
+    @staticmethod
+    def _find_cut_line(lines: List[str]) -> int:
+        """Return the index of the first line that starts quoted history or a signature."""
+        for index, line in enumerate(lines):
+            stripped = line.strip()
+            if not stripped:
+                continue
+
+            # Reply headers are often wrapped over two lines by the sending client
+            joined = stripped
+            if index + 1 < len(lines):
+                joined = f"{stripped} {lines[index + 1].strip()}"
+            if any(pattern.match(stripped) or pattern.match(joined) for pattern in _REPLY_HEADER_PATTERNS):
+                return index
+            if any(pattern.match(stripped) for pattern in _CUT_PATTERNS):
+                return index
+
+            if _HEADER_FROM_RE.match(stripped) or _OUTLOOK_SEPARATOR_RE.match(stripped):
+                following = [l.strip() for l in lines[index + 1:index + 5]]
+                if any(_HEADER_SENT_RE.match(l) for l in following):
+                    return index
+        return len(lines)
+
+    @staticmethod
+    def strip_quoted_content(text: str) -> Tuple[str, Dict]:
+        """
+        Remove quoted history, forwarded headers, signatures and disclaimers.
+
+        Returns:
+            The new content and stats with the characters and estimated tokens saved.
+            If stripping would leave nothing (e.g. a bare forward), the text is kept.
+        """
+        if not text:
+            return text, {'chars_saved': 0, 'tokens_saved': 0}
+
+        lines = text.splitlines()
+        lines = lines[:EmailParser._find_cut_line(lines)]
+        # Drop remaining "> quoted" lines, e.g. from inline replies
+        lines = [line for line in lines if not line.lstrip().startswith('>')]
+        stripped = '\n'.join(lines).strip()
+
+        if not stripped:
+            stripped = text
+        chars_saved = max(0, len(text) - len(stripped))
+        return stripped, {
+            'chars_saved': chars_saved,
+            'tokens_saved': EmailParser.estimate_tokens(text) - EmailParser.estimate_tokens(stripped)
+        }
 
     @staticmethod
     def clean_html(html_content: str) -> str:
         """Clean HTML content and extract readable text."""
         try:
-            # Remove HTML comments
-            html_content = re.sub(r'<!--.*?-->', '', html_content, flags=re.DOTALL)
-            
-            # Create BeautifulSoup object
-            soup = BeautifulSoup(html_content, 'html.parser')
-            
-            # Remove unwanted tags
-            for tag in soup(['script', 'style', 'meta', 'link', 'head']):
-                tag.decompose()
-                
-            # Handle special cases for links
-            for a in soup.find_all('a'):
-                href = a.get('href', '')
-                text = a.get_text().strip()
-                # Only keep the link if it's different from the text
-                if href and text and href != text:
-                    a.replace_with(f"{text} ({href})")
-                else:
-                    a.replace_with(text or href)
-            
-            # Replace line breaks with newlines
-            for br in soup.find_all(['br', 'p']):
-                br.replace_with('\n' + br.get_text() + '\n')
-            
-            # Get text and clean it
-            text = soup.get_text()
+            extractor = _HTMLTextExtractor()
+            extractor.feed(html_content)
+            extractor.close()
+            text = extractor.get_text()
             
             # Clean up whitespace and empty lines
             lines = []
@@ -114,50 +282,31 @@ class EmailParser:
             return text.strip()
 
     @staticmethod
-    def parse_email_message(msg) -> Dict:
-        """Parse email message into a structured format."""
-        email_data = {
-            'subject': '',
-            'from': '',
-            'to': '',
-            'date': '',
+    def parse_headers(msg) -> Dict:
+        """Decode the headers used for whitelisting, deduplication and replying; the body stays empty."""
+        return {
+            'subject': EmailParser.decode_email_field(msg.get('subject', '')),
+            'from': EmailParser.decode_email_field(msg.get('from', '')),
+            'to': EmailParser.decode_email_field(msg.get('to', '')),
+            'date': msg.get('date', ''),
             'body': '',
-            'message_id': ''
+            'message_id': msg.get('message-id', '')
         }
-        
-        # Parse headers
-        email_data['subject'] = EmailParser.decode_email_field(msg.get('subject', ''))
-        email_data['from'] = EmailParser.decode_email_field(msg.get('from', ''))
-        email_data['to'] = EmailParser.decode_email_field(msg.get('to', ''))
-        email_data['date'] = msg.get('date', '')
-        email_data['message_id'] = msg.get('message-id', '')
+
+    @staticmethod
+    def parse_email_message(msg, strip_quotes: bool = True, max_part_bytes: Optional[int] = None) -> Dict:
+        """
+        Parse email message into a structured format.
+
+        Args:
+            msg: The email.message.Message to parse
+            strip_quotes: Remove quoted history and signatures from the body
+            max_part_bytes: Cap on the decoded size of each text part
+        """
+        email_data = EmailParser.parse_headers(msg)
 
         # Extract body content
-        text_content = []
-        
-        if msg.is_multipart():
-            # First pass: look for text/plain parts
-            for part in msg.walk():
-                if part.get_content_type() == 'text/plain':
-                    content = EmailParser.decode_payload(part)
-                    if content:
-                        text_content.append(content)
-            
-            # Second pass: if no text/plain found, look for text/html
-            if not text_content:
-                for part in msg.walk():
-                    if part.get_content_type() == 'text/html':
-                        content = EmailParser.decode_payload(part)
-                        if content:
-                            cleaned_content = EmailParser.clean_html(content)
-                            if cleaned_content:
-                                text_content.append(cleaned_content)
-        else:
-            content = EmailParser.decode_payload(msg)
-            if msg.get_content_type() == 'text/html':
-                content = EmailParser.clean_html(content)
-            if content:
-                text_content.append(content)
+        text_content = EmailParser.extract_text(msg, max_part_bytes)
         
         # Combine and clean up content
         if text_content:
@@ -169,4 +318,16 @@ class EmailParser:
             filtered_lines = [line for line in lines if line and not line.startswith(('http://', 'https://'))]
             email_data['body'] = '\n'.join(filtered_lines).strip()
             
+        if strip_quotes:
+            EmailParser.apply_quote_stripping(email_data)
+        return email_data
+
+    @staticmethod
+    def apply_quote_stripping(email_data: Dict) -> Dict:
+        """Strip quoted content from email_data['body'] and record what was saved."""
+        email_data['body'], stats = EmailParser.strip_quoted_content(email_data['body'])
+        email_data.update(stats)
+        if stats['chars_saved']:
+            logging.info(f"Stripped {stats['chars_saved']} characters (~{stats['tokens_saved']} tokens) "
+                         f"of quoted history/signature from '{email_data['subject']}'")
         return email_data
\ No newline at end of file
@@ -0,0 +1,256 @@
+"""
+IMAP helper functions for batched UID commands and FETCH response parsing.
+"""
+
+import imaplib
+import re
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+# Marker used to splice literals back into the response text while tokenizing
+_LITERAL_MARKER = '\x00'
+_LITERAL_RE = re.compile(rb'\{(\d+)\}$')
+_MESSAGE_START_RE = re.compile(rb'^\d+ \(')
+
+
+def chunked(items: List, size: int) -> Iterator[List]:
+    """Yield successive chunks of at most `size` items."""
+    size = max(1, int(size))
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def compress_uid_set(uids: Iterable[int]) -> str:
+    """Build a compact IMAP sequence set such as '1:4,7,9:10' from UIDs."""
+    ranges = []
+    for uid in sorted(set(int(u) for u in uids)):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ','.join(str(lo) if lo == hi else f"{lo}:{hi}" for lo, hi in ranges)
+
+
+def _tokenize(text: str, literals: List[bytes]):
+    """Parse a FETCH attribute list into nested Python lists."""
+    stack = [[]]
+    i = 0
+    length = len(text)
+    while i < length:
+        char = text[i]
+        if char in ' \r\n':
+            i += 1
+        elif char == '(':
+            stack.append([])
+            i += 1
+        elif char == ')':
+            if len(stack) > 1:
+                done = stack.pop()
+                stack[-1].append(done)
+            i += 1
+        elif char == '"':
+            i += 1
+            value = []
+            while i < length and text[i] != '"':
+                if text[i] == '\\' and i + 1 < length:
+                    i += 1
+                value.append(text[i])
+                i += 1
+            stack[-1].append(''.join(value).encode('utf-8', 'surrogateescape'))
+            i += 1
+        elif char == _LITERAL_MARKER:
+            end = text.index(_LITERAL_MARKER, i + 1)
+            stack[-1].append(literals[int(text[i + 1:end])])
+            i = end + 1
+        else:
+            start = i
+            depth = 0
+            while i < length:
+                char = text[i]
+                if char == '[':
+                    depth += 1
+                elif char == ']':
+                    depth -= 1
+                elif depth == 0 and char in ' ()':
+                    break
+                i += 1
+            atom = text[start:i]
+            if atom.upper() == 'NIL':
+                stack[-1].append(None)
+            elif atom.isdigit():
+                stack[-1].append(int(atom))
+            else:
+                stack[-1].append(atom)
+    while len(stack) > 1:
+        done = stack.pop()
+        stack[-1].append(done)
+    return stack[0]
+
+
+def _to_attributes(items: List) -> Dict[str, Union[int, bytes, list, None]]:
+    """Turn a flat FETCH list [name, value, name, value, ...] into a dict."""
+    attributes = {}
+    for index in range(0, len(items) - 1, 2):
+        name = items[index]
+        if isinstance(name, str):
+            attributes[name.upper()] = items[index + 1]
+    return attributes
+
+
+def parse_fetch_response(data: List) -> List[Dict[str, Union[int, bytes, list, None]]]:
+    """
+    Parse the data returned by imaplib for a (UID) FETCH command.
+
+    imaplib splits each literal into a (prefix, literal) tuple and leaves the
+    remaining text as plain bytes, so a single message may span several items.
+
+    Returns:
+        One attribute dict per message, e.g. {'UID': 12, 'RFC822': b'...'}
+    """
+    messages: List[Tuple[List[str], List[bytes]]] = []
+
+    for item in data:
+        if item is None:
+            continue
+        if isinstance(item, tuple):
+            prefix, literal = item[0], item[1]
+        else:
+            prefix, literal = item, None
+
+        if _MESSAGE_START_RE.match(prefix) or not messages:
+            messages.append(([], []))
+        text_parts, literals = messages[-1]
+
+        if literal is not None:
+            prefix = _LITERAL_RE.sub(b'', prefix)
+            literals.append(literal)
+            text_parts.append(prefix.decode('utf-8', 'surrogateescape'))
+            text_parts.append(f"{_LITERAL_MARKER}{len(literals) - 1}{_LITERAL_MARKER}")
+        else:
+            text_parts.append(prefix.decode('utf-8', 'surrogateescape'))
+
+    results = []
+    for text_parts, literals in messages:
+        text = ''.join(text_parts)
+        # Drop the leading message sequence number
+        text = text.split(' ', 1)[1] if ' ' in text else text
+        tokens = _tokenize(text, literals)
+        if tokens and isinstance(tokens[0], list):
+            results.append(_to_attributes(tokens[0]))
+    return results
+
+
+def parse_internaldate(value: Optional[bytes]) -> Optional[float]:
+    """Convert an INTERNALDATE such as b'17-Jul-1996 02:44:25 -0700' to a Unix timestamp."""
+    if not value:
+        return None
+    parsed = imaplib.Internaldate2tuple(b'INTERNALDATE "' + value + b'"')
+    return time.mktime(parsed) if parsed else None
+
+
+def parse_date_header(value: str) -> Optional[float]:
+    """Convert an RFC 5322 Date header to a Unix timestamp, or None if it is malformed."""
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def _text(value) -> str:
+    """Decode a BODYSTRUCTURE string field."""
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    return value or ''
+
+
+def _params(value) -> Dict[str, str]:
+    """Turn a BODYSTRUCTURE parameter list into a lower-cased dict."""
+    if not isinstance(value, list):
+        return {}
+    return {_text(value[i]).lower(): _text(value[i + 1]) for i in range(0, len(value) - 1, 2)}
+
+
+def _is_attachment(part: list, disposition_index: int) -> bool:
+    """Check the disposition extension field of a single-part body."""
+    if len(part) <= disposition_index or not isinstance(part[disposition_index], list):
+        return False
+    disposition = part[disposition_index]
+    return bool(disposition) and _text(disposition[0]).lower() == 'attachment'
+
+
+def _collect_text_parts(structure: list, section: str) -> List[Dict]:
+    """
+    Walk a parsed BODYSTRUCTURE the way EmailParser.extract_text walks the MIME tree.
+
+    Every inline text part of a multipart counts, except within multipart/alternative,
+    where only the best alternative does (plain text over nested multiparts over HTML).
+    """
+    if structure and isinstance(structure[0], list):
+        # Multipart: children first, then the subtype and extension data
+        children = []
+        subtype = ''
+        for child in structure:
+            if not isinstance(child, list):
+                subtype = _text(child).lower()
+                break
+            index = len(children) + 1
+            children.append((child, f"{section}.{index}" if section else str(index)))
+
+        if subtype == 'alternative':
+            def rank(entry):
+                child = entry[0]
+                if child and isinstance(child[0], list):
+                    return 1
+                return {'text/plain': 0, 'text/html': 2}.get(f"{_text(child[0])}/{_text(child[1])}".lower(), 3)
+
+            for child, child_section in sorted(children, key=rank):
+                parts = _collect_text_parts(child, child_section)
+                if parts:
+                    return parts
+            return []
+
+        found = []
+        for child, child_section in children:
+            found.extend(_collect_text_parts(child, child_section))
+        return found
+
+    maintype = _text(structure[0]).lower()
+    subtype = _text(structure[1]).lower()
+    if (maintype, subtype) == ('message', 'rfc822'):
+        # Forwarded inline: envelope, body and line count follow the basic fields. The
+        # embedded body's parts are numbered below this section, a single part as ".1"
+        if len(structure) <= 8 or not isinstance(structure[8], list) or _is_attachment(structure, 11):
+            return []
+        body = structure[8]
+        section = section or '1'
+        if body and isinstance(body[0], list):
+            return _collect_text_parts(body, section)
+        return _collect_text_parts(body, f"{section}.1")
+    if maintype != 'text' or subtype not in ('plain', 'html'):
+        return []
+    # Text bodies carry a line count before the extension fields
+    if _is_attachment(structure, 9):
+        return []
+    return [{
+        'section': section or '1',
+        'subtype': subtype,
+        'charset': _params(structure[2]).get('charset', 'utf-8'),
+        'encoding': _text(structure[5]).lower() or '7bit',
+        'size': structure[6] if isinstance(structure[6], int) else 0
+    }]
+
+
+def find_text_parts(structure: list) -> List[Dict]:
+    """
+    Pick the body sections to download from a parsed BODYSTRUCTURE.
+
+    These are the inline text parts a full download would be read from: all of them
+    in a multipart/mixed message, one per multipart/alternative, including those of
+    messages forwarded inline.
+
+    Returns:
+        Section number, subtype, charset, transfer encoding and size of each part,
+        in message order
+    """
+    return _collect_text_parts(structure, '')
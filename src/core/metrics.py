@@ -0,0 +1,414 @@
+"""
+Counters, gauges and histograms of every pipeline stage, served on a local
+HTTP endpoint in the Prometheus text exposition format.
+"""
+
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Seconds; from a local parse up to a slow LLM generation
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# (name, type, help, [(labels, value)]) reported by a collector at scrape time
+MetricFamily = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[tuple, object] = {}
+
+    def _key(self, labels: Dict) -> tuple:
+        if len(labels) != len(self.label_names) or any(name not in labels for name in self.label_names):
+            raise ValueError(f"{self.name} expects labels {list(self.label_names)}, got {sorted(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _labels(self, key: tuple) -> Dict[str, str]:
+        return dict(zip(self.label_names, key))
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """(sample name, labels, value) of every label combination seen so far."""
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        """Add a non-negative amount."""
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        """Count one observation in its bucket."""
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (the last one is +Inf), sum, count
+                state = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._values[key] = state
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with block in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[2] if state else 0
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                labels = self._labels(key)
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    samples.append((f"{self.name}_bucket", dict(labels, le=_format_value(bound)), cumulative))
+                samples.append((f"{self.name}_sum", labels, total))
+                samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """Initialize an empty registry."""
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: Dict[str, Callable[[], Iterable[MetricFamily]]] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, help_text: str, labels: Sequence[str], **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, help_text, labels, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, cls) or metric.label_names != tuple(labels):
+                raise ValueError(f"Metric {name} is already registered with another type or labels")
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        """Return the counter of this name, creating it on first use."""
+        return self._register(Counter, name, help_text, labels)
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Gauge:
+        """Return the gauge of this name, creating it on first use."""
+        return self._register(Gauge, name, help_text, labels)
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """Return the histogram of this name, creating it on first use."""
+        return self._register(Histogram, name, help_text, labels, buckets=buckets)
+
+    def add_collector(self, key: str, collector: Callable[[], Iterable[MetricFamily]]):
+        """
+        Register a function that reports values read at scrape time, e.g. queue sizes.
+
+        Args:
+            key: Identifies the collector; registering the same key again replaces it
+            collector: Returns (name, type, help, [(labels, value)]) tuples
+        """
+        with self._lock:
+            self._collectors[key] = collector
+
+    def remove_collector(self, key: str):
+        with self._lock:
+            self._collectors.pop(key, None)
+
+    def render(self) -> str:
+        """All metrics in the text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.items())
+
+        # Families reported by several collectors (one per mailbox) are merged
+        families: Dict[str, list] = {}
+        for metric in metrics:
+            families[metric.name] = [metric.kind, metric.help, metric.samples()]
+        for key, collector in collectors:
+            try:
+                for name, kind, help_text, values in collector():
+                    family = families.setdefault(name, [kind, help_text, []])
+                    family[2].extend((name, labels, value) for labels, value in values)
+            except Exception as e:
+                logging.error(f"Metrics collector {key} failed: {str(e)}")
+
+        lines = []
+        for name, (kind, help_text, samples) in families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+class MetricsServer:
+    def __init__(self, registry: MetricsRegistry = REGISTRY, host: str = '127.0.0.1', port: int = 9108):
+        """
+        Initialize the endpoint.
+
+        Args:
+            registry: Metrics to serve
+            host: Interface to listen on; the default keeps the metrics local
+            port: TCP port, 0 for any free one
+        """
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def start(self):
+        """Serve GET /metrics from a background thread."""
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Scrapes every few seconds would flood the application log
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+        logging.info(f"Metrics available at http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def start_metrics_server(host: str, port: int) -> Optional[MetricsServer]:
+    """Start the endpoint if a port is configured; a failure is logged, never fatal."""
+    if not port:
+        return None
+    try:
+        server = MetricsServer(REGISTRY, host, port)
+        server.start()
+        return server
+    except Exception as e:
+        logging.error(f"Could not start metrics endpoint on {host}:{port}: {str(e)}")
+        return None
+
+
+_RATE_LIMIT_FAMILIES = (
+    ('rate_per_minute', "email_rate_limit_per_minute", "gauge", "Configured rate limit"),
+    ('available', "email_rate_limit_available", "gauge", "Tokens available for immediate use"),
+    ('debt', "email_rate_limit_debt", "gauge", "Tokens reserved by callers still waiting"),
+    ('throttled_total', "email_rate_limit_throttled_total", "counter", "Calls that had to wait"),
+    ('wait_seconds_total', "email_rate_limit_wait_seconds_total", "counter",
+     "Total time callers waited for the limiter"),
+)
+
+
+def _rate_limit_families(buckets: List[Tuple[Dict[str, str], Dict]]) -> List[MetricFamily]:
+    """Families for TokenBucket snapshots, each labeled with its bucket name as "limiter"."""
+    samples = [(dict(labels, limiter=stats['name']), stats) for labels, stats in buckets]
+    return [(name, kind, help_text, [(labels, stats[key]) for labels, stats in samples])
+            for key, name, kind, help_text in _RATE_LIMIT_FAMILIES]
+
+
+def pipeline_collector(mailbox: str, work_queue=None, handler=None,
+                       scheduler=None) -> Callable[[], List[MetricFamily]]:
+    """
+    Build a collector reporting the state of one mailbox's components at scrape time.
+
+    Args:
+        mailbox: Value of the "mailbox" label
+        work_queue: WorkQueue whose job counts are reported
+        handler: EmailHandler whose SMTP rate limiter is reported
+        scheduler: AdaptivePollScheduler whose interval is reported
+    """
+    def collect() -> List[MetricFamily]:
+        families = []
+        labels = {'mailbox': mailbox}
+        if work_queue is not None:
+            families.append(("email_queue_jobs", "gauge", "Jobs in the work queue per state",
+                             [(dict(labels, state=state), count)
+                              for state, count in work_queue.counts().items()]))
+
+        if scheduler is not None:
+            poll = scheduler.snapshot()
+            families.append(("email_poll_interval_seconds", "gauge",
+                             "Polling interval chosen from recent mail arrival", [(labels, poll['interval'])]))
+            families.append(("email_poll_delay_seconds", "gauge",
+                             "Delay before the next check, including error backoff", [(labels, poll['delay'])]))
+            families.append(("email_poll_consecutive_errors", "gauge",
+                             "Failed mailbox checks in a row", [(labels, poll['consecutive_errors'])]))
+
+        stats = handler.rate_limit_stats() if handler is not None else None
+        if stats:
+            families.extend(_rate_limit_families([(labels, stats)]))
+        return families
+
+    return collect
+
+
+def llm_rate_limit_collector(snapshot: Callable[[], Optional[Dict]], backend: str) -> Callable[[], List[MetricFamily]]:
+    """
+    Build a collector for the LLM rate limiter of a backend.
+
+    Mailboxes using the same backend share one limiter, which is therefore
+    reported once, labeled by backend instead of mailbox.
+
+    Args:
+        snapshot: Returns LLMRateLimiter.snapshot(), or None without limits
+        backend: Value of the "backend" label
+    """
+    def collect() -> List[MetricFamily]:
+        buckets = snapshot() or {}
+        return _rate_limit_families([({'backend': backend}, stats) for stats in buckets.values()])
+
+    return collect
+
+
+def response_cache_collector(stats: Callable[[], Optional[Dict]], path: str) -> Callable[[], List[MetricFamily]]:
+    """
+    Build a collector for a response cache, which may be shared by several mailboxes.
+
+    Args:
+        stats: Returns ResponseCache.stats(), or None when caching is disabled
+        path: Cache file, the value of the "cache" label
+    """
+    def collect() -> List[MetricFamily]:
+        stats_now = stats()
+        if not stats_now:
+            return []
+        labels = {'cache': path}
+        return [
+            ("email_response_cache_hits_total", "counter", "Response cache hits",
+             [(labels, stats_now['hits'])]),
+            ("email_response_cache_misses_total", "counter", "Response cache misses",
+             [(labels, stats_now['misses'])]),
+            ("email_response_cache_entries", "gauge", "Cached responses", [(labels, stats_now['entries'])]),
+            ("email_response_cache_bytes", "gauge", "Size of the cached responses", [(labels, stats_now['bytes'])]),
+        ]
+
+    return collect
+
+
+# Pipeline metrics, in processing order
+IMAP_CONNECT_SECONDS = REGISTRY.histogram(
+    "email_imap_connect_seconds", "IMAP connect and login time", ["mailbox"])
+IMAP_SEARCH_SECONDS = REGISTRY.histogram(
+    "email_imap_search_seconds", "IMAP search for new messages", ["mailbox"])
+IMAP_FETCH_SECONDS = REGISTRY.histogram(
+    "email_imap_fetch_seconds", "IMAP fetch of one batch of messages", ["mailbox"])
+IMAP_FETCH_BYTES = REGISTRY.counter(
+    "email_imap_fetch_bytes_total", "Message bytes downloaded over IMAP", ["mailbox"])
+IMAP_FETCHED_MESSAGES = REGISTRY.counter(
+    "email_imap_fetched_messages_total", "Messages downloaded over IMAP", ["mailbox"])
+PARSE_SECONDS = REGISTRY.histogram(
+    "email_parse_seconds", "MIME parsing and text extraction per email",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1))
+INTENT_SECONDS = REGISTRY.histogram(
+    "email_intent_classification_seconds", "Intent classification per email",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1))
+EMAILS_QUEUED = REGISTRY.counter(
+    "email_queued_total", "Emails queued for a reply", ["mailbox", "intent"])
+PROMPT_TOKENS = REGISTRY.histogram(
+    "email_llm_prompt_tokens", "Estimated prompt size per LLM request",
+    buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000))
+LLM_REQUEST_SECONDS = REGISTRY.histogram(
+    "email_llm_request_seconds", "LLM request latency including retries", ["backend", "outcome"])
+LLM_TOKENS = REGISTRY.counter(
+    "email_llm_tokens_total", "Tokens reported by the LLM backend, or counted while streaming", ["kind"])
+SMTP_SEND_SECONDS = REGISTRY.histogram(
+    "email_smtp_send_seconds", "SMTP send of one reply", ["mailbox", "outcome"])
+JOBS = REGISTRY.counter(
+    "email_jobs_total", "Job stage results: ok, retry or failed", ["stage", "outcome"])
+END_TO_END_SECONDS = REGISTRY.histogram(
+    "email_end_to_end_seconds", "Time from an email's arrival in the mailbox to sending its reply", ["intent"],
+    buckets=(1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200))
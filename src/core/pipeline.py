@@ -0,0 +1,244 @@
+"""
+Staged email pipeline: (parsing ->) fetched emails -> response generation -> sending.
+
+The stages hand jobs over through a durable WorkQueue, so fetching can run
+ahead of generation and a failed or interrupted email is retried, never lost.
+"""
+
+import abc
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from src.core.email_monitor import parse_received_email
+from src.core.metrics import EMAILS_QUEUED, PARSE_SECONDS
+from src.core.work_queue import FETCHED, GENERATED, RECEIVED, WorkQueue
+
+
+class PipelineWorkers(abc.ABC):
+    """
+    Worker threads of the pipeline stages.
+
+    Each stage's threads claim jobs through _claim() and hand them to the
+    parse(), generate() or send() method of the pipeline that owns the job.
+    """
+
+    # Claimed state and processing method of each stage
+    STAGES = ((RECEIVED, 'parse'), (FETCHED, 'generate'), (GENERATED, 'send'))
+
+    def __init__(self, generation_workers: int = 4, send_workers: int = 2, poll_interval: float = 1.0,
+                 parse_workers: int = 1):
+        """
+        Args:
+            generation_workers: Number of concurrent LLM generations
+            send_workers: Number of concurrent SMTP sends
+            poll_interval: Seconds an idle worker waits before looking for work again,
+                           e.g. for jobs whose retry delay has passed
+            parse_workers: Number of threads parsing and classifying emails
+                           that were queued unparsed (see WorkQueue.save_parsed)
+        """
+        self.generation_workers = max(1, generation_workers)
+        self.send_workers = max(1, send_workers)
+        self.parse_workers = max(1, parse_workers)
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        """Start the worker threads of all stages; jobs left by a previous run are resumed."""
+        if self._threads:
+            return
+        self._stopping.clear()
+        threads = {'parse': self.parse_workers, 'generate': self.generation_workers, 'send': self.send_workers}
+        for state, method in self.STAGES:
+            for i in range(threads[method]):
+                thread = threading.Thread(target=self._stage_worker, args=(state, method),
+                                          name=f"{method}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        logging.info(f"Pipeline started with {self.generation_workers} generation "
+                     f"and {self.send_workers} send workers")
+
+    def notify(self):
+        """Wake idle workers after emails were queued."""
+        self._wakeup.set()
+
+    def stop(self):
+        """Let the workers finish their current job, then stop them."""
+        if not self._threads:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        logging.info("Pipeline stopped")
+
+    @abc.abstractmethod
+    def _claim(self, states) -> Tuple[Optional["EmailPipeline"], Optional[Dict]]:
+        """Lease the next job, returning it with the pipeline that should process it."""
+
+    def _stage_worker(self, state: str, method: str):
+        """Process jobs in one state until stopped, waking the next stage after each."""
+        while not self._stopping.is_set():
+            owner, job = self._claim((state,))
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            getattr(owner, method)(job)
+            self._wakeup.set()
+
+
+class EmailPipeline(PipelineWorkers):
+    def __init__(self, processor, handler, work_queue: WorkQueue, generation_workers: int = 4,
+                 send_workers: int = 2, processed_store=None, poll_interval: float = 1.0,
+                 parse_workers: int = 1):
+        """
+        Initialize the pipeline.
+
+        Args:
+            processor: ContentProcessor used by the parsing and generation stages
+            handler: EmailHandler used by the sending stage
+            work_queue: Durable queue the stages claim their jobs from
+            generation_workers: Number of concurrent LLM generations
+            send_workers: Number of concurrent SMTP sends
+            processed_store: ProcessedMessageStore recording each email once its reply is sent
+            poll_interval: Seconds an idle worker waits before looking for work again,
+                           e.g. for jobs whose retry delay has passed
+            parse_workers: Number of threads parsing and classifying emails
+                           that were queued unparsed (see WorkQueue.save_parsed)
+        """
+        super().__init__(generation_workers=generation_workers, send_workers=send_workers,
+                         poll_interval=poll_interval, parse_workers=parse_workers)
+        self.processor = processor
+        self.handler = handler
+        self.work_queue = work_queue
+        self.processed_store = processed_store
+
+    def submit(self, email_data: Dict, priority: int = 0, intent: Optional[str] = None,
+               state: str = FETCHED) -> bool:
+        """
+        Queue an email for a reply.
+        
+        Args:
+            priority: Queue priority, 0 first (see WorkQueue.enqueue)
+            intent: Email intent, recorded for latency statistics
+            state: RECEIVED for an email fetched with check_new_emails(parse=False);
+                   the parse stage then classifies it and sets its priority
+        
+        Returns:
+            False if it is already queued
+        """
+        queued = self.work_queue.enqueue(email_data, priority=priority, intent=intent, state=state)
+        self.notify()
+        return queued
+
+    def join(self):
+        """Wait until every queued email has been answered or has failed."""
+        while self.work_queue.pending():
+            self._stopping.wait(self.poll_interval / 4)
+
+    def _claim(self, states) -> Tuple["EmailPipeline", Optional[Dict]]:
+        return self, self.work_queue.claim(states)
+
+    def parse(self, job: Dict, release: bool = True) -> bool:
+        """
+        Parse the raw message of a claimed job, classify it and queue it for generation.
+
+        Args:
+            release: Give up the lease, see WorkQueue.save_parsed()
+
+        Returns:
+            False if the job failed or its lease was lost
+        """
+        config = self.processor.config
+        try:
+            with PARSE_SECONDS.time():
+                email_data = parse_received_email(job['email'], config)
+            intent = self.processor.primary_intent(email_data)
+            priority = config.intent_priority(intent)
+            if not self.work_queue.save_parsed(job, email_data, priority, intent, release):
+                return False
+            logging.info(f"Queued {intent} email from {email_data['from']} (priority {priority})")
+            EMAILS_QUEUED.inc(mailbox=config.email_address, intent=intent)
+            return True
+        except Exception as e:
+            logging.error(f"Error parsing email from {job['email']['from']}: {str(e)}")
+            self.work_queue.fail(job, str(e))
+            return False
+
+    def generate(self, job: Dict):
+        """Generate the response of a claimed job and hand it to the sending stage."""
+        email_data = job['email']
+        try:
+            response = self.processor.generate_response(email_data, job['intent'])
+            self.work_queue.save_response(job, response)
+        except Exception as e:
+            logging.error(f"Error generating response for {email_data['from']}: {str(e)}")
+            self.work_queue.fail(job, str(e))
+
+    def send(self, job: Dict):
+        """Send the generated response of a claimed job."""
+        email_data = job['email']
+        try:
+            # A worker may have crashed between sending and recording the job as sent
+            if self.processed_store is None or not self.processed_store.is_processed(email_data):
+                self.handler.send_response(
+                    to_address=email_data['from'],
+                    subject=f"Re: {email_data['subject']}",
+                    body=job['response']
+                )
+                if self.processed_store is not None:
+                    self.processed_store.mark_processed(email_data)
+                logging.info(f"Response sent to {email_data['from']}")
+            self.work_queue.mark_sent(job)
+        except Exception as e:
+            logging.error(f"Error sending response to {email_data['from']}: {str(e)}")
+            self.work_queue.fail(job, str(e))
+
+
+class RoundRobinPipeline(PipelineWorkers):
+    """
+    One set of worker threads serving the pipelines of several mailboxes.
+
+    Every claim starts at the mailbox after the one served last, so a mailbox
+    with a long backlog cannot starve the others.
+    """
+
+    def __init__(self, pipelines: List[EmailPipeline], generation_workers: int = 4,
+                 send_workers: int = 2, poll_interval: float = 1.0, parse_workers: int = 1):
+        """
+        Initialize the shared pipeline.
+
+        Args:
+            pipelines: Per-mailbox pipelines; only their queues and process
+                       methods are used, their own threads are never started
+            generation_workers: Number of concurrent LLM generations across all mailboxes
+            send_workers: Number of concurrent SMTP sends across all mailboxes
+            poll_interval: Seconds an idle worker waits before looking for work again
+            parse_workers: Number of threads parsing emails queued unparsed
+        """
+        super().__init__(generation_workers=generation_workers, send_workers=send_workers,
+                         poll_interval=poll_interval, parse_workers=parse_workers)
+        self.pipelines = list(pipelines)
+        self._next = {RECEIVED: 0, FETCHED: 0, GENERATED: 0}
+        self._next_lock = threading.Lock()
+
+    def join(self):
+        """Wait until every mailbox's queued emails have been answered or have failed."""
+        while any(pipeline.work_queue.pending() for pipeline in self.pipelines):
+            self._stopping.wait(self.poll_interval / 4)
+
+    def _claim(self, states) -> Tuple[Optional[EmailPipeline], Optional[Dict]]:
+        stage = states[0]
+        with self._next_lock:
+            start = self._next[stage]
+            self._next[stage] = (start + 1) % len(self.pipelines)
+        for offset in range(len(self.pipelines)):
+            pipeline = self.pipelines[(start + offset) % len(self.pipelines)]
+            job = pipeline.work_queue.claim(states)
+            if job is not None:
+                return pipeline, job
+        return None, None
@@ -0,0 +1,125 @@
+"""
+Persistent record of answered emails, used to never reply to a message twice.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class ProcessedMessageStore:
+    def __init__(self, path: str, retention_seconds: float = 90 * 24 * 3600,
+                 cache_size: int = 1024, prune_interval: float = 3600):
+        """
+        Open (or create) the store.
+
+        Args:
+            path: SQLite file holding the processed messages
+            retention_seconds: Records older than this are pruned
+            cache_size: Number of recently seen keys kept in memory
+            prune_interval: Minimum seconds between automatic prunes
+        """
+        self.path = path
+        self.retention_seconds = retention_seconds
+        self.cache_size = cache_size
+        self.prune_interval = prune_interval
+        self._cache: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pruned_at = 0.0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS processed (
+                key TEXT PRIMARY KEY,
+                mailbox TEXT,
+                uidvalidity INTEGER,
+                uid INTEGER,
+                processed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_processed_uid ON processed (mailbox, uidvalidity, uid)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_processed_at ON processed (processed_at)")
+        self._conn.commit()
+
+    @classmethod
+    def from_config(cls, config) -> "ProcessedMessageStore":
+        """Open the store configured in email_config.json."""
+        return cls(config.processed_store_path, retention_seconds=config.processed_retention_days * 24 * 3600)
+
+    @staticmethod
+    def make_key(email_data: dict) -> Optional[str]:
+        """Key an email by its Message-ID, or by mailbox/UIDVALIDITY/UID when it has none."""
+        message_id = (email_data.get('message_id') or '').strip()
+        if message_id:
+            return message_id
+        if email_data.get('uid') is not None and email_data.get('uidvalidity') is not None:
+            return f"uid:{email_data.get('mailbox', '')}:{email_data['uidvalidity']}:{email_data['uid']}"
+        return None
+
+    def _remember(self, key: str):
+        """Add a key to the in-memory LRU, evicting the least recently used."""
+        self._cache[key] = None
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def is_processed(self, email_data: dict) -> bool:
+        """Check whether a reply to this email was already sent."""
+        key = self.make_key(email_data)
+        if key is None:
+            return False
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return True
+            row = self._conn.execute("SELECT 1 FROM processed WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._remember(key)
+            return row is not None
+
+    def mark_processed(self, email_data: dict):
+        """Record that the email was answered."""
+        key = self.make_key(email_data)
+        if key is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO processed (key, mailbox, uidvalidity, uid, processed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, email_data.get('mailbox'), email_data.get('uidvalidity'), email_data.get('uid'), now)
+            )
+            self._conn.commit()
+            self._remember(key)
+            if now - self._pruned_at >= self.prune_interval:
+                self._prune(now)
+
+    def _prune(self, now: float):
+        """Delete records older than the retention period."""
+        self._pruned_at = now
+        deleted = self._conn.execute(
+            "DELETE FROM processed WHERE processed_at < ?", (now - self.retention_seconds,)
+        ).rowcount
+        self._conn.commit()
+        if deleted:
+            # Pruned keys may still sit in the front cache; start it afresh
+            self._cache.clear()
+            logging.info(f"Pruned {deleted} processed message records")
+
+    def prune(self):
+        """Delete records older than the retention period now."""
+        with self._lock:
+            self._prune(time.time())
+
+    def close(self):
+        """Close the database."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,143 @@
+"""
+Token-bucket rate limiting for calls to external services (LLM backend, SMTP).
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None, name: str = "rate limit"):
+        """
+        Initialize a full bucket.
+
+        Args:
+            rate_per_minute: Tokens added per minute
+            capacity: Largest burst; defaults to one minute's worth of tokens
+            name: Used in log messages and statistics
+        """
+        self.name = name
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._acquired = 0.0
+        self._throttled = 0
+        self._wait_seconds = 0.0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def reserve(self, amount: float = 1) -> float:
+        """
+        Take tokens from the bucket, going into debt when there are not enough.
+
+        Callers are served in the order they reserve, and a request larger than
+        the capacity still goes through, it just waits longer.
+
+        Returns:
+            Seconds the caller must wait before using the tokens
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= amount
+            self._acquired += amount
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            if delay > 0:
+                self._throttled += 1
+                self._wait_seconds += delay
+        if delay >= 1:
+            logging.info(f"{self.name}: waiting {delay:.1f}s")
+        return delay
+
+    def acquire(self, amount: float = 1) -> float:
+        """Block until the tokens are available. Returns the seconds waited."""
+        delay = self.reserve(amount)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    async def acquire_async(self, amount: float = 1) -> float:
+        """Wait without blocking the event loop until the tokens are available."""
+        delay = self.reserve(amount)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+    def backlog(self) -> float:
+        """Seconds until the tokens already reserved are paid off, i.e. the wait of the next caller."""
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, -self._tokens) / self.rate
+
+    def snapshot(self) -> Dict:
+        """Current fill level and totals since start."""
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                'name': self.name,
+                'rate_per_minute': self.rate * 60,
+                'capacity': self.capacity,
+                'available': max(0.0, self._tokens),
+                # Reserved but not yet due, i.e. callers still waiting
+                'debt': max(0.0, -self._tokens),
+                'acquired_total': self._acquired,
+                'throttled_total': self._throttled,
+                'wait_seconds_total': self._wait_seconds
+            }
+
+
+class LLMRateLimiter:
+    """Requests per minute and tokens per minute limits of an LLM backend."""
+
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        """
+        Initialize the limiter.
+
+        Args:
+            requests_per_minute: Request limit, 0 for none
+            tokens_per_minute: Limit on prompt plus completion tokens, 0 for none
+        """
+        self.requests = TokenBucket(requests_per_minute, name="LLM requests") if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute, name="LLM tokens") if tokens_per_minute else None
+
+    @classmethod
+    def from_settings(cls, settings: Optional[Dict]) -> Optional["LLMRateLimiter"]:
+        """Create the limiter for the "rate_limit" section of llm_config.json, or None if unlimited."""
+        settings = settings or {}
+        limiter = cls(settings.get("requests_per_minute", 0), settings.get("tokens_per_minute", 0))
+        return limiter if limiter.requests or limiter.tokens else None
+
+    def _reserve(self, tokens: int) -> float:
+        """Reserve from both buckets at once, so the waits overlap instead of adding up."""
+        delay = self.requests.reserve() if self.requests else 0.0
+        if self.tokens:
+            delay = max(delay, self.tokens.reserve(tokens))
+        return delay
+
+    def acquire(self, tokens: int) -> float:
+        """Block until a request of this many tokens may be sent. Returns the seconds waited."""
+        delay = self._reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    async def acquire_async(self, tokens: int) -> float:
+        """Async version of acquire()."""
+        delay = self._reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+    def backlog(self) -> float:
+        """Seconds the next request would wait."""
+        return max(bucket.backlog() for bucket in (self.requests, self.tokens) if bucket)
+
+    def snapshot(self) -> Dict:
+        """State of each configured bucket."""
+        return {bucket.name: bucket.snapshot() for bucket in (self.requests, self.tokens) if bucket}
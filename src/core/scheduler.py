@@ -0,0 +1,115 @@
+"""
+Adaptive mailbox polling: check often while mail is arriving, rarely when the
+mailbox is idle, and back off exponentially while the server is failing.
+"""
+
+import random
+import threading
+import time
+from typing import Dict
+
+
+class AdaptivePollScheduler:
+    def __init__(self, initial_interval: float = 60, min_interval: float = 15, max_interval: float = 300,
+                 idle_growth: float = 1.5, jitter: float = 0.1,
+                 error_backoff_base: float = 5, error_backoff_max: float = 600):
+        """
+        Initialize the scheduler.
+
+        Args:
+            initial_interval: Seconds between checks before any mail was seen
+            min_interval: Shortest interval, used while mail keeps arriving
+            max_interval: Longest interval, reached after a stretch of empty checks
+            idle_growth: Factor the interval grows by after each empty check
+            jitter: Random spread of every delay, as a fraction of it, so several
+                    mailboxes do not poll in lockstep
+            error_backoff_base: Delay after the first failed check, doubled on every further failure
+            error_backoff_max: Upper bound of the error backoff
+        """
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.idle_growth = idle_growth
+        self.jitter = jitter
+        self.error_backoff_base = error_backoff_base
+        self.error_backoff_max = error_backoff_max
+        self._lock = threading.Lock()
+        # Interval of successful checks, kept while backing off from errors
+        self.interval = min(self.max_interval, max(self.min_interval, initial_interval))
+        self.delay = self.interval
+        self.reason = "initial interval"
+        self.consecutive_errors = 0
+        self.next_check_at = time.time()
+
+    @classmethod
+    def from_config(cls, config, initial_interval: float = None) -> "AdaptivePollScheduler":
+        """Create the scheduler configured in email_config.json."""
+        return cls(
+            initial_interval=initial_interval if initial_interval is not None else config.check_interval,
+            min_interval=config.poll_min_interval,
+            max_interval=config.poll_max_interval,
+            idle_growth=config.poll_idle_growth,
+            error_backoff_base=config.poll_error_backoff,
+            error_backoff_max=config.poll_error_backoff_max
+        )
+
+    def _jittered(self, delay: float) -> float:
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _schedule(self, delay: float, reason: str) -> float:
+        self.delay = delay
+        self.reason = reason
+        self.next_check_at = time.time() + delay
+        return delay
+
+    def record_check(self, new_emails: int) -> float:
+        """
+        Adapt the interval to the result of a successful check.
+
+        Args:
+            new_emails: Number of new emails the check found
+
+        Returns:
+            Seconds to wait before the next check
+        """
+        with self._lock:
+            self.consecutive_errors = 0
+            if new_emails:
+                # Mail tends to come in bursts; look again soon
+                self.interval = max(self.min_interval, self.interval / 2)
+                reason = f"{new_emails} new emails"
+            else:
+                self.interval = min(self.max_interval, self.interval * self.idle_growth)
+                reason = "mailbox idle" if self.interval < self.max_interval else "mailbox idle, at maximum interval"
+            return self._schedule(self._jittered(self.interval), reason)
+
+    def record_error(self, error: Exception) -> float:
+        """
+        Back off after a failed check.
+
+        Returns:
+            Seconds to wait before the next check
+        """
+        with self._lock:
+            self.consecutive_errors += 1
+            delay = min(self.error_backoff_max, self.error_backoff_base * (2 ** (self.consecutive_errors - 1)))
+            delay *= random.uniform(0.5, 1.0)
+            return self._schedule(delay, f"error {self.consecutive_errors} in a row: {str(error)}")
+
+    def record_push(self):
+        """Note a successful check in IMAP IDLE mode, where the server announces new mail itself."""
+        with self._lock:
+            self.consecutive_errors = 0
+            self.delay = 0
+            self.reason = "waiting for IMAP IDLE push"
+            self.next_check_at = None
+
+    def snapshot(self) -> Dict:
+        """Current interval, chosen delay and the reason for it."""
+        with self._lock:
+            return {
+                'interval': self.interval,
+                'delay': self.delay,
+                'reason': self.reason,
+                'consecutive_errors': self.consecutive_errors,
+                'next_check_at': self.next_check_at
+            }
@@ -0,0 +1,154 @@
+"""
+Pool of authenticated SMTP sessions shared by outgoing replies.
+"""
+
+import smtplib
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import Iterator, List, Tuple
+
+
+class SMTPConnectionPool:
+    def __init__(self, config, max_size: int = 2, keepalive_interval: float = 60,
+                 max_idle: float = 240):
+        """
+        Initialize the pool.
+
+        Args:
+            config: EmailConfig with SMTP server and credentials
+            max_size: Maximum number of concurrent SMTP sessions
+            keepalive_interval: Seconds between NOOPs on idle sessions, so the server does
+                                not drop them between replies (0 = only check before reuse)
+            max_idle: Idle seconds after which a session is closed instead of kept alive
+        """
+        self.config = config
+        self.max_size = max_size
+        self.keepalive_interval = keepalive_interval
+        self.max_idle = max_idle
+        # (session, last used, last checked with NOOP)
+        self._idle: List[Tuple[smtplib.SMTP, float, float]] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._closing = threading.Event()
+        self._keepalive_thread = None
+
+    def _connect(self) -> smtplib.SMTP:
+        """Open and authenticate a new SMTP session."""
+        if self.config.smtp_use_ssl:
+            # Use SSL for port 465
+            smtp = smtplib.SMTP_SSL(self.config.smtp_server, self.config.smtp_port,
+                                    timeout=self.config.smtp_timeout)
+        else:
+            # Use STARTTLS for port 587
+            smtp = smtplib.SMTP(self.config.smtp_server, self.config.smtp_port,
+                                timeout=self.config.smtp_timeout)
+            smtp.starttls()
+
+        smtp.login(self.config.email_address, self.config.email_password)
+        logging.info(f"Opened SMTP session to {self.config.smtp_server}")
+        return smtp
+
+    @staticmethod
+    def _quit(smtp: smtplib.SMTP):
+        """Close a session, ignoring errors from already dropped connections."""
+        try:
+            smtp.quit()
+        except Exception:
+            try:
+                smtp.close()
+            except Exception:
+                pass
+
+    @staticmethod
+    def _noop(smtp: smtplib.SMTP) -> bool:
+        """Check a session with NOOP."""
+        try:
+            return smtp.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _checkout(self) -> smtplib.SMTP:
+        """Take a live idle session from the pool, or open a new one."""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                smtp, last_used, last_checked = self._idle.pop()
+
+            now = time.monotonic()
+            if now - last_used < self.max_idle and (
+                    now - last_checked < self.keepalive_interval or self._noop(smtp)):
+                return smtp
+            logging.info("Discarding stale SMTP session")
+            self._quit(smtp)
+
+        return self._connect()
+
+    def _checkin(self, smtp: smtplib.SMTP):
+        """Return a session to the pool, starting the keep-alive thread with the first one."""
+        now = time.monotonic()
+        with self._lock:
+            self._idle.append((smtp, now, now))
+            if self._keepalive_thread is None and self.keepalive_interval > 0:
+                self._closing.clear()
+                self._keepalive_thread = threading.Thread(target=self._keepalive, name="smtp-keepalive",
+                                                          daemon=True)
+                self._keepalive_thread.start()
+
+    def _keepalive(self):
+        """NOOP idle sessions every keepalive_interval; close those idle past max_idle."""
+        while not self._closing.wait(self.keepalive_interval / 2):
+            now = time.monotonic()
+            with self._lock:
+                due = [entry for entry in self._idle if now - entry[2] >= self.keepalive_interval]
+                self._idle = [entry for entry in self._idle if now - entry[2] < self.keepalive_interval]
+
+            for smtp, last_used, _ in due:
+                if now - last_used >= self.max_idle:
+                    logging.info("Closing SMTP session idle for too long")
+                    self._quit(smtp)
+                elif self._noop(smtp):
+                    with self._lock:
+                        # A reply may have opened another session while this one was checked
+                        keep = len(self._idle) < self.max_size
+                        if keep:
+                            self._idle.append((smtp, last_used, time.monotonic()))
+                    if not keep:
+                        self._quit(smtp)
+                else:
+                    logging.info("Discarding SMTP session dropped by the server")
+                    self._quit(smtp)
+
+    @contextmanager
+    def connection(self) -> Iterator[smtplib.SMTP]:
+        """
+        Borrow an authenticated SMTP session.
+
+        The session goes back to the pool when the block succeeds. It is discarded
+        when the block raises, so a dropped connection is replaced on the next use.
+        """
+        self._slots.acquire()
+        try:
+            smtp = self._checkout()
+            try:
+                yield smtp
+            except Exception:
+                self._quit(smtp)
+                raise
+            self._checkin(smtp)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """Stop the keep-alive thread and close all idle sessions."""
+        self._closing.set()
+        with self._lock:
+            thread, self._keepalive_thread = self._keepalive_thread, None
+        if thread is not None:
+            thread.join()
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for smtp, _, _ in idle:
+            self._quit(smtp)
@@ -0,0 +1,70 @@
+"""
+Persistent IMAP sync checkpoint (UIDVALIDITY + highest processed UID).
+"""
+
+import json
+import logging
+import os
+from typing import Optional
+
+
+class SyncCheckpoint:
+    def __init__(self, path: str, mailbox_key: str):
+        """
+        Load the checkpoint for one mailbox from a small JSON file.
+
+        Args:
+            path: JSON file shared by all mailboxes
+            mailbox_key: Identifies the mailbox inside the file, e.g. "user@host/INBOX"
+        """
+        self.path = path
+        self.mailbox_key = mailbox_key
+        self.uidvalidity: Optional[int] = None
+        self.last_uid: Optional[int] = None
+        self._load()
+
+    def _read_all(self) -> dict:
+        """Read every mailbox entry stored in the checkpoint file."""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            logging.error(f"Error reading sync checkpoint {self.path}: {str(e)}")
+            return {}
+
+    def _load(self):
+        """Load this mailbox's entry, if any."""
+        entry = self._read_all().get(self.mailbox_key)
+        if entry:
+            self.uidvalidity = entry.get('uidvalidity')
+            self.last_uid = entry.get('last_uid')
+            logging.info(f"Loaded sync checkpoint for {self.mailbox_key}: "
+                         f"UIDVALIDITY {self.uidvalidity}, last UID {self.last_uid}")
+
+    def is_valid_for(self, uidvalidity: int) -> bool:
+        """Check whether the stored UIDs still refer to the same mailbox generation."""
+        return self.last_uid is not None and self.uidvalidity == uidvalidity
+
+    def update(self, uidvalidity: int, last_uid: int):
+        """Record a new position without writing it to disk."""
+        if self.uidvalidity == uidvalidity and self.last_uid is not None:
+            last_uid = max(last_uid, self.last_uid)
+        self.uidvalidity = uidvalidity
+        self.last_uid = last_uid
+
+    def save(self):
+        """Atomically write the checkpoint so a crash never leaves a torn file."""
+        data = self._read_all()
+        data[self.mailbox_key] = {'uidvalidity': self.uidvalidity, 'last_uid': self.last_uid}
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
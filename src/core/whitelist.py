@@ -0,0 +1,121 @@
+"""
+Sender whitelist with exact address, domain and subdomain entries.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from email.utils import parseaddr
+from typing import FrozenSet, Optional, Tuple
+
+
+def normalize_address(from_field: str) -> Optional[str]:
+    """
+    Extract the address from a From header (RFC 5322) and normalize it.
+
+    Returns:
+        The lowercased address, or None if the field holds no usable address
+    """
+    address = parseaddr(from_field or '')[1].strip().lower()
+    local, _, domain = address.rpartition('@')
+    domain = domain.rstrip('.')
+    if not local or not domain:
+        return None
+    return f"{local}@{domain}"
+
+
+class SenderWhitelist:
+    def __init__(self, path: str = 'whitelist_config.json', reload_interval: float = 5.0):
+        """
+        Load the whitelist and keep it in sync with the file.
+
+        Entries in "allowed_senders" are exact addresses ("anna@example.com"),
+        whole domains ("*@clinic-partner.de") or a domain including all its
+        subdomains ("*@*.clinic-partner.de").
+
+        Args:
+            path: Whitelist JSON file
+            reload_interval: Minimum seconds between checks of the file for changes
+        """
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._signature = None
+        self._checked_at = 0.0
+        # (addresses, domains, parent domains); replaced as a whole on reload
+        self._sets: Tuple[FrozenSet[str], FrozenSet[str], FrozenSet[str]] = (frozenset(), frozenset(), frozenset())
+        self._load()
+
+    def _get_signature(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def _load(self):
+        """Parse the file into normalized hash sets."""
+        signature = self._get_signature()
+        with open(self.path, 'r') as f:
+            entries = json.load(f).get('allowed_senders', [])
+
+        addresses, domains, parents = set(), set(), set()
+        for entry in entries:
+            entry = str(entry).strip().lower()
+            if entry.startswith('*@*.'):
+                parents.add(entry[4:].rstrip('.'))
+            elif entry.startswith('*@') or entry.startswith('@'):
+                domains.add(entry.split('@', 1)[1].rstrip('.'))
+            else:
+                address = normalize_address(entry)
+                if address:
+                    addresses.add(address)
+                else:
+                    logging.warning(f"Ignoring invalid whitelist entry: {entry}")
+
+        self._sets = (frozenset(addresses), frozenset(domains), frozenset(parents))
+        self._signature = signature
+        logging.info(f"Whitelist loaded: {self.describe()}")
+
+    def reload_if_changed(self):
+        """Reload the file if it changed, checking at most every reload_interval seconds."""
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        with self._lock:
+            if now - self._checked_at < self.reload_interval:
+                return
+            self._checked_at = now
+            if self._get_signature() == self._signature:
+                return
+            try:
+                self._load()
+            except Exception as e:
+                # Keep the previous whitelist, e.g. while the file is half-written
+                logging.error(f"Error reloading whitelist, keeping the previous one: {str(e)}")
+
+    def is_allowed(self, from_field: str) -> bool:
+        """Check whether the sender of a From header is whitelisted."""
+        self.reload_if_changed()
+        address = normalize_address(from_field)
+        if address is None:
+            return False
+
+        addresses, domains, parents = self._sets
+        if address in addresses:
+            return True
+        domain = address.rpartition('@')[2]
+        if domain in domains or domain in parents:
+            return True
+        # Walk up the parent domains: a.b.example.com -> b.example.com -> example.com -> com
+        while '.' in domain:
+            domain = domain.split('.', 1)[1]
+            if domain in parents:
+                return True
+        return False
+
+    def describe(self) -> str:
+        addresses, domains, parents = self._sets
+        return f"{len(addresses)} addresses, {len(domains)} domains, {len(parents)} domains with subdomains"
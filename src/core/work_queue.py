@@ -0,0 +1,390 @@
+"""
+Durable on-disk queue of email jobs: (received ->) fetched -> generated -> sent (or failed).
+"""
+
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Sequence
+
+from src.core.metrics import END_TO_END_SECONDS, JOBS
+from src.core.processed_store import ProcessedMessageStore
+
+# Job states, in processing order; received jobs hold the raw message, which
+# worker processes parse and classify before it is queued for generation
+RECEIVED = 'received'
+FETCHED = 'fetched'
+GENERATED = 'generated'
+SENT = 'sent'
+FAILED = 'failed'
+
+
+class WorkQueue:
+    def __init__(self, path: str, visibility_timeout: float = 600, max_attempts: int = 5,
+                 backoff_base: float = 30, backoff_max: float = 3600,
+                 retention_seconds: float = 7 * 24 * 3600, prune_interval: float = 3600,
+                 priority_aging: float = 300):
+        """
+        Open (or create) the queue.
+
+        Args:
+            path: SQLite file holding the jobs; may be shared by several processes
+            visibility_timeout: Seconds a claimed job stays invisible to other workers;
+                                jobs of crashed workers become claimable again afterwards
+            max_attempts: Attempts per stage before a job is marked failed
+            backoff_base: Delay before the first retry, doubled on every further attempt
+            backoff_max: Upper bound of the retry delay
+            retention_seconds: Sent jobs older than this are deleted
+            prune_interval: Minimum seconds between automatic prunes
+            priority_aging: Seconds of waiting worth one priority level, so a job
+                            is served before any job fetched priority_aging seconds
+                            later with a priority one level better
+        """
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retention_seconds = retention_seconds
+        self.prune_interval = prune_interval
+        self.priority_aging = priority_aging
+        self._lock = threading.Lock()
+        self._pruned_at = 0.0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Autocommit mode; claims use explicit BEGIN IMMEDIATE transactions
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                message_key TEXT UNIQUE,
+                email TEXT NOT NULL,
+                response TEXT,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL,
+                lease TEXT,
+                lease_until REAL,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                intent TEXT,
+                schedule_key REAL
+            )
+        """)
+        self._add_priority_columns()
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, available_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_schedule ON jobs (state, schedule_key)")
+
+    def _add_priority_columns(self):
+        """Upgrade a queue created before jobs had priorities."""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Checked inside the transaction, other processes may be upgrading too
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            if 'priority' not in columns:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT 0")
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN intent TEXT")
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN schedule_key REAL")
+                self._conn.execute("UPDATE jobs SET schedule_key = created_at")
+                logging.info("Added priority columns to the work queue")
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    @classmethod
+    def from_config(cls, config) -> "WorkQueue":
+        """Open the queue configured in email_config.json."""
+        return cls(
+            config.work_queue_path,
+            visibility_timeout=config.job_visibility_timeout,
+            max_attempts=config.job_max_attempts,
+            backoff_base=config.job_retry_backoff,
+            backoff_max=config.job_retry_backoff_max,
+            retention_seconds=config.job_retention_days * 24 * 3600,
+            priority_aging=config.job_priority_aging
+        )
+
+    def enqueue(self, email_data: Dict, priority: int = 0, intent: Optional[str] = None,
+                state: str = FETCHED) -> bool:
+        """
+        Add a fetched email.
+
+        Args:
+            priority: 0 is served first; higher numbers wait, but by at most
+                      priority * priority_aging seconds
+            intent: Recorded for latency statistics per intent
+            state: RECEIVED for an unparsed email, see save_parsed()
+
+        Returns:
+            False if the same message is already queued, e.g. fetched again after a restart
+        """
+        now = time.time()
+        # Ordering by fetch time plus the priority's head start of the better jobs
+        # is the same as ordering by priority aged by the waiting time, and indexable
+        schedule_key = now + priority * self.priority_aging
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (message_key, email, state, available_at, created_at, updated_at, "
+                "priority, intent, schedule_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (ProcessedMessageStore.make_key(email_data), json.dumps(email_data), state, now, now, now,
+                 priority, intent, schedule_key)
+            )
+        return cursor.rowcount == 1
+
+    def record_failed(self, email_data: Dict, error: str) -> bool:
+        """
+        Add an email that could not be processed at all, e.g. not parsed, as a failed job.
+
+        Returns:
+            False if the same message is already queued
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (message_key, email, state, available_at, created_at, updated_at, "
+                "last_error, schedule_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (ProcessedMessageStore.make_key(email_data), json.dumps(email_data), FAILED, now, now, now,
+                 error, now)
+            )
+        if cursor.rowcount != 1:
+            return False
+        JOBS.inc(stage='parse', outcome='failed')
+        return True
+
+    def claim(self, states: Sequence[str] = (FETCHED,)) -> Optional[Dict]:
+        """
+        Lease the most urgent available job in one of the given states.
+
+        Returns:
+            The job (id, state, email, response, attempts, lease, intent, priority,
+            created_at), or None if there is none
+        """
+        now = time.time()
+        placeholders = ', '.join('?' for _ in states)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                while True:
+                    row = self._conn.execute(
+                        f"SELECT id, state, email, response, attempts, intent, priority, created_at FROM jobs "
+                        f"WHERE state IN ({placeholders}) AND available_at <= ? "
+                        f"AND (lease_until IS NULL OR lease_until <= ?) ORDER BY schedule_key, id LIMIT 1",
+                        (*states, now, now)
+                    ).fetchone()
+                    if row is None:
+                        self._conn.execute("COMMIT")
+                        return None
+
+                    job_id, state, email_json, response, attempts, intent, priority, created_at = row
+                    if attempts < self.max_attempts:
+                        break
+                    # The previous holders never reported back, e.g. the worker crashed;
+                    # fail the job and lease the next one in the same transaction
+                    self._conn.execute(
+                        "UPDATE jobs SET state = ?, lease = NULL, lease_until = NULL, updated_at = ?, "
+                        "last_error = COALESCE(last_error, 'visibility timeout expired') WHERE id = ?",
+                        (FAILED, now, job_id)
+                    )
+                    logging.error(f"Job {job_id} failed after {attempts} attempts")
+
+                lease = uuid.uuid4().hex
+                self._conn.execute(
+                    "UPDATE jobs SET lease = ?, lease_until = ?, attempts = attempts + 1, updated_at = ? "
+                    "WHERE id = ?",
+                    (lease, now + self.visibility_timeout, now, job_id)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        return {
+            'id': job_id,
+            'state': state,
+            'email': json.loads(email_json),
+            'response': response,
+            'attempts': attempts + 1,
+            'lease': lease,
+            'intent': intent,
+            'priority': priority,
+            'created_at': created_at
+        }
+
+    def _update_leased(self, job: Dict, assignments: str, params: tuple) -> bool:
+        """Update a job only while the caller still holds its lease."""
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE jobs SET {assignments}, updated_at = ? WHERE id = ? AND lease = ?",
+                (*params, time.time(), job['id'], job['lease'])
+            )
+        if cursor.rowcount != 1:
+            logging.warning(f"Lease on job {job['id']} expired before it was completed")
+            return False
+        return True
+
+    def save_parsed(self, job: Dict, email_data: Dict, priority: int, intent: str,
+                    release: bool = True) -> bool:
+        """
+        Replace the raw message of a received job by the parsed email and queue it for generation.
+
+        The job is scheduled as if it had been enqueued with its priority when it
+        was fetched, so parsing in the workers does not change the order of replies.
+
+        Args:
+            release: Give up the lease so a generation worker can claim the job
+        """
+        assignments = "state = ?, email = ?, priority = ?, intent = ?, schedule_key = created_at + ?"
+        params = (FETCHED, json.dumps(email_data), priority, intent, priority * self.priority_aging)
+        if release:
+            updated = self._update_leased(
+                job, assignments + ", attempts = 0, available_at = ?, lease = NULL, lease_until = NULL",
+                (*params, time.time())
+            )
+        else:
+            updated = self._update_leased(job, assignments + ", attempts = 1", params)
+        if updated:
+            job.update(state=FETCHED, email=email_data, priority=priority, intent=intent)
+            JOBS.inc(stage='parse', outcome='ok')
+        return updated
+
+    def save_response(self, job: Dict, response: str, release: bool = True) -> bool:
+        """
+        Store the generated response and move the job to the sending stage.
+
+        Args:
+            release: Give up the lease so a send worker can claim the job; the
+                     holder keeps it when it sends the reply itself
+        """
+        if release:
+            updated = self._update_leased(
+                job, "state = ?, response = ?, attempts = 0, available_at = ?, lease = NULL, lease_until = NULL",
+                (GENERATED, response, time.time())
+            )
+        else:
+            updated = self._update_leased(job, "state = ?, response = ?, attempts = 1", (GENERATED, response))
+        if updated:
+            job['state'] = GENERATED
+            job['response'] = response
+            JOBS.inc(stage='generate', outcome='ok')
+        return updated
+
+    def mark_sent(self, job: Dict) -> bool:
+        """Finish a job whose reply was sent."""
+        updated = self._update_leased(job, "state = ?, lease = NULL, lease_until = NULL", (SENT,))
+        now = time.time()
+        if updated:
+            JOBS.inc(stage='send', outcome='ok')
+        if updated and job.get('created_at'):
+            intent = job.get('intent') or 'unclassified'
+            # From arrival in the mailbox, so the polling delay is included; a sender's
+            # clock running ahead must not produce a negative latency
+            arrived = job['email'].get('received_at') or job['created_at']
+            END_TO_END_SECONDS.observe(max(0.0, now - arrived), intent=intent)
+            logging.info(f"Job {job['id']} ({intent}) answered {now - job['created_at']:.1f}s after it was fetched, "
+                         f"{max(0.0, now - arrived):.1f}s after it arrived")
+        if now - self._pruned_at >= self.prune_interval:
+            self.prune()
+        return updated
+
+    def fail(self, job: Dict, error: str) -> bool:
+        """Release a job after an error: retry it later with backoff, or give up."""
+        stage = {RECEIVED: 'parse', FETCHED: 'generate'}.get(job['state'], 'send')
+        if job['attempts'] >= self.max_attempts:
+            JOBS.inc(stage=stage, outcome='failed')
+            logging.error(f"Job {job['id']} failed after {job['attempts']} attempts: {error}")
+            return self._update_leased(
+                job, "state = ?, last_error = ?, lease = NULL, lease_until = NULL", (FAILED, error)
+            )
+        JOBS.inc(stage=stage, outcome='retry')
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (job['attempts'] - 1)))
+        delay *= random.uniform(0.5, 1.0)
+        logging.warning(f"Job {job['id']} attempt {job['attempts']} failed, retrying in {delay:.0f}s: {error}")
+        return self._update_leased(
+            job, "last_error = ?, available_at = ?, lease = NULL, lease_until = NULL",
+            (error, time.time() + delay)
+        )
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs per state."""
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        counts = {RECEIVED: 0, FETCHED: 0, GENERATED: 0, SENT: 0, FAILED: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def pending(self) -> int:
+        """Jobs that still need parsing, generating or sending."""
+        counts = self.counts()
+        return counts[RECEIVED] + counts[FETCHED] + counts[GENERATED]
+
+    def latency_by_intent(self, since: Optional[float] = None) -> Dict[str, Dict[str, float]]:
+        """
+        Time from arrival to sending the reply, per intent, over the sent jobs still retained.
+
+        Measured like the end-to-end histogram: from the email's received_at, or from
+        fetching when it has none, to the update that marked the job sent.
+
+        Args:
+            since: Only jobs sent after this Unix time
+
+        Returns:
+            {intent: {'count', 'mean', 'p50', 'p95', 'max'}} in seconds
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT COALESCE(intent, 'unclassified'), "
+                "MAX(0.0, updated_at - COALESCE(json_extract(email, '$.received_at'), created_at)) FROM jobs "
+                "WHERE state = ? AND updated_at >= ? ORDER BY 2",
+                (SENT, since or 0)
+            ).fetchall()
+
+        latencies: Dict[str, List[float]] = {}
+        for intent, latency in rows:
+            latencies.setdefault(intent, []).append(latency)
+        return {
+            intent: {
+                'count': len(values),
+                'mean': sum(values) / len(values),
+                'p50': values[int(0.5 * (len(values) - 1))],
+                'p95': values[int(0.95 * (len(values) - 1))],
+                'max': values[-1]
+            }
+            for intent, values in latencies.items()
+        }
+
+    def failed_jobs(self, limit: int = 100) -> List[Dict]:
+        """Most recent failed jobs with their last error, for inspection."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, email, attempts, last_error FROM jobs WHERE state = ? ORDER BY id DESC LIMIT ?",
+                (FAILED, limit)
+            ).fetchall()
+        return [{'id': row[0], 'email': json.loads(row[1]), 'attempts': row[2], 'last_error': row[3]}
+                for row in rows]
+
+    def prune(self):
+        """Delete sent jobs older than the retention period."""
+        now = time.time()
+        self._pruned_at = now
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM jobs WHERE state = ? AND updated_at < ?", (SENT, now - self.retention_seconds)
+            ).rowcount
+        if deleted:
+            logging.info(f"Pruned {deleted} sent jobs")
+
+    def close(self):
+        """Close the database."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,145 @@
+"""
+Worker processes that answer queued emails on all CPU cores.
+
+The fetcher process only talks to IMAP and fills the WorkQueue with unparsed
+emails; MIME parsing and intent classification run in the workers. Each worker
+process has its own ContentProcessor, EmailHandler and pipeline threads; the
+processes share nothing but the SQLite queue and processed message store.
+"""
+
+import logging
+import multiprocessing
+from typing import List
+
+from src.core.email_handler import EmailConfig, EmailHandler
+from src.core.metrics import REGISTRY, pipeline_collector, start_metrics_server
+from src.core.pipeline import EmailPipeline
+from src.core.processed_store import ProcessedMessageStore
+from src.core.work_queue import WorkQueue
+from src.ai.content_processor import ContentProcessor
+
+# Spawned processes start from a clean interpreter, without inherited sockets
+# or SQLite connections
+_CONTEXT = multiprocessing.get_context('spawn')
+
+
+def _open_worker(config_path: str, workers: int):
+    """
+    Load the configuration and open the components of one of `workers` processes.
+
+    Every worker sends from the same account to the same LLM backend, so each
+    gets a 1/workers share of the SMTP and LLM rate limits; together they keep
+    the provider limits.
+
+    Returns:
+        (config, handler, work_queue, processed store, processor)
+    """
+    config = EmailConfig(config_path)
+    config.smtp_messages_per_minute /= workers
+    handler = EmailHandler(config)
+    work_queue = WorkQueue.from_config(config)
+    processed = ProcessedMessageStore.from_config(config)
+    processor = ContentProcessor(config, rate_limit_share=1 / workers)
+    return config, handler, work_queue, processed, processor
+
+
+def _worker_main(config_path: str, index: int, workers: int, stop_event, poll_interval: float):
+    """Entry point of a worker process."""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(processName)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('email_assistant.log'),
+            logging.StreamHandler()
+        ]
+    )
+
+    pipeline = None
+    metrics_server = None
+    try:
+        config, handler, work_queue, processed, processor = _open_worker(config_path, workers)
+        # Metrics live in each process; worker i serves them on the port after the fetcher's plus i
+        if config.metrics_port:
+            REGISTRY.add_collector("worker", pipeline_collector(config.email_address, handler=handler))
+            processor.register_metrics()
+            metrics_server = start_metrics_server(config.metrics_host, config.metrics_port + 1 + index)
+        pipeline = EmailPipeline(
+            processor,
+            handler,
+            work_queue,
+            generation_workers=config.generation_workers,
+            send_workers=config.send_workers,
+            processed_store=processed,
+            poll_interval=poll_interval
+        )
+        pipeline.start()
+        while not stop_event.wait(1):
+            pass
+    except KeyboardInterrupt:
+        # Ctrl-C reaches the whole process group; the parent stops us through stop_event
+        pass
+    except Exception as e:
+        logging.critical(f"Worker failed: {str(e)}")
+        raise
+    finally:
+        if metrics_server is not None:
+            metrics_server.stop()
+        if pipeline is not None:
+            pipeline.stop()
+            handler.close()
+            work_queue.close()
+            processed.close()
+
+
+class WorkerPool:
+    def __init__(self, config_path: str, workers: int, poll_interval: float = 0.5):
+        """
+        Initialize the pool.
+
+        Args:
+            config_path: Email configuration loaded by every worker
+            workers: Number of worker processes
+            poll_interval: Seconds an idle worker waits before checking the queue again
+        """
+        self.config_path = config_path
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self._stop_event = _CONTEXT.Event()
+        self._processes: List[multiprocessing.Process] = []
+
+    def _spawn(self, index: int) -> multiprocessing.Process:
+        process = _CONTEXT.Process(
+            target=_worker_main,
+            args=(self.config_path, index, self.workers, self._stop_event, self.poll_interval),
+            name=f"worker-{index}",
+            daemon=True
+        )
+        process.start()
+        return process
+
+    def start(self):
+        """Start the worker processes, and replace any that died."""
+        if not self._processes:
+            self._stop_event.clear()
+            self._processes = [self._spawn(i) for i in range(self.workers)]
+            logging.info(f"Started {self.workers} worker processes")
+            return
+
+        for i, process in enumerate(self._processes):
+            if not process.is_alive():
+                logging.warning(f"{process.name} exited with code {process.exitcode}, restarting it")
+                self._processes[i] = self._spawn(i)
+
+    def stop(self, timeout: float = 60):
+        """Let every worker finish its current job, then wait for the processes to exit."""
+        if not self._processes:
+            return
+        self._stop_event.set()
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                logging.warning(f"{process.name} did not stop in time, terminating it")
+                process.terminate()
+                process.join()
+        self._processes = []
+        logging.info("Worker processes stopped")
@@ -0,0 +1,203 @@
+"""
+Test script for the asyncio runtime: concurrent dispatch of queued jobs, the
+in-flight cap, cancellation of the dispatcher and the executor hand-off of SMTP
+and queue calls, with a fake content processor and email handler.
+"""
+
+import asyncio
+import json
+import logging
+import shutil
+import sys
+import os
+import tempfile
+import threading
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.insert(0, project_root)
+
+from main import AsyncEmailAssistant
+from src.core.metrics import REGISTRY
+from src.core.work_queue import FETCHED, SENT
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+class FakeProcessor:
+    """Answers after a delay and records how many generations overlap."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.in_flight = 0
+        self.peak = 0
+        self.calls = 0
+
+    async def generate_response_async(self, email_data, intent=None):
+        self.calls += 1
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        return f"Hello, re: {email_data['subject']}"
+
+    def rate_limit_backlog(self) -> float:
+        return 0.0
+
+class FakeHandler:
+    """Records the replies and the thread each one was sent from."""
+
+    def __init__(self):
+        self.sent = []
+        self.threads = set()
+
+    def send_response(self, to_address: str, subject: str, body: str):
+        self.sent.append((to_address, subject, body))
+        self.threads.add(threading.get_ident())
+
+    def rate_limit_backlog(self) -> float:
+        return 0.0
+
+    def close(self):
+        pass
+
+def make_config(tmp: str):
+    """Write a single-mailbox configuration whose servers are never contacted."""
+    os.makedirs(os.path.join(tmp, "config"))
+    shutil.copy(os.path.join(project_root, "config", "business_config.json"),
+                os.path.join(tmp, "config", "business_config.json"))
+    with open(os.path.join(tmp, "config", "llm_config.json"), 'w') as f:
+        json.dump({"model_type": "local", "local_model": {"base_url": "http://127.0.0.1:9/v1", "model": "test"}}, f)
+    with open(os.path.join(tmp, "email_config.json"), 'w') as f:
+        json.dump({
+            "email_address": "me@example.com", "email_password": "secret",
+            "smtp_server": "127.0.0.1", "smtp_port": 9, "imap_server": "127.0.0.1", "imap_port": 9,
+            "openai_api_key": "unused", "metrics_port": 0,
+            "work_queue_path": os.path.join(tmp, "work_queue.db"),
+            "processed_store_path": os.path.join(tmp, "processed_messages.db"),
+            "sync_checkpoint_path": os.path.join(tmp, "sync_checkpoint.json")
+        }, f)
+
+def make_assistant(max_in_flight: int, delay: float) -> AsyncEmailAssistant:
+    runtime = AsyncEmailAssistant("email_config.json", max_in_flight=max_in_flight, poll_interval=0.05)
+    runtime.assistant.handler.close()
+    runtime.assistant.processor = FakeProcessor(delay)
+    runtime.assistant.handler = FakeHandler()
+    return runtime
+
+def queue_emails(runtime: AsyncEmailAssistant, count: int):
+    for i in range(count):
+        assert runtime.assistant.work_queue.enqueue({
+            'message_id': f'<m{i}@example.com>', 'from': f'sender{i}@example.com',
+            'subject': f'Question {i}', 'body': 'Hi'
+        }, state=FETCHED)
+
+def close(runtime: AsyncEmailAssistant):
+    assistant = runtime.assistant
+    REGISTRY.remove_collector(f"assistant:{assistant.config.email_address}")
+    assistant.monitor.close()
+    assistant.monitor.processed.close()
+    assistant.work_queue.close()
+
+def in_temp_dir(test):
+    """Run the test in a temporary directory holding the configs main.py loads."""
+    def run():
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                make_config(tmp)
+                test()
+            finally:
+                os.chdir(cwd)
+    run.__name__ = test.__name__
+    return run
+
+@in_temp_dir
+def test_replies_are_generated_concurrently_up_to_the_cap():
+    runtime = make_assistant(max_in_flight=3, delay=0.2)
+    queue_emails(runtime, 8)
+
+    async def dispatch_all():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        # Returns once every job is claimed, waiting for free slots along the way
+        await runtime._dispatch()
+        await asyncio.gather(*runtime._tasks)
+        return loop.time() - started
+
+    try:
+        elapsed = asyncio.run(dispatch_all())
+        processor = runtime.assistant.processor
+        assert processor.calls == 8 and processor.peak == 3
+        # Three at a time: three rounds of generation rather than eight
+        assert elapsed < 8 * 0.2
+        assert len(runtime.assistant.handler.sent) == 8
+        assert runtime.assistant.work_queue.counts()[SENT] == 8
+        # Every slot is returned once the replies are done
+        assert runtime._generation_slots._value == 3
+    finally:
+        close(runtime)
+
+@in_temp_dir
+def test_dispatch_loop_cancels_cleanly():
+    runtime = make_assistant(max_in_flight=2, delay=0.3)
+
+    async def run_and_cancel():
+        runtime._ensure_loop_state()
+        dispatcher = asyncio.create_task(runtime._dispatch_loop())
+        # Idle dispatcher picks up queued emails once woken
+        await asyncio.sleep(0.1)
+        queue_emails(runtime, 4)
+        runtime._work_available.set()
+        await asyncio.sleep(0.1)
+        assert runtime.assistant.processor.in_flight == 2
+
+        # Cancelled while waiting for a slot; the replies already started still finish
+        dispatcher.cancel()
+        try:
+            await dispatcher
+            assert False, "dispatcher not cancelled"
+        except asyncio.CancelledError:
+            pass
+        await asyncio.gather(*runtime._tasks)
+
+    try:
+        asyncio.run(run_and_cancel())
+        assert runtime.assistant.processor.calls == 2
+        assert len(runtime.assistant.handler.sent) == 2
+        counts = runtime.assistant.work_queue.counts()
+        assert counts[SENT] == 2 and counts[FETCHED] == 2
+        assert runtime._generation_slots._value == 2
+    finally:
+        close(runtime)
+
+@in_temp_dir
+def test_blocking_calls_run_in_the_executor():
+    runtime = make_assistant(max_in_flight=4, delay=0)
+    queue_emails(runtime, 4)
+
+    async def dispatch_all():
+        await runtime._dispatch()
+        await asyncio.gather(*runtime._tasks)
+        return threading.get_ident()
+
+    try:
+        loop_thread = asyncio.run(dispatch_all())
+        handler = runtime.assistant.handler
+        assert len(handler.sent) == 4
+        # SMTP never runs on the event loop's thread
+        assert handler.threads and loop_thread not in handler.threads
+        for i in range(4):
+            assert runtime.assistant.monitor.processed.is_processed({'message_id': f'<m{i}@example.com>'})
+    finally:
+        close(runtime)
+
+if __name__ == "__main__":
+    test_replies_are_generated_concurrently_up_to_the_cap()
+    test_dispatch_loop_cancels_cleanly()
+    test_blocking_calls_run_in_the_executor()
+    logging.info("Async assistant tests completed")
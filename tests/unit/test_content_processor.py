@@ -0,0 +1,223 @@
+"""
+Test script for ContentProcessor's streamed generation budgets, response caching
+and prompt cache invalidation, using fake LLM clients.
+"""
+
+import asyncio
+import json
+import logging
+import shutil
+import sys
+import os
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.insert(0, project_root)
+
+from src.core.email_handler import EmailConfig
+from src.ai.content_processor import ContentProcessor
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+EMAIL = {'subject': 'Opening hours', 'from': 'anna@example.com', 'body': 'When are you open on Saturday?'}
+
+def make_processor(tmp: str, **llm_config) -> ContentProcessor:
+    config_path = os.path.join(tmp, "email_config.json")
+    with open(config_path, 'w') as f:
+        json.dump({
+            "email_address": "me@example.com", "email_password": "secret",
+            "smtp_server": "localhost", "smtp_port": 25, "imap_server": "localhost", "imap_port": 143,
+            "openai_api_key": "unused"
+        }, f)
+    llm_config_path = os.path.join(tmp, "llm_config.json")
+    with open(llm_config_path, 'w') as f:
+        json.dump(dict({
+            "model_type": "local",
+            "local_model": {"base_url": "http://llm/v1", "model": "test"},
+            "system_prompt": "You answer emails.",
+            "response_cache": {"enabled": True, "path": os.path.join(tmp, "response_cache.db")}
+        }, **llm_config), f)
+    business_config_path = os.path.join(tmp, "business_config.json")
+    shutil.copy(os.path.join(project_root, "config", "business_config.json"), business_config_path)
+    return ContentProcessor(EmailConfig(config_path), llm_config_path, business_config_path)
+
+def chunk(content: str):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+class FakeStream:
+    def __init__(self, deltas):
+        self.chunks = [chunk(delta) for delta in deltas]
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    async def __aiter__(self):
+        for item in self.chunks:
+            yield item
+
+    def close(self):
+        self.closed = True
+
+class FakeAsyncStream(FakeStream):
+    async def close(self):
+        self.closed = True
+
+class FakeCompletions:
+    """Streams the given deltas after a delay, like a backend slow to start generating."""
+
+    def __init__(self, deltas, delay: float = 0, stream_class=FakeStream):
+        self.deltas = deltas
+        self.delay = delay
+        self.stream_class = stream_class
+        self.calls = 0
+
+    def create(self, **kwargs):
+        assert kwargs['stream']
+        self.calls += 1
+        time.sleep(self.delay)
+        return self.stream_class(self.deltas)
+
+class FakeAsyncCompletions(FakeCompletions):
+    async def create(self, **kwargs):
+        assert kwargs['stream']
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.stream_class(self.deltas)
+
+def fake_client(completions):
+    return SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+def test_time_budget_includes_waiting_for_first_chunk():
+    with tempfile.TemporaryDirectory() as tmp:
+        processor = make_processor(tmp, model_type="openai",
+                                   streaming={"enabled": True, "max_seconds": 0.2})
+        processor._openai_client = fake_client(FakeCompletions(["Hello", " Anna"], delay=0.3))
+        assert processor.generate_response_openai(EMAIL) == "Hello"
+        stats = processor.last_generation_stats()
+        assert stats['stop_reason'] == 'max_seconds' and stats['time_to_first_token'] >= 0.3
+
+        completions = FakeAsyncCompletions(["Hello", " Anna"], delay=0.3, stream_class=FakeAsyncStream)
+        processor._async_client = fake_client(completions)
+        assert asyncio.run(processor.generate_response_async(EMAIL)) == "Hello"
+
+def test_cut_off_replies_are_not_cached():
+    with tempfile.TemporaryDirectory() as tmp:
+        processor = make_processor(tmp, model_type="openai",
+                                   streaming={"enabled": True, "max_tokens": 2})
+        completions = FakeCompletions(["We", " are", " open", " 9-12."])
+        processor._openai_client = fake_client(completions)
+        assert processor.generate_response(EMAIL) == "We are"
+        assert processor.generate_response(EMAIL) == "We are"
+        assert completions.calls == 2
+
+        completions = FakeAsyncCompletions(["We", " are", " open"], stream_class=FakeAsyncStream)
+        processor._async_client = fake_client(completions)
+        asyncio.run(processor.generate_response_async(EMAIL))
+        asyncio.run(processor.generate_response_async(EMAIL))
+        assert completions.calls == 2
+        processor._get_response_cache().close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Complete replies are cached and reused
+        processor = make_processor(tmp, model_type="openai",
+                                   streaming={"enabled": True, "max_tokens": 10})
+        completions = FakeCompletions(["We", " are", " open", " 9-12."])
+        processor._openai_client = fake_client(completions)
+        assert processor.generate_response(EMAIL) == "We are open 9-12."
+        assert processor.generate_response(EMAIL) == "We are open 9-12."
+        assert completions.calls == 1
+        processor._get_response_cache().close()
+
+def test_queued_intent_is_not_classified_again():
+    with tempfile.TemporaryDirectory() as tmp:
+        processor = make_processor(tmp, model_type="openai", streaming={"enabled": True})
+        processor._openai_client = fake_client(FakeCompletions(["We are open."]))
+        processor._async_client = fake_client(FakeAsyncCompletions(["We are open."], stream_class=FakeAsyncStream))
+        classified = []
+        categorize = processor._categorize_email_intent
+
+        def counting_categorize(email_content):
+            classified.append(email_content['subject'])
+            return categorize(email_content)
+
+        processor._categorize_email_intent = counting_categorize
+        processor.generate_response(EMAIL, 'information')
+        asyncio.run(processor.generate_response_async(EMAIL, 'information'))
+        assert classified == []
+        processor.generate_response(dict(EMAIL, subject='Other question'))
+        assert classified == ['Other question']
+        processor._get_response_cache().close()
+
+def edit_json(path: str, **changes):
+    with open(path) as f:
+        data = json.load(f)
+    data.update(changes)
+    with open(path, 'w') as f:
+        json.dump(data, f)
+    # Make the edit visible even within the filesystem's timestamp granularity
+    mtime = os.stat(path).st_mtime + 10
+    os.utime(path, (mtime, mtime))
+
+def test_config_edits_invalidate_cached_prompt():
+    with tempfile.TemporaryDirectory() as tmp:
+        processor = make_processor(tmp)
+        prompt = processor._get_system_prompt()
+        version = processor._get_prompt_version()
+        processor._get_intent_context('appointment')
+        assert prompt.startswith("You answer emails.")
+
+        edit_json(os.path.join(tmp, "business_config.json"), name="Renamed Practice")
+        processor._refresh_if_changed()
+        assert "Renamed Practice" in processor._get_system_prompt()
+        assert processor._get_prompt_version() != version
+        assert processor._intent_context_cache is None
+        assert processor._get_intent_context('appointment') is not None
+
+        edit_json(os.path.join(tmp, "llm_config.json"), system_prompt="You reply politely.")
+        processor._refresh_if_changed()
+        prompt = processor._get_system_prompt()
+        assert prompt.startswith("You reply politely.") and "Renamed Practice" in prompt
+
+def test_prompt_built_during_reload_is_not_kept():
+    with tempfile.TemporaryDirectory() as tmp:
+        processor = make_processor(tmp)
+        built = threading.Event()
+        release = threading.Event()
+        enhance = processor._enhance_system_prompt
+
+        def slow_enhance(base_prompt):
+            prompt = enhance(base_prompt)
+            built.set()
+            release.wait(5)
+            return prompt
+
+        # A prompt of the old config is still being built when the config changes
+        processor._enhance_system_prompt = slow_enhance
+        builder = threading.Thread(target=processor._get_system_prompt)
+        builder.start()
+        assert built.wait(5)
+        edit_json(os.path.join(tmp, "business_config.json"), name="Renamed Practice")
+        refresher = threading.Thread(target=processor._refresh_if_changed)
+        refresher.start()
+        time.sleep(0.1)
+        release.set()
+        builder.join()
+        refresher.join()
+
+        processor._enhance_system_prompt = enhance
+        assert "Renamed Practice" in processor._get_system_prompt()
+
+if __name__ == "__main__":
+    test_time_budget_includes_waiting_for_first_chunk()
+    test_cut_off_replies_are_not_cached()
+    test_queued_intent_is_not_classified_again()
+    test_config_edits_invalidate_cached_prompt()
+    test_prompt_built_during_reload_is_not_kept()
+    logging.info("Content processor tests completed")
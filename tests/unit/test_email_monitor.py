@@ -0,0 +1,199 @@
+"""
+Test script for EmailMonitor's sync checkpoint handling and IMAP IDLE against fake connections.
+"""
+
+import json
+import logging
+import sys
+import os
+import socket
+import tempfile
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.insert(0, project_root)
+
+from src.core.email_handler import EmailConfig
+from src.core.email_monitor import EmailMonitor
+from src.core.sync_checkpoint import SyncCheckpoint
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+def make_message(uid: int) -> bytes:
+    return (f"From: sender{uid}@example.com\r\nTo: me@example.com\r\nSubject: Question {uid}\r\n"
+            f"Message-ID: <m{uid}@example.com>\r\n\r\nHello {uid}\r\n").encode()
+
+class FakeIMAPConnection:
+    """Answers the UID SEARCH/FETCH/STORE commands EmailMonitor sends."""
+
+    def __init__(self, uids):
+        self.messages = {uid: make_message(uid) for uid in uids}
+        self.seen = set()
+        self.capabilities = ('IMAP4REV1',)
+
+    def _uid_set(self, spec: str):
+        uids = set()
+        for part in spec.split(','):
+            low, _, high = part.partition(':')
+            high = high or low
+            low = max(self.messages) if low == '*' else int(low)
+            high = max(self.messages) if high == '*' else int(high)
+            uids |= {uid for uid in self.messages if min(low, high) <= uid <= max(low, high)}
+        return sorted(uids)
+
+    def uid(self, command, *args):
+        if command == 'SEARCH':
+            criteria = args[1]
+            if criteria == 'UNSEEN':
+                uids = [uid for uid in sorted(self.messages) if uid not in self.seen]
+            else:
+                uids = self._uid_set(criteria.split()[1])
+            return 'OK', [' '.join(map(str, uids)).encode()]
+        if command == 'FETCH':
+            data = []
+            for uid in self._uid_set(args[0]):
+                raw = self.messages[uid]
+                data.append((f"{uid} (UID {uid} RFC822 {{{len(raw)}}}".encode(), raw))
+                data.append(b')')
+            return 'OK', data
+        if command == 'STORE':
+            self.seen.update(self._uid_set(args[0]))
+            return 'OK', [b'']
+        raise AssertionError(f"unexpected command {command}")
+
+    def logout(self):
+        pass
+
+class FakeIdleConnection:
+    """Server side of IDLE on a socket pair: confirms IDLE, optionally announces mail, ends on DONE."""
+
+    def __init__(self, announce: bytes = b''):
+        self.sock, self.server = socket.socketpair()
+        self.announce = announce
+        self.untagged_responses = {}
+        self.capabilities = ('IMAP4REV1', 'IDLE')
+        self.sent = []
+
+    def _new_tag(self) -> bytes:
+        return b'A001'
+
+    def send(self, data: bytes):
+        self.sent.append(data)
+        if data == b'A001 IDLE\r\n':
+            self.server.sendall(b'+ idling\r\n' + self.announce)
+        elif data == b'DONE\r\n':
+            self.server.sendall(b'A001 OK IDLE terminated\r\n')
+
+    def shutdown(self):
+        self.sock.close()
+        self.server.close()
+
+def make_monitor(tmp: str) -> EmailMonitor:
+    config_path = os.path.join(tmp, "email_config.json")
+    with open(config_path, 'w') as f:
+        json.dump({
+            "email_address": "me@example.com", "email_password": "secret",
+            "smtp_server": "localhost", "smtp_port": 25, "imap_server": "localhost", "imap_port": 143,
+            "openai_api_key": "unused", "fetch_mode": "full",
+            "sync_checkpoint_path": os.path.join(tmp, "sync_checkpoint.json"),
+            "processed_store_path": os.path.join(tmp, "processed_messages.db")
+        }, f)
+    return EmailMonitor(EmailConfig(config_path))
+
+def connect(monitor: EmailMonitor, imap: FakeIMAPConnection):
+    monitor._imap = imap
+    monitor._uidvalidity = 1
+
+def test_uncommitted_check_is_fetched_again():
+    with tempfile.TemporaryDirectory() as tmp:
+        monitor = make_monitor(tmp)
+        imap = FakeIMAPConnection([1, 2, 3])
+        connect(monitor, imap)
+
+        # Bootstrap from unread mail; queueing fails before the checkpoint is committed
+        assert [e['uid'] for e in monitor.check_new_emails(commit=False)] == [1, 2, 3]
+        assert imap.seen == {1, 2, 3}
+        assert not os.path.exists(os.path.join(tmp, "sync_checkpoint.json"))
+
+        # The emails are \Seen now, but the next check still returns them
+        assert [e['uid'] for e in monitor.check_new_emails(commit=False)] == [1, 2, 3]
+        monitor.commit_checkpoint()
+        assert monitor.check_new_emails(commit=False) == []
+        assert SyncCheckpoint(os.path.join(tmp, "sync_checkpoint.json"), "me@example.com/INBOX").last_uid == 3
+
+        # Incremental checks behave the same way
+        imap.messages[4] = make_message(4)
+        imap.messages[5] = make_message(5)
+        assert [e['uid'] for e in monitor.check_new_emails(commit=False)] == [4, 5]
+        assert monitor.checkpoint.last_uid == 3
+        assert [e['uid'] for e in monitor.check_new_emails(commit=False)] == [4, 5]
+        monitor.commit_checkpoint()
+        assert monitor.checkpoint.last_uid == 5
+        assert monitor.check_new_emails() == []
+        monitor.processed.close()
+
+def test_unparseable_email_is_reported():
+    with tempfile.TemporaryDirectory() as tmp:
+        monitor = make_monitor(tmp)
+        connect(monitor, FakeIMAPConnection([1, 2, 3]))
+        parse_email = monitor._parse_email
+
+        def failing_parse(msg):
+            if msg['Subject'] == 'Question 2':
+                raise ValueError("broken MIME structure")
+            return parse_email(msg)
+
+        monitor._parse_email = failing_parse
+        assert [e['uid'] for e in monitor.check_new_emails()] == [1, 3]
+        # The checkpoint moves past UID 2, so it is handed to the caller as failed
+        assert monitor.checkpoint.last_uid == 3
+        assert len(monitor.failed_emails) == 1
+        failed = monitor.failed_emails[0]
+        assert failed['uid'] == 2 and failed['from'] == 'sender2@example.com'
+        assert failed['message_id'] == '<m2@example.com>' and 'broken MIME' in failed['error']
+        monitor.processed.close()
+
+def test_idle_wakes_on_exists():
+    with tempfile.TemporaryDirectory() as tmp:
+        monitor = make_monitor(tmp)
+        imap = FakeIdleConnection(announce=b'* 4 EXISTS\r\n')
+        connect(monitor, imap)
+        assert monitor.wait_for_new_mail(timeout=5) is True
+        assert imap.sent == [b'A001 IDLE\r\n', b'DONE\r\n']
+        # IDLE ended cleanly, the connection is kept for the next check
+        assert monitor._imap is imap
+        imap.shutdown()
+        monitor.processed.close()
+
+def test_idle_timeout_ends_with_done():
+    with tempfile.TemporaryDirectory() as tmp:
+        monitor = make_monitor(tmp)
+        imap = FakeIdleConnection()
+        connect(monitor, imap)
+        assert monitor.wait_for_new_mail(timeout=0.2) is False
+        assert imap.sent == [b'A001 IDLE\r\n', b'DONE\r\n']
+        imap.shutdown()
+        monitor.processed.close()
+
+def test_mail_announced_during_check_skips_idle():
+    with tempfile.TemporaryDirectory() as tmp:
+        monitor = make_monitor(tmp)
+        imap = FakeIdleConnection()
+        # Left by imaplib after a SEARCH/FETCH/STORE of the previous check
+        imap.untagged_responses['EXISTS'] = [b'5']
+        connect(monitor, imap)
+        assert monitor.wait_for_new_mail(timeout=5) is True
+        assert imap.sent == []
+        assert 'EXISTS' not in imap.untagged_responses
+        imap.shutdown()
+        monitor.processed.close()
+
+if __name__ == "__main__":
+    test_uncommitted_check_is_fetched_again()
+    test_unparseable_email_is_reported()
+    test_idle_wakes_on_exists()
+    test_idle_timeout_ends_with_done()
+    test_mail_announced_during_check_skips_idle()
+    logging.info("Email monitor tests completed")
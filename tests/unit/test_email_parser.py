@@ -0,0 +1,110 @@
+"""
+Test script for MIME text extraction and for stripping quoted history and
+signatures from email bodies.
+"""
+
+import logging
+import sys
+import os
+from email.message import EmailMessage
+from email.mime.text import MIMEText
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.insert(0, project_root)
+
+from src.core.email_parser import EmailParser
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+def test_strip_english_reply():
+    body = (
+        "Hi, can I move my appointment to Friday?\n"
+        "\n"
+        "Thanks,\n"
+        "Anna\n"
+        "\n"
+        "On Mon, Jan 8, 2024 at 10:00 AM Praxis Example <info@example.com>\n"
+        "wrote:\n"
+        "> Your appointment is confirmed for Thursday.\n"
+        "> Best regards\n"
+    )
+    text, stats = EmailParser.strip_quoted_content(body)
+    assert text == "Hi, can I move my appointment to Friday?\n\nThanks,\nAnna"
+    assert stats['chars_saved'] == len(body) - len(text)
+    assert stats['tokens_saved'] > 0
+
+def test_strip_german_outlook_reply_and_signature():
+    body = (
+        "Guten Tag,\n"
+        "haben Sie nächste Woche noch einen Termin frei?\n"
+        "Viele Grüße\n"
+        "Jonas Beispiel\n"
+        "\n"
+        "Von meinem iPhone gesendet\n"
+        "\n"
+        "Von: Praxis Example <info@example.com>\n"
+        "Gesendet: Montag, 8. Januar 2024 10:00\n"
+        "An: Jonas Beispiel\n"
+        "Betreff: Ihr Termin\n"
+        "\n"
+        "Ihr Termin ist bestätigt.\n"
+    )
+    text, _ = EmailParser.strip_quoted_content(body)
+    assert text.endswith("Jonas Beispiel")
+    assert "Gesendet:" not in text
+
+    text, _ = EmailParser.strip_quoted_content("Danke!\n-- \nDr. Max Muster\nTel. 0123\n")
+    assert text == "Danke!"
+
+def test_keep_new_content():
+    # Inline replies keep the new lines, bare forwards keep everything
+    text, _ = EmailParser.strip_quoted_content("> Which day suits you?\nMonday works.\n")
+    assert text == "Monday works."
+
+    body = "> only quoted text\n"
+    text, stats = EmailParser.strip_quoted_content(body)
+    assert text == body and stats['chars_saved'] == 0
+
+def test_extract_best_alternative():
+    msg = EmailMessage()
+    msg['Subject'] = "=?utf-8?q?Termin_f=C3=BCr_M=C3=BCller?="
+    msg['From'] = "Anna <anna@example.com>"
+    msg.set_content("Plain text version")
+    msg.add_alternative("<p>HTML version</p>", subtype='html')
+    msg.add_attachment(b"%PDF-1.4 binary", maintype='application', subtype='pdf', filename='scan.pdf')
+    msg.add_attachment("attached notes", filename='notes.txt')
+
+    email_data = EmailParser.parse_email_message(msg)
+    assert email_data['subject'] == "Termin für Müller"
+    assert email_data['body'] == "Plain text version"
+
+    html_only = EmailMessage()
+    html_only.set_content("<p>Hallo,</p><p>bitte <a href='https://x.test/t'>Termin</a></p>", subtype='html')
+    assert EmailParser.parse_email_message(html_only)['body'] == "Hallo,\nbitte Termin (https://x.test/t)"
+
+def test_decode_declared_charset():
+    latin = MIMEText("Grüße aus Köln", 'plain', 'iso-8859-1')
+    assert EmailParser.parse_email_message(latin)['body'] == "Grüße aus Köln"
+
+    # Declared as ASCII but sent as UTF-8
+    mislabeled = EmailMessage()
+    mislabeled.set_payload("Grüße".encode('utf-8'))
+    mislabeled['Content-Type'] = 'text/plain; charset="us-ascii"'
+    assert EmailParser.parse_email_message(mislabeled)['body'] == "Grüße"
+
+def test_part_size_cap():
+    msg = MIMEText("first line\n" + "x" * 5000 + "\n", 'plain', 'utf-8')
+    email_data = EmailParser.parse_email_message(msg, max_part_bytes=1000)
+    assert email_data['body'] == "first line"
+
+if __name__ == "__main__":
+    test_strip_english_reply()
+    test_strip_german_outlook_reply_and_signature()
+    test_keep_new_content()
+    test_extract_best_alternative()
+    test_decode_declared_charset()
+    test_part_size_cap()
+    logging.info("Email parser tests completed")
@@ -0,0 +1,109 @@
+"""
+Test script for the streaming HTML to text extraction, with a benchmark
+against the previous BeautifulSoup implementation.
+"""
+
+import logging
+import sys
+import os
+import re
+import time
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.insert(0, project_root)
+
+from bs4 import BeautifulSoup
+from src.core.email_parser import EmailParser
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+def legacy_clean_html(html_content: str) -> str:
+    """The BeautifulSoup implementation previously used by EmailParser.clean_html."""
+    html_content = re.sub(r'<!--.*?-->', '', html_content, flags=re.DOTALL)
+    soup = BeautifulSoup(html_content, 'html.parser')
+    for tag in soup(['script', 'style', 'meta', 'link', 'head']):
+        tag.decompose()
+    for a in soup.find_all('a'):
+        href = a.get('href', '')
+        text = a.get_text().strip()
+        if href and text and href != text:
+            a.replace_with(f"{text} ({href})")
+        else:
+            a.replace_with(text or href)
+    for br in soup.find_all(['br', 'p']):
+        br.replace_with('\n' + br.get_text() + '\n')
+    text = soup.get_text()
+    lines = []
+    for line in text.split('\n'):
+        line = line.strip()
+        if line and not line.startswith('http') and not line.startswith('https'):
+            lines.append(line)
+    return '\n'.join(lines)
+
+def newsletter_html(items: int = 300) -> str:
+    """A newsletter-like document: head with styles, nested tables, many links."""
+    rows = []
+    for i in range(items):
+        rows.append(f"""
+        <tr><td class="item" style="padding:8px;font-family:Arial">
+            <!-- item {i} -->
+            <p><b>Offer {i}</b>: skin care &amp; consultation at <a href="https://example.com/offer/{i}?utm_source=mail">our clinic</a></p>
+            <p>Book now<br>or call us<br/>Mon&ndash;Fri</p>
+            <a href="https://example.com/img/{i}"><img src="https://example.com/img/{i}.png" alt=""></a>
+        </td></tr>""")
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Newsletter</title>
+<style>td.item {{ color: #333; }} p {{ margin: 0; }}</style>
+<script>var tracking = "<p>not text</p>";</script></head>
+<body><table width="600"><tbody>{''.join(rows)}</tbody></table>
+<p>Unsubscribe: <a href="https://example.com/unsubscribe">https://example.com/unsubscribe</a></p>
+</body></html>"""
+
+def test_same_output_as_legacy():
+    samples = [
+        "<p>Hello <b>Anna</b>,</p><p>see <a href='https://x.test/a'>the form</a>.</p>",
+        "<div>Line one<br>Line two<br/>Line three</div>",
+        "<html><head><title>T</title><style>p{}</style></head><body><p>Body &amp; text</p></body></html>",
+        "<p>Link <a href='https://x.test'>https://x.test</a> and <a>no href</a></p>",
+        "<script>alert(1)</script><!-- a comment -->Plain &lt;text&gt;",
+    ]
+    for html in samples:
+        assert EmailParser.clean_html(html) == legacy_clean_html(html), html
+
+def test_line_breaks_inside_paragraphs():
+    # The BeautifulSoup version flattened <p> before handling its <br> tags
+    html = "<p>Book now<br>or call us</p>"
+    assert EmailParser.clean_html(html) == "Book now\nor call us"
+    assert legacy_clean_html(html) == "Book nowor call us"
+
+def same_text(a: str, b: str) -> bool:
+    """Equal apart from line breaks."""
+    return re.sub(r'\s+', '', a) == re.sub(r'\s+', '', b)
+
+def test_benchmark_newsletter():
+    html = newsletter_html()
+
+    runs = 5
+    start = time.perf_counter()
+    for _ in range(runs):
+        legacy = legacy_clean_html(html)
+    legacy_time = (time.perf_counter() - start) / runs
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        streamed = EmailParser.clean_html(html)
+    streamed_time = (time.perf_counter() - start) / runs
+
+    logging.info(f"{len(html)} bytes of HTML: BeautifulSoup {legacy_time * 1000:.1f} ms, "
+                 f"streaming {streamed_time * 1000:.1f} ms "
+                 f"({legacy_time / streamed_time:.1f}x faster)")
+    assert same_text(streamed, legacy)
+
+if __name__ == "__main__":
+    test_same_output_as_legacy()
+    test_line_breaks_inside_paragraphs()
+    test_benchmark_newsletter()
+    logging.info("HTML extraction tests completed")
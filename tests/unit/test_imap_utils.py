@@ -0,0 +1,124 @@
+"""
+Test script for IMAP batching helpers and FETCH response parsing.
+"""
+
+import logging
+import sys
+import os
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.insert(0, project_root)
+
+from src.core.imap_utils import (chunked, compress_uid_set, find_text_parts, parse_date_header,
+                                 parse_fetch_response, parse_internaldate)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+def test_compress_uid_set():
+    assert compress_uid_set([5, 1, 2, 3, 7, 9, 10]) == "1:3,5,7,9:10"
+    assert compress_uid_set([42]) == "42"
+    assert list(chunked([1, 2, 3, 4, 5], 2)) == [[1, 2], [3, 4], [5]]
+
+def test_parse_fetch_response():
+    # Shape of imaplib's result for "UID FETCH 5:6 (RFC822)"
+    data = [
+        (b'1 (UID 5 RFC822 {5}', b'first'),
+        b')',
+        (b'2 (UID 6 RFC822 {6}', b'second'),
+        b')'
+    ]
+    messages = parse_fetch_response(data)
+    assert [m['UID'] for m in messages] == [5, 6]
+    assert messages[1]['RFC822'] == b'second'
+
+def test_parse_fetch_response_multiple_literals():
+    data = [
+        (b'1 (UID 5 BODY[HEADER.FIELDS (FROM TO)] {3}', b'abc'),
+        (b' BODY[1]<0> {2}', b'xy'),
+        b' FLAGS (\\Seen) RFC822.SIZE 55)'
+    ]
+    message = parse_fetch_response(data)[0]
+    assert message['BODY[HEADER.FIELDS (FROM TO)]'] == b'abc'
+    assert message['BODY[1]<0>'] == b'xy'
+    assert message['FLAGS'] == ['\\Seen']
+    assert message['RFC822.SIZE'] == 55
+
+def test_find_text_part_skips_attachments():
+    # multipart/mixed: (multipart/alternative: plain, html), PDF attachment
+    data = [
+        b'1 (UID 9 BODYSTRUCTURE ((("TEXT" "PLAIN" ("CHARSET" "iso-8859-1") NIL NIL "QUOTED-PRINTABLE" 120 4 NIL NIL NIL)'
+        b'("TEXT" "HTML" ("CHARSET" "utf-8") NIL NIL "BASE64" 900 12 NIL NIL NIL) "ALTERNATIVE")'
+        b'("APPLICATION" "PDF" ("NAME" "scan.pdf") NIL NIL "BASE64" 4000000 NIL ("ATTACHMENT" ("FILENAME" "scan.pdf")) NIL) "MIXED"))'
+    ]
+    structure = parse_fetch_response(data)[0]['BODYSTRUCTURE']
+    parts = find_text_parts(structure)
+    assert len(parts) == 1
+    part = parts[0]
+    assert part['section'] == '1.1'
+    assert part['subtype'] == 'plain'
+    assert part['charset'] == 'iso-8859-1'
+    assert part['encoding'] == 'quoted-printable'
+
+def test_find_text_part_single_part():
+    structure = parse_fetch_response([b'1 (UID 3 BODYSTRUCTURE ("TEXT" "HTML" NIL NIL NIL "7BIT" 50 2))'])[0]['BODYSTRUCTURE']
+    [part] = find_text_parts(structure)
+    assert part['section'] == '1'
+    assert part['subtype'] == 'html'
+    assert find_text_parts(['IMAGE', 'PNG', None, None, None, 'BASE64', 10]) == []
+
+def test_find_text_parts_of_mixed_message():
+    # multipart/mixed: plain intro, PNG, (multipart/alternative: html, plain), inline plain footer
+    data = [
+        b'1 (UID 5 BODYSTRUCTURE (("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 20 1 NIL NIL NIL)'
+        b'("IMAGE" "PNG" ("NAME" "a.png") NIL NIL "BASE64" 800 NIL ("INLINE" NIL) NIL)'
+        b'(("TEXT" "HTML" ("CHARSET" "utf-8") NIL NIL "7BIT" 90 3 NIL NIL NIL)'
+        b'("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 40 2 NIL NIL NIL) "ALTERNATIVE")'
+        b'("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "BASE64" 30 1 NIL ("INLINE" NIL) NIL) "MIXED"))'
+    ]
+    parts = find_text_parts(parse_fetch_response(data)[0]['BODYSTRUCTURE'])
+    # Every inline text part full parsing reads, one alternative each
+    assert [(part['section'], part['subtype']) for part in parts] == [('1', 'plain'), ('3.2', 'plain'), ('4', 'plain')]
+    assert parts[2]['encoding'] == 'base64'
+
+def test_find_text_parts_of_forwarded_message():
+    envelope = (b'("Mon, 7 Jul 2025 10:00:00 +0200" "Question" ((NIL NIL "anna" "example.com")) '
+                b'((NIL NIL "anna" "example.com")) ((NIL NIL "anna" "example.com")) '
+                b'((NIL NIL "info" "example.com")) NIL NIL NIL "<f1@example.com>")')
+    # multipart/mixed: plain note, forwarded (multipart/alternative: plain, html),
+    # forwarded attachment, forwarded single-part plain
+    data = [
+        b'1 (UID 6 BODYSTRUCTURE (("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 20 1 NIL NIL NIL)'
+        b'("MESSAGE" "RFC822" NIL NIL NIL "7BIT" 400 ' + envelope +
+        b' (("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 40 2 NIL NIL NIL)'
+        b'("TEXT" "HTML" ("CHARSET" "utf-8") NIL NIL "7BIT" 90 3 NIL NIL NIL) "ALTERNATIVE") 12 NIL NIL NIL)'
+        b'("MESSAGE" "RFC822" NIL NIL NIL "7BIT" 300 ' + envelope +
+        b' ("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 50 2 NIL NIL NIL) 8 NIL ("ATTACHMENT" NIL) NIL)'
+        b'("MESSAGE" "RFC822" NIL NIL NIL "7BIT" 300 ' + envelope +
+        b' ("TEXT" "PLAIN" ("CHARSET" "iso-8859-1") NIL NIL "QUOTED-PRINTABLE" 60 2 NIL NIL NIL) 8 NIL NIL NIL)'
+        b' "MIXED"))'
+    ]
+    parts = find_text_parts(parse_fetch_response(data)[0]['BODYSTRUCTURE'])
+    # Parts of an embedded message are numbered below it, a single-part body as ".1"
+    assert [(part['section'], part['subtype']) for part in parts] == [('1', 'plain'), ('2.1', 'plain'), ('4.1', 'plain')]
+    assert parts[2]['encoding'] == 'quoted-printable' and parts[2]['charset'] == 'iso-8859-1'
+
+def test_arrival_time():
+    data = [(b'1 (UID 4 INTERNALDATE " 7-Jul-2025 10:00:00 +0200" RFC822 {2}', b'hi'), b')']
+    received = parse_internaldate(parse_fetch_response(data)[0]['INTERNALDATE'])
+    assert received == parse_date_header("Mon, 07 Jul 2025 08:00:00 +0000")
+    assert parse_internaldate(None) is None
+    assert parse_date_header("not a date") is None
+
+if __name__ == "__main__":
+    test_compress_uid_set()
+    test_parse_fetch_response()
+    test_parse_fetch_response_multiple_literals()
+    test_find_text_part_skips_attachments()
+    test_find_text_part_single_part()
+    test_find_text_parts_of_mixed_message()
+    test_find_text_parts_of_forwarded_message()
+    test_arrival_time()
+    logging.info("IMAP utility tests completed successfully!")
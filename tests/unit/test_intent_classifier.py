@@ -0,0 +1,97 @@
+"""
+Test script for the keyword intent classifier, with a benchmark against
+the previous substring matching.
+"""
+
+import logging
+import sys
+import os
+import time
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.insert(0, project_root)
+
+from src.ai.intent_classifier import IntentClassifier
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+LEGACY_KEYWORDS = {
+    'appointment': ['appointment', 'booking', 'schedule', 'visit', 'termin'],
+    'services': ['treatment', 'service', 'procedure', 'therapy', 'behandlung'],
+    'costs': ['cost', 'price', 'fee', 'insurance', 'payment', 'kosten'],
+    'information': ['information', 'details', 'question', 'inquiry', 'info'],
+    'emergency': ['emergency', 'urgent', 'immediate', 'notfall']
+}
+
+def legacy_categorize(subject: str, body: str, keywords=LEGACY_KEYWORDS) -> str:
+    """The substring matching previously used by ContentProcessor."""
+    subject = subject.lower()
+    body = body.lower()
+    for intent, words in keywords.items():
+        if any(word in subject or word in body for word in words):
+            return intent
+    return 'general'
+
+def time_per_call(function, runs: int = 10):
+    start = time.perf_counter()
+    for _ in range(runs):
+        result = function()
+    return (time.perf_counter() - start) / runs, result
+
+def test_word_boundaries():
+    classifier = IntentClassifier()
+    # Keywords inside other words ("visit" in "revisit", "info" in "infos") no longer match
+    assert classifier.primary_intent("Revisit", "We need to revisit the plan, see infos below") == 'general'
+    assert classifier.primary_intent("Termine", "Ich brauche einen Termin") == 'appointment'
+    assert classifier.primary_intent("", "Feeling fine") == 'general'
+
+def test_scored_multi_label():
+    classifier = IntentClassifier()
+    intents = classifier.classify("Urgent question", "What is the price of the treatment? Does insurance pay?")
+    scores = dict(intents)
+    assert set(scores) == {'emergency', 'information', 'costs', 'services'}
+    # Two body hits for costs beat a single subject hit
+    assert scores['costs'] == 2.0 and scores['emergency'] == 2.0
+    # Ties keep the configured intent order
+    assert intents[0][0] == 'costs'
+
+def test_repeated_words_and_punctuation():
+    classifier = IntentClassifier()
+    # Every occurrence counts, whatever punctuation surrounds it
+    assert classifier.classify("", "Price? price, (PRICE) prices") == [('costs', 4.0)]
+    assert classifier.classify("fees/insurance", "") == [('costs', 4.0)]
+    # Cached tokens give the same result on the next email
+    assert classifier.classify("", "price, price") == [('costs', 2.0)]
+
+def test_keywords_from_config():
+    classifier = IntentClassifier({'prescription': ['rezept*', 'prescription*']}, subject_weight=1.0)
+    assert classifier.classify("Rezeptanfrage", "") == [('prescription', 1.0)]
+    assert classifier.primary_intent("Appointment", "") == 'general'
+
+def test_benchmark_long_email():
+    filler = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 2000
+    subject = "Re: our conversation"
+    body = filler + " Could you tell me the price?"
+
+    # A larger vocabulary, as loaded from config, with the price keyword last
+    large = {f"intent_{i}": [f"keyword{i}x{j}" for j in range(10)] for i in range(30)}
+    large['costs'] = ['price']
+
+    for name, keywords in (("default", LEGACY_KEYWORDS), ("300 keywords", large)):
+        classifier = IntentClassifier(keywords)
+        legacy_time, legacy = time_per_call(lambda: legacy_categorize(subject, body, keywords))
+        classifier_time, scored = time_per_call(lambda: classifier.primary_intent(subject, body))
+        logging.info(f"{name}, {len(body)} chars: legacy {legacy_time * 1000:.2f} ms, "
+                     f"classifier {classifier_time * 1000:.2f} ms per email")
+        assert legacy == scored == 'costs'
+
+if __name__ == "__main__":
+    test_word_boundaries()
+    test_scored_multi_label()
+    test_repeated_words_and_punctuation()
+    test_keywords_from_config()
+    test_benchmark_long_email()
+    logging.info("Intent classifier tests completed")
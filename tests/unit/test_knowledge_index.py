@@ -0,0 +1,55 @@
+"""
+Test script for retrieving business knowledge with the BM25 index.
+"""
+
+import logging
+import sys
+import os
+import json
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.insert(0, project_root)
+
+from src.ai.knowledge_index import KnowledgeIndex, chunk_business_config
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+def load_business_config():
+    with open(os.path.join(project_root, "config", "business_config.json")) as f:
+        return json.load(f)
+
+def test_chunking():
+    chunks = chunk_business_config(load_business_config(), exclude=["name", "contact"])
+    titles = [chunk['title'] for chunk in chunks]
+    assert "Services > Specialized > Hair Loss" in titles
+    # One chunk per staff member
+    assert titles.count("Staff") == 2
+    assert not any(title.startswith("Contact") for title in titles)
+
+    long_text = {"faq": "\n".join(f"Question {i}: answer with several words" for i in range(100))}
+    pieces = chunk_business_config(long_text, max_words=50)
+    assert len(pieces) > 1
+    assert all(len(piece['text'].split()) <= 50 + 2 for piece in pieces)
+
+def test_search_relevance_and_budget():
+    index = KnowledgeIndex(chunk_business_config(load_business_config()))
+
+    results = index.search("Do you treat excessive sweating (hyperhidrosis)?", top_k=3)
+    assert results[0]['title'] == "Services > Specialized > Hyperhidrosis"
+
+    results = index.search("Ich habe Haarausfall, hair loss since months", top_k=3)
+    assert results[0]['title'] == "Services > Specialized > Hair Loss"
+
+    assert index.search("zzz unrelated", top_k=3) == []
+
+    # The token budget limits how much knowledge reaches the prompt
+    results = index.search("laser treatment skin", top_k=10, max_tokens=30)
+    assert sum((len(chunk['text']) + 3) // 4 for chunk in results) <= 30
+
+if __name__ == "__main__":
+    test_chunking()
+    test_search_relevance_and_budget()
+    logging.info("Knowledge index tests completed")
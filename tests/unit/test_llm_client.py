@@ -0,0 +1,157 @@
+"""
+Test script for the LLM HTTP client's retries and stream helpers.
+"""
+
+import io
+import json
+import logging
+import sys
+import os
+import time
+
+import requests
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.insert(0, project_root)
+
+from src.ai.llm_client import LLMHttpClient, StreamBudget, iter_sse_content
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+def make_response(status: int, retry_after: str = None) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response.url = "http://llm/v1/chat/completions"
+    response.raw = io.BytesIO(b'{"ok": true}')
+    if retry_after is not None:
+        response.headers['Retry-After'] = retry_after
+    return response
+
+class FakeSession:
+    """Answers each post() with the next response, or raises it if it is an exception."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def post(self, url, **kwargs):
+        self.calls += 1
+        result = self.responses.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+def post_with(responses, sleeps, **http_config):
+    client = LLMHttpClient(dict({"backoff_base": 0.5, "backoff_max": 20}, **http_config))
+    client.session = FakeSession(responses)
+    sleep = time.sleep
+    time.sleep = sleeps.append
+    try:
+        return client, client.post("http://llm/v1/chat/completions", {"model": "test"})
+    finally:
+        time.sleep = sleep
+
+def test_retries_until_success():
+    sleeps = []
+    client, response = post_with(
+        [make_response(429, retry_after="3"), requests.ConnectionError("refused"), make_response(503),
+         make_response(200)],
+        sleeps
+    )
+    assert response.status_code == 200 and response.json() == {"ok": True}
+    assert client.session.calls == 4
+    # Retry-After is honored; the other delays are jittered below base * 2 ** attempt
+    assert sleeps[0] >= 3
+    assert 0 <= sleeps[1] <= 1 and 0 <= sleeps[2] <= 2
+
+    # Retry-After never exceeds backoff_max
+    sleeps = []
+    post_with([make_response(429, retry_after="600"), make_response(200)], sleeps, backoff_max=5)
+    assert sleeps == [5]
+
+def test_gives_up_after_last_retry():
+    sleeps = []
+    try:
+        post_with([make_response(500)] * 3, sleeps, max_retries=2)
+        assert False, "error response returned"
+    except requests.HTTPError as e:
+        assert e.response.status_code == 500
+    assert len(sleeps) == 2
+
+    try:
+        post_with([requests.Timeout("read timed out")] * 2, [], max_retries=1)
+        assert False, "timeout not raised"
+    except requests.Timeout:
+        pass
+
+    # A negative setting still sends the request once
+    client, response = post_with([make_response(200)], [], max_retries=-1)
+    assert client.max_retries == 0 and response.status_code == 200
+    try:
+        post_with([make_response(502)], [], max_retries=-1)
+        assert False, "error response returned"
+    except requests.HTTPError:
+        pass
+
+class FakeStreamResponse:
+    def __init__(self, lines):
+        self.lines = lines
+
+    def iter_lines(self, decode_unicode=False):
+        return iter(self.lines)
+
+def sse(content=None, **chunk):
+    chunk.setdefault('choices', [{'delta': {'content': content}}])
+    return "data: " + json.dumps(chunk)
+
+def test_stop_marker_split_across_chunks():
+    budget = StreamBudget(max_tokens=100, max_seconds=60, stop_markers=["\n\n--\n"])
+    # The marker arrives in three pieces; the stream stops on the chunk completing it
+    stopped = [budget.feed(delta) for delta in ["Dear Anna,", " thanks.\n", "\n-", "-\nSent from"]]
+    assert stopped == [False, False, False, True]
+    assert budget.text == "Dear Anna, thanks."
+    assert budget.stats()['stop_reason'] == 'stop_marker'
+    assert budget.stats()['tokens'] == 4
+
+def test_stops_at_token_and_time_limits():
+    budget = StreamBudget(max_tokens=3, max_seconds=60)
+    assert [budget.feed("a") for _ in range(3)] == [False, False, True]
+    assert budget.text == "aaa" and budget.stop_reason == 'max_tokens'
+
+    budget = StreamBudget(max_tokens=100, max_seconds=10)
+    assert not budget.feed("Hello")
+    budget.started -= 11
+    assert budget.feed(" world")
+    assert budget.text == "Hello world" and budget.stop_reason == 'max_seconds'
+    assert budget.stats()['time_to_first_token'] is not None
+
+    budget = StreamBudget(max_tokens=100, max_seconds=60, stop_markers=["STOP"])
+    for delta in ["All", " done"]:
+        assert not budget.feed(delta)
+    assert budget.text == "All done" and budget.stop_reason == 'complete'
+
+def test_sse_content_until_done():
+    response = FakeStreamResponse([
+        ": keep-alive",
+        "",
+        sse("Hello"),
+        "data: {not json",
+        sse(choices=[]),
+        sse(None),
+        "event: ping",
+        sse(" there"),
+        "data: [DONE]",
+        sse("after done")
+    ])
+    assert list(iter_sse_content(response)) == ["Hello", " there"]
+
+if __name__ == "__main__":
+    test_retries_until_success()
+    test_gives_up_after_last_retry()
+    test_stop_marker_split_across_chunks()
+    test_stops_at_token_and_time_limits()
+    test_sse_content_until_done()
+    logging.info("LLM client tests completed")
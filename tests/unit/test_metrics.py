@@ -0,0 +1,116 @@
+"""
+Test script for the metrics registry and its HTTP endpoint.
+"""
+
+import logging
+import sys
+import os
+import urllib.request
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.insert(0, project_root)
+
+from src.core.metrics import MetricsRegistry, MetricsServer, llm_rate_limit_collector, pipeline_collector
+from src.core.rate_limit import LLMRateLimiter, TokenBucket
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+def test_counter_gauge_histogram_render():
+    registry = MetricsRegistry()
+    sent = registry.counter("sent_total", "Sent emails", ["mailbox"])
+    depth = registry.gauge("depth", "Queue depth")
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+
+    sent.inc(mailbox="a@example.com")
+    sent.inc(2, mailbox="a@example.com")
+    depth.set(4)
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    text = registry.render()
+    assert "# TYPE sent_total counter" in text
+    assert 'sent_total{mailbox="a@example.com"} 3' in text
+    assert "depth 4" in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "latency_seconds_sum 5.55" in text
+    assert "latency_seconds_count 3" in text
+
+def test_labels_are_checked_and_escaped():
+    registry = MetricsRegistry()
+    errors = registry.counter("errors_total", "Errors", ["reason"])
+    try:
+        errors.inc(stage="send")
+        assert False, "wrong label name accepted"
+    except ValueError:
+        pass
+    try:
+        errors.inc(-1, reason="x")
+        assert False, "counter decreased"
+    except ValueError:
+        pass
+
+    errors.inc(reason='said "no"\n')
+    assert 'errors_total{reason="said \\"no\\"\\n"} 1' in registry.render()
+    # Registering again returns the same metric
+    assert registry.counter("errors_total", "Errors", ["reason"]) is errors
+
+def test_collectors_of_several_mailboxes_are_merged():
+    registry = MetricsRegistry()
+
+    class Limited:
+        def __init__(self):
+            self.bucket = TokenBucket(60)
+
+        def rate_limit_stats(self):
+            return self.bucket.snapshot()
+
+    for mailbox in ("a@example.com", "b@example.com"):
+        registry.add_collector(mailbox, pipeline_collector(mailbox, handler=Limited()))
+    registry.add_collector("broken", lambda: 1 / 0)
+
+    text = registry.render()
+    # One family header, one sample per mailbox; the failing collector is skipped
+    assert text.count("# TYPE email_rate_limit_available gauge") == 1
+    assert 'email_rate_limit_available{mailbox="a@example.com",limiter="rate limit"} 60' in text
+    assert 'email_rate_limit_available{mailbox="b@example.com",limiter="rate limit"} 60' in text
+
+    registry.remove_collector("b@example.com")
+    assert "b@example.com" not in registry.render()
+
+def test_shared_limiter_reported_once():
+    registry = MetricsRegistry()
+    limiter = LLMRateLimiter(requests_per_minute=60)
+    # Every mailbox using the backend registers it; the key makes it one collector
+    for _ in range(2):
+        registry.add_collector("llm_rate_limit:http://llm", llm_rate_limit_collector(limiter.snapshot, "http://llm"))
+    registry.add_collector("unlimited", llm_rate_limit_collector(lambda: None, "openai"))
+
+    text = registry.render()
+    assert text.count('email_rate_limit_per_minute{') == 1
+    assert 'email_rate_limit_per_minute{backend="http://llm",limiter="LLM requests"} 60' in text
+
+def test_server_exposes_metrics():
+    registry = MetricsRegistry()
+    registry.counter("scrapes_total", "Test counter").inc()
+    server = MetricsServer(registry, port=0)
+    server.start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics", timeout=5) as response:
+            assert response.headers['Content-Type'].startswith("text/plain; version=0.0.4")
+            assert "scrapes_total 1" in response.read().decode('utf-8')
+    finally:
+        server.stop()
+
+if __name__ == "__main__":
+    test_counter_gauge_histogram_render()
+    test_labels_are_checked_and_escaped()
+    test_collectors_of_several_mailboxes_are_merged()
+    test_shared_limiter_reported_once()
+    test_server_exposes_metrics()
+    logging.info("Metrics tests completed")
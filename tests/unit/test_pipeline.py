@@ -0,0 +1,125 @@
+"""
+Test script for the staged email pipeline shared by several mailboxes.
+"""
+
+import base64
+import logging
+import sys
+import os
+import tempfile
+import threading
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.insert(0, project_root)
+
+from src.core.pipeline import EmailPipeline, PipelineWorkers, RoundRobinPipeline
+from src.core.work_queue import WorkQueue, RECEIVED, SENT
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+class ParserConfig:
+    email_address = "me@example.com"
+    strip_quoted_text = True
+    max_body_bytes = 256 * 1024
+
+    def intent_priority(self, intent):
+        return 0 if intent == 'urgent' else 5
+
+class EchoProcessor:
+    config = ParserConfig()
+
+    def primary_intent(self, email_data):
+        return 'urgent' if 'urgent' in email_data['body'] else 'general'
+
+    def generate_response(self, email_data, intent=None):
+        # The intent the email was queued with is passed on, never classified again
+        assert intent == self.primary_intent(email_data)
+        return f"Reply to {email_data['subject']}: {email_data['body']}"
+
+class RecordingHandler:
+    def __init__(self, name, sent):
+        self.name = name
+        self.sent = sent
+        self.lock = threading.Lock()
+
+    def send_response(self, to_address, subject, body):
+        with self.lock:
+            self.sent.append((self.name, subject, body))
+
+def make_email(mailbox, i):
+    return {'message_id': f'<m{i}@example.com>', 'from': 'anna@example.com',
+            'subject': f'{mailbox} {i}', 'body': 'Hi'}
+
+def test_round_robin_between_mailboxes():
+    with tempfile.TemporaryDirectory() as tmp:
+        sent = []
+        pipelines = {}
+        for name in ('busy', 'quiet'):
+            queue = WorkQueue(os.path.join(tmp, f"{name}.db"))
+            pipelines[name] = EmailPipeline(EchoProcessor(), RecordingHandler(name, sent), queue)
+
+        # Same Message-IDs in both mailboxes: each mailbox answers its own copy
+        for i in range(20):
+            pipelines['busy'].submit(make_email('busy', i), intent='general')
+        for i in range(3):
+            pipelines['quiet'].submit(make_email('quiet', i), intent='general')
+
+        shared = RoundRobinPipeline(list(pipelines.values()), generation_workers=1, send_workers=1,
+                                    poll_interval=0.05)
+        shared.start()
+        shared.join()
+        shared.stop()
+
+        assert len(sent) == 23
+        assert all(body.startswith(f"Reply to {subject[len('Re: '):]}:") for _, subject, body in sent)
+        assert all(subject.startswith(f"Re: {name}") for name, subject, _ in sent)
+        # The quiet mailbox is not stuck behind the busy one's backlog
+        last_quiet = max(i for i, (name, _, _) in enumerate(sent) if name == 'quiet')
+        assert last_quiet < 10, f"quiet mailbox finished at position {last_quiet}"
+        assert pipelines['busy'].work_queue.counts()[SENT] == 20
+        assert pipelines['quiet'].work_queue.counts()[SENT] == 3
+        for pipeline in pipelines.values():
+            pipeline.work_queue.close()
+
+def test_received_emails_are_parsed_first():
+    with tempfile.TemporaryDirectory() as tmp:
+        sent = []
+        queue = WorkQueue(os.path.join(tmp, "work_queue.db"))
+        pipeline = EmailPipeline(EchoProcessor(), RecordingHandler('inbox', sent), queue, poll_interval=0.05)
+        for i, text in enumerate(['Hello', 'This is urgent', 'Not parseable']):
+            raw = (f"From: anna@example.com\r\nSubject: Raw {i}\r\nMessage-ID: <r{i}@example.com>\r\n\r\n"
+                   f"{text}\r\n").encode()
+            email_data = {'message_id': f'<r{i}@example.com>', 'from': 'anna@example.com',
+                          'subject': f'Raw {i}', 'body': '', 'uid': i,
+                          'raw': base64.b64encode(raw).decode('ascii')}
+            if text == 'Not parseable':
+                email_data['raw'] = 'abc'
+            assert pipeline.submit(email_data, state=RECEIVED)
+
+        pipeline.start()
+        while len(sent) < 2:
+            pipeline._stopping.wait(0.05)
+        pipeline.stop()
+
+        assert sorted(body for _, _, body in sent) == ["Reply to Raw 0: Hello", "Reply to Raw 1: This is urgent"]
+        rows = dict(queue._conn.execute("SELECT intent, priority FROM jobs WHERE state = ?", (SENT,)).fetchall())
+        assert rows == {'general': 5, 'urgent': 0}
+        # A message that cannot be decoded waits for a retry of the parse stage
+        assert queue.counts()[RECEIVED] == 1
+        queue.close()
+
+def test_workers_need_a_claim_strategy():
+    try:
+        PipelineWorkers()
+        assert False, "abstract workers instantiated"
+    except TypeError:
+        pass
+
+if __name__ == "__main__":
+    test_round_robin_between_mailboxes()
+    test_received_emails_are_parsed_first()
+    test_workers_need_a_claim_strategy()
+    logging.info("Pipeline tests completed")
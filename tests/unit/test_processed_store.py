@@ -0,0 +1,55 @@
+"""
+Test script for the persistent processed message store.
+"""
+
+import logging
+import sys
+import os
+import tempfile
+import time
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.insert(0, project_root)
+
+from src.core.processed_store import ProcessedMessageStore
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+def test_dedupe_survives_restart():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "processed.db")
+        answered = {'message_id': '<a1@example.com>', 'uid': 7, 'uidvalidity': 1, 'mailbox': 'me/INBOX'}
+        # Without a Message-ID the UID identifies the email
+        no_id = {'message_id': '', 'uid': 8, 'uidvalidity': 1, 'mailbox': 'me/INBOX'}
+
+        store = ProcessedMessageStore(path, cache_size=1)
+        assert not store.is_processed(answered)
+        store.mark_processed(answered)
+        store.mark_processed(no_id)
+        # The front cache holds one key; the other is found in the database
+        assert store.is_processed(answered) and store.is_processed(no_id)
+        store.close()
+
+        restarted = ProcessedMessageStore(path)
+        assert restarted.is_processed({'message_id': '<a1@example.com>'})
+        assert restarted.is_processed(dict(no_id))
+        assert not restarted.is_processed({'message_id': '', 'uid': 8, 'uidvalidity': 2, 'mailbox': 'me/INBOX'})
+        assert not restarted.is_processed({'message_id': ''})
+        restarted.close()
+
+def test_prune_old_records():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ProcessedMessageStore(os.path.join(tmp, "processed.db"), retention_seconds=0.05)
+        store.mark_processed({'message_id': '<old@example.com>'})
+        time.sleep(0.1)
+        store.prune()
+        assert not store.is_processed({'message_id': '<old@example.com>'})
+        store.close()
+
+if __name__ == "__main__":
+    test_dedupe_survives_restart()
+    test_prune_old_records()
+    logging.info("Processed message store tests completed")
@@ -0,0 +1,94 @@
+"""
+Test script for the token-bucket rate limiters.
+"""
+
+import asyncio
+import logging
+import sys
+import os
+import threading
+import time
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.insert(0, project_root)
+
+from src.core.rate_limit import TokenBucket, LLMRateLimiter
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+def test_burst_then_steady_rate():
+    # 10 per second, with room for a burst of 5
+    bucket = TokenBucket(600, capacity=5)
+    start = time.monotonic()
+    for _ in range(5):
+        assert bucket.acquire() == 0
+    for _ in range(5):
+        bucket.acquire()
+    elapsed = time.monotonic() - start
+    assert 0.45 <= elapsed < 0.8, elapsed
+
+    stats = bucket.snapshot()
+    assert stats['acquired_total'] == 10 and stats['throttled_total'] == 5
+
+def test_concurrent_callers_are_queued_not_rejected():
+    bucket = TokenBucket(1200, capacity=1)
+    finished = []
+
+    def call(i):
+        bucket.acquire()
+        finished.append(time.monotonic())
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # One token every 50 ms: the 8th caller runs about 350 ms after the first
+    assert len(finished) == 8
+    assert 0.3 <= max(finished) - start < 0.6
+
+def test_oversized_request_waits_instead_of_failing():
+    bucket = TokenBucket(6000, capacity=10)
+    assert abs(bucket.reserve(30) - 0.2) < 0.01
+
+def test_llm_limits_requests_and_tokens():
+    assert LLMRateLimiter.from_settings({}) is None
+
+    limiter = LLMRateLimiter.from_settings({"requests_per_minute": 6000, "tokens_per_minute": 60000})
+    # A full minute of tokens may be used at once; after that 1000 tokens/s are the binding limit
+    assert limiter.acquire(60000) == 0
+    start = time.monotonic()
+    asyncio.run(limiter.acquire_async(500))
+    assert 0.4 <= time.monotonic() - start < 0.7
+
+    stats = limiter.snapshot()
+    assert stats["LLM requests"]['acquired_total'] == 2
+    assert stats["LLM tokens"]['acquired_total'] == 60500
+
+def test_burst_of_one_keeps_steady_pace():
+    # 20 per second without a burst: no more than the limit plus one in any window
+    bucket = TokenBucket(1200, capacity=1)
+    start = time.monotonic()
+    for _ in range(5):
+        bucket.acquire()
+    assert 0.19 <= time.monotonic() - start < 0.4
+
+def test_backlog_reports_the_next_wait():
+    limiter = LLMRateLimiter(requests_per_minute=60)
+    assert limiter.backlog() == 0
+    limiter.requests.reserve(61)
+    assert 0.9 < limiter.backlog() <= 1.0
+    assert LLMRateLimiter(tokens_per_minute=6000).backlog() == 0
+
+if __name__ == "__main__":
+    test_burst_then_steady_rate()
+    test_concurrent_callers_are_queued_not_rejected()
+    test_oversized_request_waits_instead_of_failing()
+    test_llm_limits_requests_and_tokens()
+    test_burst_of_one_keeps_steady_pace()
+    test_backlog_reports_the_next_wait()
+    logging.info("Rate limit tests completed")
@@ -0,0 +1,56 @@
+"""
+Test script for the persistent response cache.
+"""
+
+import logging
+import sys
+import os
+import tempfile
+import time
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.insert(0, project_root)
+
+from src.ai.response_cache import ResponseCache
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+def test_normalized_emails_share_a_key():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResponseCache(os.path.join(tmp, "cache.db"))
+        original = {"from": "Anna <anna@example.com>", "subject": "Termin", "body": "Can I book an appointment?"}
+        resent = {"from": "anna@example.com", "subject": "AW: Re:  termin", "body": "> can I book   an appointment?\n"}
+
+        key = cache.make_key(original, "appointment", "v1")
+        assert key == cache.make_key(resent, "appointment", "v1")
+        # Intent, prompt version and (by default) sender are part of the key
+        assert key != cache.make_key(original, "costs", "v1")
+        assert key != cache.make_key(original, "appointment", "v2")
+        assert key != cache.make_key({**original, "from": "bob@example.com"}, "appointment", "v1")
+
+        assert cache.get(key) is None
+        cache.put(key, "Dear Anna, ...")
+        assert cache.get(key) == "Dear Anna, ..."
+        assert cache.stats()["hit_rate"] == 0.5
+        cache.close()
+
+def test_ttl_and_size_eviction():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResponseCache(os.path.join(tmp, "cache.db"), ttl_seconds=0.05, max_entries=2)
+        for key in ("a", "b", "c"):
+            cache.put(key, key * 10)
+        # Only the two most recently used entries are kept
+        assert cache.get("a") is None
+        assert cache.get("c") == "cccccccccc"
+
+        time.sleep(0.1)
+        assert cache.get("c") is None
+        cache.close()
+
+if __name__ == "__main__":
+    test_normalized_emails_share_a_key()
+    test_ttl_and_size_eviction()
+    logging.info("Response cache tests completed successfully!")
@@ -0,0 +1,57 @@
+"""
+Test script for the adaptive polling scheduler.
+"""
+
+import logging
+import sys
+import os
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.insert(0, project_root)
+
+from src.core.scheduler import AdaptivePollScheduler
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+def test_interval_follows_mail_arrival():
+    scheduler = AdaptivePollScheduler(initial_interval=60, min_interval=15, max_interval=300,
+                                      idle_growth=2, jitter=0)
+
+    assert scheduler.record_check(3) == 30
+    assert scheduler.record_check(1) == 15
+    # Never below the minimum
+    assert scheduler.record_check(5) == 15
+    assert scheduler.reason == "5 new emails"
+
+    delays = [scheduler.record_check(0) for _ in range(6)]
+    assert delays == [30, 60, 120, 240, 300, 300]
+    assert scheduler.reason == "mailbox idle, at maximum interval"
+
+def test_jitter_stays_within_bounds():
+    scheduler = AdaptivePollScheduler(initial_interval=100, min_interval=100, max_interval=100, jitter=0.1)
+    for _ in range(100):
+        assert 90 <= scheduler.record_check(0) <= 110
+
+def test_error_backoff_and_recovery():
+    scheduler = AdaptivePollScheduler(initial_interval=60, min_interval=15, max_interval=300, jitter=0,
+                                      error_backoff_base=5, error_backoff_max=40)
+    delays = [scheduler.record_error(ConnectionError("refused")) for _ in range(6)]
+    caps = [5, 10, 20, 40, 40, 40]
+    # Jittered between half and the full backoff, so clients do not retry in lockstep
+    assert all(cap / 2 <= delay <= cap for delay, cap in zip(delays, caps))
+    snapshot = scheduler.snapshot()
+    assert snapshot['consecutive_errors'] == 6
+    assert snapshot['reason'] == "error 6 in a row: refused"
+
+    # The polling interval from before the errors is resumed
+    assert scheduler.record_check(0) == 90
+    assert scheduler.snapshot()['consecutive_errors'] == 0
+
+if __name__ == "__main__":
+    test_interval_follows_mail_arrival()
+    test_jitter_stays_within_bounds()
+    test_error_backoff_and_recovery()
+    logging.info("Scheduler tests completed")
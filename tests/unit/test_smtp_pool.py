@@ -0,0 +1,146 @@
+"""
+Test script for the SMTP connection pool and its keep-alive, using a fake SMTP class.
+"""
+
+import logging
+import smtplib
+import sys
+import os
+import time
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.insert(0, project_root)
+
+from src.core.smtp_pool import SMTPConnectionPool
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+class PoolConfig:
+    smtp_use_ssl = False
+    smtp_server = "smtp.example.com"
+    smtp_port = 587
+    smtp_timeout = 5
+    email_address = "me@example.com"
+    email_password = "secret"
+
+class FakeSMTP:
+    """Records the commands of one session; a dropped session fails every command."""
+
+    opened = []
+
+    def __init__(self, host, port, timeout=None):
+        self.noops = 0
+        self.sent = 0
+        self.dropped = False
+        self.closed = False
+        FakeSMTP.opened.append(self)
+
+    def _check(self):
+        if self.dropped:
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+
+    def starttls(self):
+        self._check()
+
+    def login(self, user, password):
+        self._check()
+
+    def noop(self):
+        self._check()
+        self.noops += 1
+        return 250, b'OK'
+
+    def send_message(self, msg):
+        self._check()
+        self.sent += 1
+
+    def quit(self):
+        self.closed = True
+        self._check()
+
+    def close(self):
+        self.closed = True
+
+def make_pool(**kwargs) -> SMTPConnectionPool:
+    FakeSMTP.opened = []
+    # The pool opens its sessions through smtplib.SMTP; each test restores it
+    smtplib.SMTP = FakeSMTP
+    return SMTPConnectionPool(PoolConfig(), **kwargs)
+
+def wait_until(condition, timeout: float = 5) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+def test_sessions_are_reused_and_discarded_on_error():
+    real_smtp = smtplib.SMTP
+    try:
+        pool = make_pool(keepalive_interval=60)
+        for _ in range(3):
+            with pool.connection() as smtp:
+                smtp.send_message("reply")
+        assert len(FakeSMTP.opened) == 1 and FakeSMTP.opened[0].sent == 3
+
+        # A session that failed mid-use is closed, the next reply opens a new one
+        try:
+            with pool.connection() as smtp:
+                raise smtplib.SMTPServerDisconnected("gone")
+        except smtplib.SMTPServerDisconnected:
+            pass
+        assert FakeSMTP.opened[0].closed
+        with pool.connection() as smtp:
+            assert smtp is FakeSMTP.opened[1]
+        pool.close()
+        assert FakeSMTP.opened[1].closed
+    finally:
+        smtplib.SMTP = real_smtp
+
+def test_keepalive_noops_idle_sessions():
+    real_smtp = smtplib.SMTP
+    try:
+        pool = make_pool(keepalive_interval=0.05, max_idle=60)
+        with pool.connection() as smtp:
+            smtp.send_message("reply")
+        session = FakeSMTP.opened[0]
+
+        # Idle sessions are kept open in the background, not only checked at checkout
+        assert wait_until(lambda: session.noops >= 3)
+        with pool.connection() as smtp:
+            assert smtp is session
+
+        # A session the server dropped is replaced before the next reply needs it
+        session.dropped = True
+        assert wait_until(lambda: session.closed)
+        with pool.connection() as smtp:
+            assert smtp is not session
+        assert len(FakeSMTP.opened) == 2
+
+        pool.close()
+        assert pool._keepalive_thread is None and FakeSMTP.opened[1].closed
+    finally:
+        smtplib.SMTP = real_smtp
+
+def test_sessions_idle_past_max_idle_are_closed():
+    real_smtp = smtplib.SMTP
+    try:
+        pool = make_pool(keepalive_interval=0.05, max_idle=0.2)
+        with pool.connection() as smtp:
+            smtp.send_message("reply")
+        session = FakeSMTP.opened[0]
+        assert wait_until(lambda: session.closed)
+        assert pool._idle == []
+        pool.close()
+    finally:
+        smtplib.SMTP = real_smtp
+
+if __name__ == "__main__":
+    test_sessions_are_reused_and_discarded_on_error()
+    test_keepalive_noops_idle_sessions()
+    test_sessions_idle_past_max_idle_are_closed()
+    logging.info("SMTP pool tests completed")
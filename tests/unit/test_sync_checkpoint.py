@@ -0,0 +1,52 @@
+"""
+Test script for the persisted IMAP sync checkpoint.
+"""
+
+import logging
+import sys
+import os
+import tempfile
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.insert(0, project_root)
+
+from src.core.sync_checkpoint import SyncCheckpoint
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+def test_checkpoint_survives_restart():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sync_checkpoint.json")
+
+        checkpoint = SyncCheckpoint(path, "me@example.com/INBOX")
+        assert not checkpoint.is_valid_for(1)
+        checkpoint.update(1, 42)
+        checkpoint.save()
+
+        # A new instance (e.g. after a restart) resumes from the saved UID
+        restored = SyncCheckpoint(path, "me@example.com/INBOX")
+        assert restored.is_valid_for(1)
+        assert restored.last_uid == 42
+
+        # A different UIDVALIDITY invalidates the stored UIDs
+        assert not restored.is_valid_for(2)
+
+        # Other mailboxes in the same file are independent
+        assert SyncCheckpoint(path, "other@example.com/INBOX").last_uid is None
+
+def test_checkpoint_never_moves_backwards():
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint = SyncCheckpoint(os.path.join(tmp, "cp.json"), "me@example.com/INBOX")
+        checkpoint.update(1, 50)
+        checkpoint.update(1, 10)
+        assert checkpoint.last_uid == 50
+        checkpoint.update(7, 3)
+        assert checkpoint.last_uid == 3
+
+if __name__ == "__main__":
+    test_checkpoint_survives_restart()
+    test_checkpoint_never_moves_backwards()
+    logging.info("Sync checkpoint tests completed successfully!")
@@ -0,0 +1,66 @@
+"""
+Test script for the sender whitelist.
+"""
+
+import logging
+import sys
+import os
+import json
+import tempfile
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.insert(0, project_root)
+
+from src.core.whitelist import SenderWhitelist, normalize_address
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+def write_whitelist(path, senders):
+    with open(path, 'w') as f:
+        json.dump({"allowed_senders": senders}, f)
+
+def test_normalize_address():
+    assert normalize_address('"Doe, Anna" <Anna.Doe@Example.COM>') == "anna.doe@example.com"
+    assert normalize_address("anna@example.com") == "anna@example.com"
+    # The address in angle brackets counts, not one in the display name
+    assert normalize_address('"anna@example.com" <mallory@evil.test>') == "mallory@evil.test"
+    assert normalize_address("undisclosed-recipients") is None
+
+def test_matching():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "whitelist_config.json")
+        write_whitelist(path, ["Anna@Example.com", "*@clinic-partner.de", "*@*.uni-klinik.de"])
+        whitelist = SenderWhitelist(path)
+
+        assert whitelist.is_allowed("ANNA <anna@example.COM>")
+        assert not whitelist.is_allowed("bob@example.com")
+        assert whitelist.is_allowed("Dr. Bob <bob@clinic-partner.de>")
+        assert not whitelist.is_allowed("bob@mail.clinic-partner.de")
+        assert whitelist.is_allowed("eva@uni-klinik.de")
+        assert whitelist.is_allowed("eva@derma.charite.uni-klinik.de")
+        assert not whitelist.is_allowed("eva@fake-uni-klinik.de")
+
+def test_reload_on_change():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "whitelist_config.json")
+        write_whitelist(path, ["anna@example.com"])
+        whitelist = SenderWhitelist(path, reload_interval=0)
+        assert not whitelist.is_allowed("bob@example.com")
+
+        write_whitelist(path, ["anna@example.com", "bob@example.com"])
+        os.utime(path, ns=(0, 10 ** 9))
+        assert whitelist.is_allowed("bob@example.com")
+
+        # A broken file keeps the previous whitelist
+        with open(path, 'w') as f:
+            f.write("{")
+        assert whitelist.is_allowed("bob@example.com")
+
+if __name__ == "__main__":
+    test_normalize_address()
+    test_matching()
+    test_reload_on_change()
+    logging.info("Whitelist tests completed")
@@ -0,0 +1,197 @@
+"""
+Test script for the durable email work queue.
+"""
+
+import logging
+import sys
+import os
+import sqlite3
+import tempfile
+import time
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.insert(0, project_root)
+
+from src.core.metrics import END_TO_END_SECONDS
+from src.core.work_queue import WorkQueue, FETCHED, GENERATED, SENT, FAILED
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+def make_email(i):
+    return {'message_id': f'<m{i}@example.com>', 'from': 'anna@example.com', 'subject': f'Test {i}', 'body': 'Hi'}
+
+def test_stages_and_dedupe():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "work_queue.db")
+        queue = WorkQueue(path)
+        assert queue.enqueue(make_email(1))
+        assert not queue.enqueue(make_email(1))
+
+        job = queue.claim((FETCHED,))
+        assert job['email']['subject'] == 'Test 1' and job['attempts'] == 1
+        # Leased jobs are invisible to other workers
+        assert queue.claim((FETCHED,)) is None
+
+        assert queue.save_response(job, "Hello Anna")
+        queue.close()
+
+        # The generated reply survives a restart
+        queue = WorkQueue(path)
+        job = queue.claim((GENERATED,))
+        assert job['response'] == "Hello Anna"
+        assert queue.mark_sent(job)
+        assert queue.counts()[SENT] == 1 and queue.pending() == 0
+        queue.close()
+
+def test_visibility_timeout_and_retries():
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = WorkQueue(os.path.join(tmp, "work_queue.db"), visibility_timeout=0.1,
+                          max_attempts=3, backoff_base=0.1, backoff_max=0.1)
+        queue.enqueue(make_email(1))
+
+        # A worker that crashed never reports back; the job reappears after the timeout
+        crashed = queue.claim()
+        time.sleep(0.15)
+        job = queue.claim()
+        assert job['id'] == crashed['id'] and job['attempts'] == 2
+        # The stale holder can no longer complete it
+        assert not queue.save_response(crashed, "late")
+
+        # A failed attempt is retried after the backoff
+        queue.fail(job, "LLM unavailable")
+        assert queue.claim() is None
+        time.sleep(0.15)
+        job = queue.claim()
+        assert job['attempts'] == 3
+
+        queue.fail(job, "LLM unavailable")
+        assert queue.counts()[FAILED] == 1
+        assert queue.failed_jobs()[0]['last_error'] == "LLM unavailable"
+        queue.close()
+
+def test_claim_skips_exhausted_jobs():
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = WorkQueue(os.path.join(tmp, "work_queue.db"), visibility_timeout=0.1, max_attempts=1)
+        for i in range(3):
+            queue.enqueue(make_email(i))
+        crashed = [queue.claim(), queue.claim()]
+        time.sleep(0.15)
+
+        # Both abandoned jobs are failed and the next eligible one is leased in the same call
+        job = queue.claim()
+        assert job is not None and job['email']['subject'] == 'Test 2'
+        assert queue.counts()[FAILED] == 2
+        assert {j['id'] for j in queue.failed_jobs()} == {j['id'] for j in crashed}
+        queue.close()
+
+def test_record_failed():
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = WorkQueue(os.path.join(tmp, "work_queue.db"))
+        assert queue.record_failed(make_email(1), "message could not be parsed")
+        assert not queue.record_failed(make_email(1), "message could not be parsed")
+        assert queue.claim() is None
+        assert queue.failed_jobs()[0]['last_error'] == "message could not be parsed"
+        assert queue.pending() == 0
+        queue.close()
+
+def test_priority_with_aging():
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = WorkQueue(os.path.join(tmp, "work_queue.db"), priority_aging=0.2)
+        for i in range(5):
+            queue.enqueue(make_email(i), priority=4, intent='general')
+        queue.enqueue(make_email(10), priority=0, intent='emergency')
+        queue.enqueue(make_email(11), priority=1, intent='appointment')
+
+        # The emergency jumps the queue, then the appointment, then routine mail in arrival order
+        order = [queue.claim()['email']['subject'] for _ in range(3)]
+        assert order == ['Test 10', 'Test 11', 'Test 0']
+
+        # Waiting longer than priority * priority_aging beats any newly fetched email
+        time.sleep(0.85)
+        queue.enqueue(make_email(12), priority=0, intent='emergency')
+        job = queue.claim()
+        assert job['email']['subject'] == 'Test 1' and job['intent'] == 'general' and job['priority'] == 4
+        queue.close()
+
+def test_latency_by_intent():
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = WorkQueue(os.path.join(tmp, "work_queue.db"))
+        queue.enqueue(make_email(1), priority=0, intent='emergency')
+        queue.enqueue(make_email(2), priority=4, intent='general')
+        queue.enqueue(make_email(3))
+        for _ in range(3):
+            job = queue.claim()
+            queue.save_response(job, "Reply", release=False)
+            queue.mark_sent(job)
+
+        latency = queue.latency_by_intent()
+        assert set(latency) == {'emergency', 'general', 'unclassified'}
+        assert latency['emergency']['count'] == 1
+        assert 0 <= latency['emergency']['p95'] <= latency['general']['max'] < 5
+
+        # Measured from arrival in the mailbox, and only over sent jobs
+        email_data = dict(make_email(4), received_at=time.time() - 120)
+        queue.enqueue(email_data, intent='emergency')
+        job = queue.claim()
+        queue.save_response(job, "Reply", release=False)
+        queue.mark_sent(job)
+        queue.enqueue(dict(make_email(5), received_at=time.time() - 600), intent='emergency')
+        queue.fail(queue.claim(), "LLM unavailable")
+        latency = queue.latency_by_intent()
+        assert latency['emergency']['count'] == 2
+        assert 120 <= latency['emergency']['max'] < 125
+        queue.close()
+
+def test_upgrade_queue_without_priorities():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "work_queue.db")
+        conn = sqlite3.connect(path)
+        conn.execute("""
+            CREATE TABLE jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, message_key TEXT UNIQUE, email TEXT NOT NULL,
+                response TEXT, state TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL, lease TEXT, lease_until REAL, last_error TEXT,
+                created_at REAL NOT NULL, updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("INSERT INTO jobs (message_key, email, state, available_at, created_at, updated_at) "
+                     "VALUES ('<old@example.com>', '{\"subject\": \"Old\"}', 'fetched', 0, 1, 1)")
+        conn.commit()
+        conn.close()
+
+        queue = WorkQueue(path)
+        queue.enqueue(make_email(1), priority=0)
+        # Jobs from before the upgrade keep their place
+        assert queue.claim()['email']['subject'] == 'Old'
+        assert queue.claim()['email']['subject'] == 'Test 1'
+        queue.close()
+        # Opening it again does not upgrade twice
+        WorkQueue(path).close()
+
+def test_end_to_end_latency_starts_at_arrival():
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = WorkQueue(os.path.join(tmp, "work_queue.db"))
+        # Arrived 100s before it was fetched, e.g. between two polls
+        queue.enqueue(dict(make_email(1), received_at=time.time() - 100), intent='e2e-test')
+        job = queue.claim()
+        queue.save_response(job, "Hello")
+        queue.mark_sent(queue.claim((GENERATED,)))
+        samples = {name: value for name, labels, value in END_TO_END_SECONDS.samples()
+                   if labels.get('intent') == 'e2e-test'}
+        assert samples['email_end_to_end_seconds_count'] == 1
+        assert 100 <= samples['email_end_to_end_seconds_sum'] < 110
+        queue.close()
+
+if __name__ == "__main__":
+    test_stages_and_dedupe()
+    test_visibility_timeout_and_retries()
+    test_claim_skips_exhausted_jobs()
+    test_record_failed()
+    test_priority_with_aging()
+    test_latency_by_intent()
+    test_upgrade_queue_without_priorities()
+    test_end_to_end_latency_starts_at_arrival()
+    logging.info("Work queue tests completed")
@@ -0,0 +1,120 @@
+"""
+Test script for the worker process pool: spawning, restarting dead workers,
+parsing queued emails in the workers and stopping.
+"""
+
+import base64
+import json
+import logging
+import shutil
+import sys
+import os
+import tempfile
+import time
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+sys.path.insert(0, project_root)
+
+from src.core.work_queue import WorkQueue, FETCHED, RECEIVED
+from src.core.worker_pool import WorkerPool, _open_worker
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+RAW_EMAIL = (b"From: anna@example.com\r\nTo: me@example.com\r\nSubject: Urgent help\r\n"
+             b"Message-ID: <m1@example.com>\r\n\r\nThe server is down, please help as soon as possible.\r\n")
+
+def make_config(tmp: str) -> str:
+    """Configuration of workers that can start but never reach an LLM or SMTP server."""
+    os.makedirs(os.path.join(tmp, "config"))
+    shutil.copy(os.path.join(project_root, "config", "business_config.json"),
+                os.path.join(tmp, "config", "business_config.json"))
+    with open(os.path.join(tmp, "config", "llm_config.json"), 'w') as f:
+        json.dump({"model_type": "local",
+                   "local_model": {"base_url": "http://127.0.0.1:9/v1", "model": "test"},
+                   "rate_limit": {"requests_per_minute": 60, "tokens_per_minute": 40000}}, f)
+    config_path = os.path.join(tmp, "email_config.json")
+    with open(config_path, 'w') as f:
+        json.dump({
+            "email_address": "me@example.com", "email_password": "secret",
+            "smtp_server": "127.0.0.1", "smtp_port": 9, "imap_server": "127.0.0.1", "imap_port": 9,
+            "openai_api_key": "unused", "metrics_port": 0, "smtp_messages_per_minute": 30,
+            "work_queue_path": os.path.join(tmp, "work_queue.db"),
+            "processed_store_path": os.path.join(tmp, "processed_messages.db")
+        }, f)
+    return config_path
+
+def wait_until(condition, timeout: float = 60) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+def test_spawn_restart_parse_and_stop():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        # Workers load config/llm_config.json and config/business_config.json relative to it
+        os.chdir(tmp)
+        pool = WorkerPool(make_config(tmp), workers=2, poll_interval=0.1)
+        try:
+            pool.start()
+            processes = list(pool._processes)
+            assert len(processes) == 2 and all(p.is_alive() for p in processes)
+
+            # A dead worker is replaced on the next start(), the live one is kept
+            processes[0].terminate()
+            processes[0].join()
+            pool.start()
+            assert pool._processes[0] is not processes[0] and pool._processes[0].is_alive()
+            assert pool._processes[1] is processes[1]
+
+            # Emails queued unparsed are parsed and classified by a worker
+            queue = WorkQueue(os.path.join(tmp, "work_queue.db"))
+            assert queue.enqueue({'message_id': '<m1@example.com>', 'from': 'anna@example.com',
+                                  'subject': 'Urgent help', 'body': '', 'uid': 1,
+                                  'raw': base64.b64encode(RAW_EMAIL).decode('ascii')}, state=RECEIVED)
+            assert wait_until(lambda: queue.counts()[RECEIVED] == 0)
+            row = queue._conn.execute("SELECT state, email, intent FROM jobs").fetchone()
+            email_data = json.loads(row[1])
+            # Generation fails against the unreachable LLM, so the job waits for a retry
+            assert row[0] == FETCHED and row[2]
+            assert 'raw' not in email_data and 'server is down' in email_data['body']
+            assert email_data['uid'] == 1
+            queue.close()
+        finally:
+            pool.stop(timeout=30)
+            os.chdir(cwd)
+        assert pool._processes == []
+        assert all(not p.is_alive() for p in processes)
+
+def test_workers_share_the_rate_limits():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            config, handler, work_queue, processed, processor = _open_worker(make_config(tmp), 4)
+            # Four workers together keep the SMTP and LLM limits of one process
+            assert handler.rate_limiter.rate * 60 == 7.5
+            limiter = processor._get_rate_limiter()
+            assert limiter.requests.rate * 60 == 15
+            assert limiter.tokens.rate * 60 == 10000
+            handler.close()
+            work_queue.close()
+            processed.close()
+
+            _, handler, work_queue, processed, processor = _open_worker(os.path.join(tmp, "email_config.json"), 1)
+            assert processor._get_rate_limiter().requests.rate * 60 == 60
+            handler.close()
+            work_queue.close()
+            processed.close()
+        finally:
+            os.chdir(cwd)
+
+if __name__ == "__main__":
+    test_spawn_restart_parse_and_stop()
+    test_workers_share_the_rate_limits()
+    logging.info("Worker pool tests completed")